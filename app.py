@@ -1,29 +1,96 @@
 import os.path
+import json
 from threading import Thread
 import queue
+import copy
+import heapq
+import bisect
+import math
+import threading
 import datetime
 import obd
 from obd import utils
 from gps3 import gps3
 import configparser
 import minio
-import platform
-import subprocess
+import struct
 import time
 import requests
 import logging
 import socketio
 from aiohttp import web
 import asyncio
+import concurrent.futures
+import numpy
+import random
+import hmac
+import pickle
+import tempfile
+import socket
+import sqlite3
+import trip_format
 
 config = configparser.ConfigParser()
 config.read('config.ini')
 DATETIME_FORMAT = "%Y%m%d%H%M%S%f"
+DATETIME_SECOND_FORMAT = "%Y%m%d%H%M%S"
 DEVICE_TIME_LABEL = 'DEVICE_TIME'
+GNSS_TIME_LABEL = 'GPS TIME'
+SAMPLE_TIME_LABEL = 'SAMPLE TIME (monotonic nanosecond)'
+ACQUISITION_TIME_LABEL_SUFFIX = ' ACQUISITION TIME (monotonic nanosecond)'
+TEXT_FILE_FORMAT = 'text'
+COLUMNAR_FILE_FORMAT = 'columnar'
+DELTA_FILE_FORMAT = 'delta'
+BINARY_FILE_FORMAT_LIST = [COLUMNAR_FILE_FORMAT, DELTA_FILE_FORMAT]
+FSYNC_POLICY_NEVER = 'never'
+FSYNC_POLICY_INTERVAL = 'interval'
+FSYNC_POLICY_ALWAYS = 'always'
+OVERLOAD_POLICY_BLOCK = 'block'
+OVERLOAD_POLICY_DROP_OLDEST = 'drop_oldest'
+OVERLOAD_POLICY_DOWNSAMPLE = 'downsample'
+OVERLOAD_POLICY_SPILL = 'spill'
+RECOVERY_READ_SIZE = 65536
+HIGH_RATE_CLASS = 0
+NORMAL_RATE_CLASS = 1
+SLOW_RATE_CLASS = 2
+ONCE_RATE_CLASS = 3
+CAN_PROTOCOL_ID_LIST = ['6', '7', '8', '9']
 S3_ROOT_DIRECTORY = 'car-logs'
+S3_UPLOAD_ORDER_OLDEST = 'oldest'
+S3_UPLOAD_ORDER_NEWEST = 'newest'
+S3_MINIMUM_PART_SIZE = 5 * 1024 * 1024
+UPLOAD_STATE_EXTENSION = '.upload'
+OPEN_SEGMENT_EXTENSION = '.open'
+TRIP_SUMMARY_EXTENSION = '.summary.json'
+TRIP_MANIFEST_EXTENSION = '.manifest.json'
+GNSS_TRACK_FILENAME_SUFFIX = '_gnss'
+SIMPLIFIED_TRACK_FILENAME_SUFFIX = '_track'
+GNSS_FIX_BUFFER_SIZE = 256
+GNSS_TIME_FORMAT_LIST = ['%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%SZ']
+EARTH_RADIUS = 6371008.8
+IDLE_SPEED_THRESHOLD = 1
 POST_TRIP_LOCATION = 'api/carloguploads/'
-SECONDS_BETWEEN_PING = 60
+POST_TRIP_BATCH_LOCATION = 'api/carloguploads/batch/'
+POST_TRIP_SUMMARY_LOCATION = 'api/carlogsummaries/'
+POST_TRIP_MANIFEST_LOCATION = 'api/carlogmanifests/'
+BATCH_LOCATION_DICT = {POST_TRIP_LOCATION: POST_TRIP_BATCH_LOCATION}
+BATCH_UNSUPPORTED_STATUS_CODE_LIST = [404, 405, 501]
+REGISTRATION_IDLE_WAIT = 60
+STATUS_EMIT_DELAY = 0.1
+COUNTER_METRIC_TYPE = 'counter'
+GAUGE_METRIC_TYPE = 'gauge'
+HISTOGRAM_METRIC_TYPE = 'histogram'
+LATENCY_BUCKET_LIST = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+UPLOAD_BUCKET_LIST = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600]
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
 MESSAGE_RETRY_INTERVAL = 50
+OBD_BACKEND_ADAPTER = 'adapter'
+GNSS_BACKEND_GPSD = 'gpsd'
+REPLAY_BACKEND = 'replay'
+CAPTURE_HEADER_TYPE = 'header'
+CAPTURE_OBD_TYPE = 'obd'
+CAPTURE_GNSS_TYPE = 'gnss'
+REPLAY_WAIT_STEP = 0.5
 RECORD_DIRECTORY_LOCATION = config.get('DEFAULT', 'RECORD_DIRECTORY_LOCATION', fallback='.')
 CAR_IDENTIFIER = config.get('DEFAULT', 'CAR_IDENTIFIER', fallback=None)
 if CAR_IDENTIFIER is None:
@@ -31,44 +98,412 @@ if CAR_IDENTIFIER is None:
     logging.info('SHUTDOWN PROGRAM')
     exit(0)
 OBD_INTERFACE = config.get('DEFAULT', 'OBD_INTERFACE', fallback=None)
+OBD_BACKEND = config.get('DEFAULT', 'OBD_BACKEND', fallback=OBD_BACKEND_ADAPTER)
+GNSS_BACKEND = config.get('DEFAULT', 'GNSS_BACKEND', fallback=GNSS_BACKEND_GPSD)
+CAPTURE_FILE_LOCATION = config.get('DEFAULT', 'CAPTURE_FILE_LOCATION', fallback=None)
+REPLAY_FILE_LOCATION = config.get('DEFAULT', 'REPLAY_FILE_LOCATION', fallback=None)
+REPLAY_SPEED = config.getfloat('DEFAULT', 'REPLAY_SPEED', fallback=1)
+REPLAY_LATENCY = config.getfloat('DEFAULT', 'REPLAY_LATENCY', fallback=None)
+REPLAY_DROPOUT_RATE = config.getfloat('DEFAULT', 'REPLAY_DROPOUT_RATE', fallback=0)
+REPLAY_SEED = config.getint('DEFAULT', 'REPLAY_SEED', fallback=0)
 FILE_RECORDING = config['DEFAULT'].getboolean('FILE_RECORDING', fallback=False)
 GPS_POSITION_MONITORING = config['DEFAULT'].getboolean('GPS_POSITION_MONITORING', fallback=False)
+GNSS_FIX_MAX_AGE = config.getfloat('DEFAULT', 'GNSS_FIX_MAX_AGE', fallback=5)
+GNSS_MAX_EXTRAPOLATION = config.getfloat('DEFAULT', 'GNSS_MAX_EXTRAPOLATION', fallback=1)
+GNSS_RECEIVER_LATENCY = config.getfloat('DEFAULT', 'GNSS_RECEIVER_LATENCY', fallback=0)
+GNSS_TRACK_RECORDING = config['DEFAULT'].getboolean('GNSS_TRACK_RECORDING', fallback=False)
+TRACK_SIMPLIFICATION = config['DEFAULT'].getboolean('TRACK_SIMPLIFICATION', fallback=False)
+TRACK_SIMPLIFICATION_TOLERANCE = config.getfloat('DEFAULT', 'TRACK_SIMPLIFICATION_TOLERANCE', fallback=5)
+TRACK_SIMPLIFICATION_MAX_WINDOW = config.getint('DEFAULT', 'TRACK_SIMPLIFICATION_MAX_WINDOW', fallback=1000)
 GEOPOSITION_SERVER_LOCATION = config['DEFAULT'].get('GEOPOSITION_SERVER_LOCATION', fallback=None)
 GEOPOSITION_SERVER_ACCESS_KEY = config['DEFAULT'].get('GEOPOSITION_SERVER_ACCESS_KEY', fallback=None)
 GEOPOSITION_SERVER_UPDATE_PERIOD = config['DEFAULT'].getfloat('GEOPOSITION_SERVER_ACCESS_KEY', fallback=None)
-MONITORING_FILE_EXTENSION = config.get('DEFAULT', 'MONITORING_FILE_EXTENSION', fallback='.tsv')
+MONITORING_FILE_FORMAT = config.get('DEFAULT', 'MONITORING_FILE_FORMAT', fallback=TEXT_FILE_FORMAT).lower()
+MONITORING_FILE_CHUNK_ROWS = config.getint('DEFAULT', 'MONITORING_FILE_CHUNK_ROWS',
+                                           fallback=trip_format.DEFAULT_CHUNK_ROWS)
+MONITORING_FILE_EXTENSION = config.get('DEFAULT', 'MONITORING_FILE_EXTENSION',
+                                       fallback='.eccm' if MONITORING_FILE_FORMAT in BINARY_FILE_FORMAT_LIST
+                                       else '.tsv')
+MONITORING_FILE_COMPRESSION = config.get('DEFAULT', 'MONITORING_FILE_COMPRESSION',
+                                         fallback=trip_format.NO_COMPRESSION).lower()
+if MONITORING_FILE_COMPRESSION == trip_format.ZSTD_COMPRESSION and trip_format.zstandard is None:
+    logging.warning('ZSTANDARD PACKAGE NOT INSTALLED, GZIP COMPRESSION USED')
+    MONITORING_FILE_COMPRESSION = trip_format.GZIP_COMPRESSION
+MONITORING_FILE_COMPRESSION_LEVEL = config.getint('DEFAULT', 'MONITORING_FILE_COMPRESSION_LEVEL', fallback=None)
+MONITORING_FILE_COMPRESSION_BLOCK_SIZE = config.getint('DEFAULT', 'MONITORING_FILE_COMPRESSION_BLOCK_SIZE',
+                                                       fallback=262144)
+MONITORING_FILE_COMPRESSION_EXTENSION = trip_format.COMPRESSION_EXTENSION_DICT.get(MONITORING_FILE_COMPRESSION, '')
+MONITORING_FILE_EXTENSION_TUPLE = (MONITORING_FILE_EXTENSION,) + tuple(
+    MONITORING_FILE_EXTENSION + extension for extension in trip_format.COMPRESSION_EXTENSION_DICT.values())
 MONITORING_FILE_SEPARATION_CHARACTER_FALLBACK = '\t' if MONITORING_FILE_EXTENSION == '.tsv' else ',' \
     if MONITORING_FILE_EXTENSION == '.csv' else '|'
 MONITORING_FILE_SEPARATION_CHARACTER = config.get('DEFAULT', 'MONITORING_FILE_SEPARATION_CHARACTER',
                                                   fallback=MONITORING_FILE_SEPARATION_CHARACTER_FALLBACK)
+MONITORING_FILE_WRITE_BUFFER_SIZE = config.getint('DEFAULT', 'MONITORING_FILE_WRITE_BUFFER_SIZE', fallback=65536)
+MONITORING_FILE_WRITE_BATCH_SIZE = config.getint('DEFAULT', 'MONITORING_FILE_WRITE_BATCH_SIZE', fallback=256)
+MONITORING_FILE_FSYNC_POLICY = config.get('DEFAULT', 'MONITORING_FILE_FSYNC_POLICY',
+                                          fallback=FSYNC_POLICY_INTERVAL).lower()
+MONITORING_FILE_FSYNC_INTERVAL = config.getfloat('DEFAULT', 'MONITORING_FILE_FSYNC_INTERVAL', fallback=30)
+RECORD_BUFFER_SIZE = max(2, config.getint('DEFAULT', 'RECORD_BUFFER_SIZE', fallback=4096))
+RECORD_OVERLOAD_POLICY = config.get('DEFAULT', 'RECORD_OVERLOAD_POLICY', fallback=OVERLOAD_POLICY_DROP_OLDEST).lower()
+RECORD_BLOCK_TIMEOUT = config.getfloat('DEFAULT', 'RECORD_BLOCK_TIMEOUT', fallback=5)
+RECORD_SPILL_DIRECTORY_LOCATION = config.get('DEFAULT', 'RECORD_SPILL_DIRECTORY_LOCATION', fallback=None)
+if RECORD_OVERLOAD_POLICY == OVERLOAD_POLICY_SPILL and (
+        RECORD_SPILL_DIRECTORY_LOCATION is None or
+        os.path.abspath(RECORD_SPILL_DIRECTORY_LOCATION) == os.path.abspath(RECORD_DIRECTORY_LOCATION)):
+    logging.warning('NO SEPARATE RECORD SPILL DIRECTORY, DROP_OLDEST POLICY USED')
+    RECORD_OVERLOAD_POLICY = OVERLOAD_POLICY_DROP_OLDEST
+STORAGE_BUDGET = config.getint('DEFAULT', 'STORAGE_BUDGET', fallback=0)
+STORAGE_HIGH_WATERMARK = config.getfloat('DEFAULT', 'STORAGE_HIGH_WATERMARK', fallback=0.9)
+STORAGE_DOWNSAMPLE_PERIOD_LIST = sorted(float(period) for period in config.get(
+    'DEFAULT', 'STORAGE_DOWNSAMPLE_PERIOD_LIST', fallback='1,10').split(',') if period.strip())
+STORAGE_CHECK_INTERVAL = config.getfloat('DEFAULT', 'STORAGE_CHECK_INTERVAL', fallback=60)
+STORAGE_COMPRESSION = MONITORING_FILE_COMPRESSION if MONITORING_FILE_COMPRESSION in \
+    trip_format.COMPRESSION_EXTENSION_DICT else trip_format.GZIP_COMPRESSION
+MONITORING_SEGMENT_MAX_SIZE = config.getint('DEFAULT', 'MONITORING_SEGMENT_MAX_SIZE', fallback=0)
+MONITORING_SEGMENT_MAX_DURATION = config.getfloat('DEFAULT', 'MONITORING_SEGMENT_MAX_DURATION', fallback=0)
+LIVE_UPLOAD = config['DEFAULT'].getboolean('LIVE_UPLOAD', fallback=False)
+LIVE_UPLOAD_SEGMENT_DURATION = config.getfloat('DEFAULT', 'LIVE_UPLOAD_SEGMENT_DURATION', fallback=300)
+LIVE_UPLOAD_CHECK_INTERVAL = config.getfloat('DEFAULT', 'LIVE_UPLOAD_CHECK_INTERVAL', fallback=10)
+if LIVE_UPLOAD:
+    MONITORING_SEGMENT_MAX_DURATION = LIVE_UPLOAD_SEGMENT_DURATION
 S3_SERVER_ENDPOINT = config.get('DEFAULT', 'S3_SERVER_ENDPOINT', fallback=None)
 S3_SERVER_AK = config.get('DEFAULT', 'S3_SERVER_AK', fallback=None)
 S3_SERVER_SK = config.get('DEFAULT', 'S3_SERVER_SK', fallback=None)
 S3_SERVER_BUCKET = config.get('DEFAULT', 'S3_SERVER_BUCKET', fallback=None)
 S3_SERVER_REGION = config.get('DEFAULT', 'S3_SERVER_REGION', fallback=None)
+S3_SERVER_SECURE = config['DEFAULT'].getboolean('S3_SERVER_SECURE', fallback=True)
+S3_SYNC_ENABLED = S3_SERVER_ENDPOINT is not None and S3_SERVER_AK is not None and S3_SERVER_SK is not None and \
+    S3_SERVER_BUCKET is not None and S3_SERVER_REGION is not None
+CONNECTIVITY_PROBE_INTERVAL = config.getfloat('DEFAULT', 'CONNECTIVITY_PROBE_INTERVAL', fallback=60)
+CONNECTIVITY_PROBE_MIN_INTERVAL = config.getfloat('DEFAULT', 'CONNECTIVITY_PROBE_MIN_INTERVAL', fallback=5)
+CONNECTIVITY_PROBE_MAX_INTERVAL = config.getfloat('DEFAULT', 'CONNECTIVITY_PROBE_MAX_INTERVAL', fallback=300)
+CONNECTIVITY_PROBE_TIMEOUT = config.getfloat('DEFAULT', 'CONNECTIVITY_PROBE_TIMEOUT', fallback=5)
+SYNC_RETRY_MIN_INTERVAL = config.getfloat('DEFAULT', 'SYNC_RETRY_MIN_INTERVAL', fallback=30)
+SYNC_RETRY_MAX_INTERVAL = config.getfloat('DEFAULT', 'SYNC_RETRY_MAX_INTERVAL', fallback=1800)
+S3_UPLOAD_WORKERS = max(1, config.getint('DEFAULT', 'S3_UPLOAD_WORKERS', fallback=4))
+S3_UPLOAD_ORDER = config.get('DEFAULT', 'S3_UPLOAD_ORDER', fallback=S3_UPLOAD_ORDER_OLDEST).lower()
+S3_MULTIPART_THRESHOLD = config.getint('DEFAULT', 'S3_MULTIPART_THRESHOLD', fallback=16 * 1024 * 1024)
+S3_MULTIPART_PART_SIZE = max(S3_MINIMUM_PART_SIZE,
+                             config.getint('DEFAULT', 'S3_MULTIPART_PART_SIZE', fallback=8 * 1024 * 1024))
 ENABLE_SOCKET_SERVER = config['DEFAULT'].getboolean('ENABLE_SOCKET_SERVER', fallback=False)
 SOCKET_SERVER_PORT = config.getint('DEFAULT', 'SOCKET_SERVER_PORT', fallback=None)
 SOCKET_SERVER_SECRET = config['DEFAULT'].get('SOCKET_SERVER_SECRET', fallback=None)
+SOCKET_SERVER_MAX_UPDATE_RATE = config.getfloat('DEFAULT', 'SOCKET_SERVER_MAX_UPDATE_RATE', fallback=10)
+SOCKET_SERVER_ADAPTER_TIMEOUT = config.getfloat('DEFAULT', 'SOCKET_SERVER_ADAPTER_TIMEOUT', fallback=10)
+RECORDING_SAMPLE_RATE = config.getfloat('DEFAULT', 'RECORDING_SAMPLE_RATE', fallback=2)
+SAMPLER_REPORT_INTERVAL = config.getfloat('DEFAULT', 'SAMPLER_REPORT_INTERVAL', fallback=60)
+RECORD_ACQUISITION_TIMESTAMPS = config['DEFAULT'].getboolean('RECORD_ACQUISITION_TIMESTAMPS', fallback=True)
+RECORD_DEADBAND_DICT = {
+    name: (0, float(value[:-1]) / 100) if value.endswith('%') else (float(value), 0)
+    for name, value in ([part.strip() for part in item.split(':')]
+                        for item in config.get('DEFAULT', 'RECORD_DEADBAND_LIST', fallback='').split(',')
+                        if item.strip())
+}
+RECORD_DELTA_RESOLUTION = config.getfloat('DEFAULT', 'RECORD_DELTA_RESOLUTION',
+                                          fallback=trip_format.DEFAULT_RESOLUTION)
+RECORD_KEYFRAME_INTERVAL = config.getfloat('DEFAULT', 'RECORD_KEYFRAME_INTERVAL', fallback=60)
+HISTORY_DURATION = config.getfloat('DEFAULT', 'HISTORY_DURATION', fallback=10)
+HISTORY_MAX_BUCKET_COUNT = config.getint('DEFAULT', 'HISTORY_MAX_BUCKET_COUNT', fallback=1000)
+TRIP_STATISTICS_SAMPLE_SIZE = config.getint('DEFAULT', 'TRIP_STATISTICS_SAMPLE_SIZE', fallback=2048)
+TRIP_STATISTICS_PERCENTILE_LIST = [float(percentile) for percentile in config.get(
+    'DEFAULT', 'TRIP_STATISTICS_PERCENTILE_LIST', fallback='50,90,99').split(',') if percentile.strip()]
+TRIP_SUMMARY_INTERVAL = config.getfloat('DEFAULT', 'TRIP_SUMMARY_INTERVAL', fallback=60)
+FUEL_AIR_RATIO = config.getfloat('DEFAULT', 'FUEL_AIR_RATIO', fallback=14.7)
+FUEL_DENSITY = config.getfloat('DEFAULT', 'FUEL_DENSITY', fallback=745)
+OBD_HIGH_RATE_COMMANDS = config.get('DEFAULT', 'OBD_HIGH_RATE_COMMANDS',
+                                    fallback='RPM,SPEED,THROTTLE_POS,ENGINE_LOAD,MAF').split(',')
+OBD_SLOW_RATE_COMMANDS = config.get('DEFAULT', 'OBD_SLOW_RATE_COMMANDS',
+                                    fallback='COOLANT_TEMP,INTAKE_TEMP,FUEL_LEVEL,AMBIANT_AIR_TEMP,OIL_TEMP,'
+                                             'BAROMETRIC_PRESSURE,DISTANCE_W_MIL,DISTANCE_SINCE_DTC_CLEAR,'
+                                             'WARMUPS_SINCE_DTC_CLEAR,TIME_SINCE_DTC_CLEARED,RUN_TIME_MIL,'
+                                             'HYBRID_BATTERY_REMAINING,ETHANOL_PERCENT').split(',')
+OBD_ONCE_COMMANDS = config.get('DEFAULT', 'OBD_ONCE_COMMANDS',
+                               fallback='FUEL_TYPE,OBD_COMPLIANCE,MAX_MAF,O2_SENSORS,O2_SENSORS_ALT').split(',')
+OBD_HIGH_RATE_PERIOD = config.getfloat('DEFAULT', 'OBD_HIGH_RATE_PERIOD', fallback=0.2)
+OBD_NORMAL_RATE_PERIOD = config.getfloat('DEFAULT', 'OBD_NORMAL_RATE_PERIOD', fallback=1)
+OBD_SLOW_RATE_PERIOD = config.getfloat('DEFAULT', 'OBD_SLOW_RATE_PERIOD', fallback=10)
+OBD_ADAPTIVE_UNCHANGED_COUNT = config.getint('DEFAULT', 'OBD_ADAPTIVE_UNCHANGED_COUNT', fallback=10)
+OBD_ADAPTIVE_MAX_FACTOR = config.getfloat('DEFAULT', 'OBD_ADAPTIVE_MAX_FACTOR', fallback=8)
+OBD_BATCH_REQUESTS = config['DEFAULT'].getboolean('OBD_BATCH_REQUESTS', fallback=True)
+OBD_BATCH_MAX_COMMANDS = min(6, config.getint('DEFAULT', 'OBD_BATCH_MAX_COMMANDS', fallback=6))
+OBD_BATCH_LOOKAHEAD = config.getfloat('DEFAULT', 'OBD_BATCH_LOOKAHEAD', fallback=0.1)
+OBD_BATCH_FAILURE_LIMIT = config.getint('DEFAULT', 'OBD_BATCH_FAILURE_LIMIT', fallback=3)
+OBD_CAPABILITY_CACHE_LOCATION = config.get('DEFAULT', 'OBD_CAPABILITY_CACHE_LOCATION',
+                                           fallback='capability_cache.json')
+OBD_CAPABILITY_CACHE_MAX_AGE = config.getfloat('DEFAULT', 'OBD_CAPABILITY_CACHE_MAX_AGE', fallback=168)
+OBD_CAPABILITY_PROBE_INTERVAL = config.getfloat('DEFAULT', 'OBD_CAPABILITY_PROBE_INTERVAL', fallback=1)
 ECCM_SERVER_LOCATION = config['DEFAULT'].get('ECCM_SERVER_LOCATION', fallback=None)
 ECCM_SECRET_HEADER = config['DEFAULT'].get('ECCM_SECRET_HEADER', fallback=None)
 ECCM_SECRET_VALUE = config['DEFAULT'].get('ECCM_SECRET_VALUE', fallback=None)
+ECCM_OUTBOX_LOCATION = config.get('DEFAULT', 'ECCM_OUTBOX_LOCATION', fallback='eccm_outbox.sqlite')
+ECCM_REGISTRATION_WORKERS = max(1, config.getint('DEFAULT', 'ECCM_REGISTRATION_WORKERS', fallback=2))
+ECCM_REQUEST_TIMEOUT = config.getfloat('DEFAULT', 'ECCM_REQUEST_TIMEOUT', fallback=30)
+ECCM_RETRY_INITIAL_DELAY = config.getfloat('DEFAULT', 'ECCM_RETRY_INITIAL_DELAY', fallback=2.5)
+ECCM_RETRY_MAX_DELAY = config.getfloat('DEFAULT', 'ECCM_RETRY_MAX_DELAY', fallback=600)
+ECCM_BATCH_REGISTRATION = config['DEFAULT'].getboolean('ECCM_BATCH_REGISTRATION', fallback=True)
+ECCM_BATCH_SIZE = max(1, config.getint('DEFAULT', 'ECCM_BATCH_SIZE', fallback=100))
+METRICS_LOG_INTERVAL = config.getfloat('DEFAULT', 'METRICS_LOG_INTERVAL', fallback=300)
 
 
-def ping(host):
-    param = '-n' if platform.system().lower() == 'windows' else '-c'
-    command = ['ping', param, '1', host]
-    return subprocess.call(command) == 0
+class Counter:
+    value = 0
+    lock = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value = self.value + amount
+
+
+class Gauge:
+    value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    bucket_list = None
+    bucket_count_list = None
+    sum = 0
+    count = 0
+    lock = None
+
+    def __init__(self, bucket_list):
+        self.bucket_list = bucket_list
+        self.bucket_count_list = [0 for _ in range(len(bucket_list) + 1)]
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bucket_list, value)
+        with self.lock:
+            self.bucket_count_list[index] = self.bucket_count_list[index] + 1
+            self.sum = self.sum + value
+            self.count = self.count + 1
+
+
+class MetricFamily:
+    name = None
+    help = None
+    metric_type = None
+    label_name_list = None
+    bucket_list = None
+    child_dict = None
+    lock = None
+
+    def __init__(self, name, help_text, metric_type, label_name_list, bucket_list):
+        self.name = name
+        self.help = help_text
+        self.metric_type = metric_type
+        self.label_name_list = label_name_list
+        self.bucket_list = bucket_list
+        self.child_dict = {}
+        self.lock = threading.Lock()
+
+    def get(self, *label_value_list):
+        child = self.child_dict.get(label_value_list)
+        if child is None:
+            with self.lock:
+                child = self.child_dict.get(label_value_list)
+                if child is None:
+                    if self.metric_type == HISTOGRAM_METRIC_TYPE:
+                        child = Histogram(self.bucket_list)
+                    elif self.metric_type == GAUGE_METRIC_TYPE:
+                        child = Gauge()
+                    else:
+                        child = Counter()
+                    self.child_dict[label_value_list] = child
+        return child
+
+    def get_label_string(self, label_value_list, extra_label=None):
+        label_list = [f'{name}="{self.escape(str(value))}"' for name, value in
+                      zip(self.label_name_list, label_value_list)]
+        if extra_label is not None:
+            label_list.append(extra_label)
+        return '{' + ','.join(label_list) + '}' if label_list else ''
+
+    @staticmethod
+    def escape(value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def generate_text(self):
+        ret = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.metric_type}']
+        for label_value_list, child in list(self.child_dict.items()):
+            if self.metric_type != HISTOGRAM_METRIC_TYPE:
+                ret.append(f'{self.name}{self.get_label_string(label_value_list)} {child.value}')
+                continue
+            with child.lock:
+                bucket_count_list = list(child.bucket_count_list)
+                histogram_sum = child.sum
+                histogram_count = child.count
+            cumulative_count = 0
+            for bucket, bucket_count in zip(self.bucket_list + ['+Inf'], bucket_count_list):
+                cumulative_count = cumulative_count + bucket_count
+                bucket_label = 'le="' + str(bucket) + '"'
+                ret.append(f'{self.name}_bucket{self.get_label_string(label_value_list, bucket_label)} '
+                           f'{cumulative_count}')
+            ret.append(f'{self.name}_sum{self.get_label_string(label_value_list)} {histogram_sum}')
+            ret.append(f'{self.name}_count{self.get_label_string(label_value_list)} {histogram_count}')
+        return ret
+
+    def generate_snapshot(self):
+        ret = {}
+        for label_value_list, child in list(self.child_dict.items()):
+            key = self.name + self.get_label_string(label_value_list)
+            if self.metric_type != HISTOGRAM_METRIC_TYPE:
+                ret[key] = child.value
+            elif child.count > 0:
+                ret[key] = {'count': child.count, 'mean': round(child.sum / child.count, 6)}
+        return ret
+
+
+class MetricRegistry:
+    family_dict = None
+    lock = None
+
+    def __init__(self):
+        self.family_dict = {}
+        self.lock = threading.Lock()
+
+    def get_family(self, name, help_text, metric_type, label_name_list=(), bucket_list=None):
+        with self.lock:
+            family = self.family_dict.get(name)
+            if family is None:
+                family = MetricFamily(name, help_text, metric_type, tuple(label_name_list), bucket_list)
+                self.family_dict[name] = family
+            return family
+
+    def counter(self, name, help_text, label_name_list=()):
+        return self.get_family(name, help_text, COUNTER_METRIC_TYPE, label_name_list)
+
+    def gauge(self, name, help_text, label_name_list=()):
+        return self.get_family(name, help_text, GAUGE_METRIC_TYPE, label_name_list)
+
+    def histogram(self, name, help_text, bucket_list, label_name_list=()):
+        return self.get_family(name, help_text, HISTOGRAM_METRIC_TYPE, label_name_list, bucket_list)
+
+    def generate_text(self):
+        with self.lock:
+            family_list = list(self.family_dict.values())
+        return '\n'.join(line for family in family_list for line in family.generate_text()) + '\n'
+
+    def generate_snapshot(self):
+        with self.lock:
+            family_list = list(self.family_dict.values())
+        ret = {}
+        for family in family_list:
+            ret.update(family.generate_snapshot())
+        return ret
+
+
+metrics = MetricRegistry()
+OBD_QUERY_SECONDS = metrics.histogram('eccm_obd_query_seconds', 'Duration of single OBD command requests',
+                                      LATENCY_BUCKET_LIST, ['command'])
+OBD_BATCH_QUERY_SECONDS = metrics.histogram('eccm_obd_batch_query_seconds',
+                                            'Duration of multi command OBD requests', LATENCY_BUCKET_LIST,
+                                            ['command_count'])
+OBD_NULL_RESPONSES_TOTAL = metrics.counter('eccm_obd_null_responses_total',
+                                           'Number of OBD requests which returned no value', ['command'])
+SAMPLER_TICK_LATENESS_SECONDS = metrics.histogram('eccm_sampler_tick_lateness_seconds',
+                                                  'Delay between a sampling tick and the moment it is recorded',
+                                                  LATENCY_BUCKET_LIST).get()
+SAMPLER_MISSED_TICKS_TOTAL = metrics.counter('eccm_sampler_missed_ticks_total',
+                                             'Number of sampling ticks skipped because the sampler was late').get()
+RECORD_QUEUE_DEPTH = metrics.gauge('eccm_record_queue_depth',
+                                   'Number of records waiting to be written to the monitoring file').get()
+RECORD_WRITE_SECONDS = metrics.histogram('eccm_record_write_seconds',
+                                         'Duration of the writes of a batch of records to the monitoring file',
+                                         LATENCY_BUCKET_LIST).get()
+RECORDS_DROPPED_TOTAL = metrics.counter('eccm_records_dropped_total',
+                                        'Number of records dropped because the record buffer was full').get()
+RECORDS_WRITTEN_TOTAL = metrics.counter('eccm_records_written_total',
+                                        'Number of records written to the monitoring files').get()
+UPLOAD_SECONDS = metrics.histogram('eccm_upload_seconds', 'Duration of the file uploads to the S3 server',
+                                   UPLOAD_BUCKET_LIST).get()
+UPLOADED_BYTES_TOTAL = metrics.counter('eccm_uploaded_bytes_total',
+                                       'Number of bytes uploaded to the S3 server').get()
+UPLOAD_FAILURES_TOTAL = metrics.counter('eccm_upload_failures_total',
+                                        'Number of failed file uploads to the S3 server').get()
+
+
+class StatusBus:
+    socket_io_server = None
+    loop = None
+    lock = None
+    snapshot = None
+    version = 0
+    emit_scheduled = False
+
+    def __init__(self, socket_io_server):
+        self.socket_io_server = socket_io_server
+        self.lock = threading.Lock()
+
+    async def on_startup(self, _):
+        self.loop = asyncio.get_running_loop()
+
+    def publish(self, snapshot):
+        with self.lock:
+            self.version = self.version + 1
+            self.snapshot = dict(snapshot, version=self.version)
+            if self.loop is None or self.emit_scheduled:
+                return
+            self.emit_scheduled = True
+        self.loop.call_soon_threadsafe(self.schedule_emit)
+
+    def schedule_emit(self):
+        asyncio.ensure_future(self.emit_snapshot())
+
+    async def emit_snapshot(self):
+        await asyncio.sleep(STATUS_EMIT_DELAY)
+        with self.lock:
+            self.emit_scheduled = False
+            snapshot = self.snapshot
+        await self.socket_io_server.emit('status', snapshot)
+
+    def get_snapshot(self):
+        with self.lock:
+            return self.snapshot
+
+
+class Subscription:
+    command_list = None
+    period = None
+    last_value_dict = None
+    pending_delta = None
+    pending_event = None
+    task = None
+    sender_task = None
+
+    def __init__(self, command_list, period):
+        self.command_list = command_list
+        self.period = period
+        self.last_value_dict = {}
+        self.pending_delta = {}
+        self.pending_event = asyncio.Event()
 
 
 class SocketServer:
     main_manager = None
     socket_io_server = None
     app = None
+    subscription_dict = None
+    executor = None
+    adapter_operation_dict = None
+    status_bus = None
 
     def __init__(self, manager):
         self.main_manager = manager
+        self.subscription_dict = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self.adapter_operation_dict = {}
         self.socket_io_server = socketio.AsyncServer()
+        self.status_bus = StatusBus(self.socket_io_server)
         self.app = web.Application()
+        self.app.on_startup.append(self.status_bus.on_startup)
+        self.app.router.add_get('/metrics', self.get_metrics)
         self.socket_io_server.attach(self.app)
 
         @self.socket_io_server.event
@@ -81,15 +516,13 @@ class SocketServer:
         @self.socket_io_server.event
         async def disconnect(sid):
             print("disconnected ", sid)
+            self.cancel_subscription(sid)
 
         @self.socket_io_server.event
         async def query_command(_, data):
             if data is None:
                 return "KO"
-            response = self.query_command(data)
-            if response is not None:
-                response = response.value
-            return str(response)
+            return self.query_command(data)
 
         @self.socket_io_server.event
         async def supported_commands(_, __):
@@ -103,14 +536,21 @@ class SocketServer:
         async def query_status(_, data):
             if data is None:
                 return "KO"
-            response = self.query_status(data)
-            if response is not None:
-                response = response.value
-            return str(response)
+            if self.main_manager.is_command_cached(data):
+                return self.query_command(data)
+            start_time = time.monotonic_ns()
+            try:
+                response = await self.run_adapter_operation(('query_status', data), self.query_status, data)
+            except asyncio.TimeoutError:
+                return "TIMEOUT"
+            return self.generate_reply(response, start_time)
 
         @self.socket_io_server.event
         async def get_dtc(_, __):
-            response = self.get_dtc()
+            try:
+                response = await self.run_adapter_operation(('get_dtc',), self.get_dtc)
+            except asyncio.TimeoutError:
+                return "TIMEOUT"
             if response is not None:
                 response = response.value
             return str(response)
@@ -124,18 +564,85 @@ class SocketServer:
 
         @self.socket_io_server.event
         async def clear_dtc(_, __):
-            self.clear_dtc()
+            try:
+                await self.run_adapter_operation(('clear_dtc',), self.clear_dtc)
+            except asyncio.TimeoutError:
+                return "TIMEOUT"
             return "OK"
 
         @self.socket_io_server.event
-        async def query_last_status(_):
-            await self.emit('status', self.main_manager.status.generate_json())
+        async def query_last_status(sid, *_):
+            snapshot = self.status_bus.get_snapshot()
+            if snapshot is None:
+                snapshot = self.main_manager.status.generate_json()
+            await self.socket_io_server.emit('status', snapshot, to=sid)
+            return snapshot
+
+        @self.socket_io_server.event
+        async def subscribe(sid, data):
+            subscription = self.create_subscription(data)
+            if subscription is None:
+                return "KO"
+            self.cancel_subscription(sid)
+            subscription.task = asyncio.create_task(self.run_subscription(subscription))
+            subscription.sender_task = asyncio.create_task(self.send_subscription(sid, subscription))
+            self.subscription_dict[sid] = subscription
+            return "OK"
+
+        @self.socket_io_server.event
+        async def query_history(_, data):
+            response = self.query_history(data, False)
+            return response if response is not None else "KO"
+
+        @self.socket_io_server.event
+        async def query_history_aggregates(_, data):
+            response = self.query_history(data, True)
+            return response if response is not None else "KO"
+
+        @self.socket_io_server.event
+        async def unsubscribe(sid, *_):
+            self.cancel_subscription(sid)
+            return "OK"
 
     def start_server(self):
         web.run_app(self.app, host='0.0.0.0', port=SOCKET_SERVER_PORT)
 
+    @staticmethod
+    async def get_metrics(request):
+        if SOCKET_SERVER_SECRET:
+            authorization = request.headers.get('Authorization', '')
+            secret = authorization[len('Bearer '):] if authorization.startswith('Bearer ') \
+                else request.query.get('secret', '')
+            if not hmac.compare_digest(secret.encode('utf-8'), SOCKET_SERVER_SECRET.encode('utf-8')):
+                return web.Response(status=401)
+        return web.Response(
+            body=metrics.generate_text().encode('utf-8'),
+            headers={'Content-Type': METRICS_CONTENT_TYPE}
+        )
+
     def query_command(self, command):
-        return self.main_manager.query_command(command)
+        return self.generate_reply(*self.main_manager.get_cached_value(command))
+
+    @staticmethod
+    def generate_reply(response, timestamp):
+        age = (time.monotonic_ns() - timestamp) / 1000000000 if timestamp is not None else None
+        return {
+            'value': str(response.value if response is not None else None),
+            'timestamp': time.time() - age if age is not None else None,
+            'age': age,
+        }
+
+    async def run_adapter_operation(self, key, function, *args):
+        future = self.adapter_operation_dict.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+            self.adapter_operation_dict[key] = future
+            future.add_done_callback(lambda _: self.adapter_operation_dict.pop(key, None))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), SOCKET_SERVER_ADAPTER_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.warning(f'SOCKET SERVER {key[0].upper()} TIMED OUT')
+            raise
 
     def query_status(self, status_type):
         return self.main_manager.query_status(status_type)
@@ -166,6 +673,64 @@ class SocketServer:
     async def emit(self, event, body):
         await self.socket_io_server.emit(event=event, data=body)
 
+    def create_subscription(self, data):
+        if type(data) is not dict or 'commands' not in data:
+            return None
+        command_list = data['commands'].split(',') if isinstance(data['commands'], str) else data['commands']
+        command_list = [command for command in command_list if self.main_manager.is_command_cached(command)]
+        try:
+            rate = min(float(data.get('rate', SOCKET_SERVER_MAX_UPDATE_RATE)), SOCKET_SERVER_MAX_UPDATE_RATE)
+        except (TypeError, ValueError):
+            return None
+        if not command_list or rate <= 0:
+            return None
+        return Subscription(command_list, 1 / rate)
+
+    def query_history(self, data, aggregated):
+        if type(data) is not dict or 'commands' not in data:
+            return None
+        label_list = data['commands'].split(',') if isinstance(data['commands'], str) else data['commands']
+        try:
+            duration = min(float(data.get('duration', HISTORY_DURATION * 60)), HISTORY_DURATION * 60)
+            bucket_count = min(int(data.get('buckets', 100)), HISTORY_MAX_BUCKET_COUNT) if aggregated else None
+        except (TypeError, ValueError):
+            return None
+        if duration <= 0 or bucket_count is not None and bucket_count <= 0:
+            return None
+        return self.main_manager.get_history(label_list, duration, bucket_count)
+
+    def cancel_subscription(self, sid):
+        subscription = self.subscription_dict.pop(sid, None)
+        if subscription is not None:
+            subscription.task.cancel()
+            subscription.sender_task.cancel()
+
+    async def run_subscription(self, subscription):
+        while True:
+            delta = self.get_subscription_delta(subscription)
+            if delta:
+                subscription.pending_delta.update(delta)
+                subscription.pending_event.set()
+            await asyncio.sleep(subscription.period)
+
+    async def send_subscription(self, sid, subscription):
+        while True:
+            await subscription.pending_event.wait()
+            subscription.pending_event.clear()
+            delta = subscription.pending_delta
+            subscription.pending_delta = {}
+            await self.socket_io_server.emit('telemetry', delta, to=sid)
+
+    def get_subscription_delta(self, subscription):
+        ret = {}
+        for command in subscription.command_list:
+            response = self.main_manager.get_cached_value(command)[0]
+            value = str(response.value if response is not None else None)
+            if subscription.last_value_dict.get(command) != value:
+                subscription.last_value_dict[command] = value
+                ret[command] = value
+        return ret
+
 
 class FileSyncManager(Thread):
     excluded_sync_filename = None
@@ -180,158 +745,1873 @@ class FileSyncManager(Thread):
     def run(self):
         self.main_manager.set_sync_in_progress_info(True)
         self.running = True
-        export_failed_count = 0
-        retry_count = 0
         logging.info('FILE SYNC MANAGER STARTED')
-        while not ping(S3_SERVER_ENDPOINT):
-            retry_count = retry_count + 1
-            time.sleep(SECONDS_BETWEEN_PING)
-            if retry_count % MESSAGE_RETRY_INTERVAL == 0:
-                logging.warning(f'S3 SERVER PING RETRY COUNT {retry_count}')
+        if self.main_manager.is_s3_server_reachable():
+            export_failed_count = self.sync_files()
+            self.main_manager.set_last_sync_failed_error(export_failed_count > 0)
+            self.main_manager.set_file_sync_result(export_failed_count == 0)
+        else:
+            logging.info('S3 SERVER UNREACHABLE: SYNC POSTPONED UNTIL CONNECTIVITY RETURNS')
+        logging.info('FILE SYNC MANAGER ENDED')
+        self.main_manager.set_sync_in_progress_info(False)
+        self.running = False
+
+    def sync_files(self):
+        export_failed_count = 0
         s3_file_location_list = []
         client = minio.Minio(endpoint=S3_SERVER_ENDPOINT, access_key=S3_SERVER_AK, secret_key=S3_SERVER_SK,
-                             region=S3_SERVER_REGION)
+                             region=S3_SERVER_REGION, secure=S3_SERVER_SECURE)
+        self.remove_orphaned_upload_states(client)
+        filename_list = sorted([filename for filename in os.listdir(RECORD_DIRECTORY_LOCATION)
+                                if filename.endswith(MONITORING_FILE_EXTENSION_TUPLE +
+                                                     (TRIP_SUMMARY_EXTENSION, TRIP_MANIFEST_EXTENSION)) and
+                                not self.is_sync_excluded(filename)],
+                               reverse=S3_UPLOAD_ORDER == S3_UPLOAD_ORDER_NEWEST)
+        synced_size = 0
+        start_time = time.monotonic()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=S3_UPLOAD_WORKERS) as executor:
+            held_trip_id_set = set()
+            for upload_pass in range(2):
+                future_dict = {executor.submit(self.upload_file, client, filename): filename
+                               for filename in filename_list if self.get_upload_pass(filename) == upload_pass and
+                               get_trip_id(filename) not in held_trip_id_set}
+                for future in concurrent.futures.as_completed(future_dict):
+                    try:
+                        result = future.result()
+                        if result is None:
+                            held_trip_id_set.add(get_trip_id(future_dict[future]))
+                            continue
+                        object_name, size = result
+                        s3_file_location_list.append(object_name)
+                        synced_size = synced_size + size
+                    except Exception as exc:
+                        UPLOAD_FAILURES_TOTAL.inc()
+                        logging.error(f'FILE {future_dict[future]} SYNC FAILED')
+                        logging.error(f'Error: {exc}')
+                        export_failed_count = export_failed_count + 1
+                        held_trip_id_set.add(get_trip_id(future_dict[future]))
+        if s3_file_location_list:
+            duration = time.monotonic() - start_time
+            logging.info(f'{len(s3_file_location_list)} FILES SYNCED TO S3 ({synced_size} BYTES IN '
+                         f'{duration:.1f} SECONDS, {synced_size / max(duration, 0.001) / 1024:.1f} KIB/S)')
+        return export_failed_count
+
+    @staticmethod
+    def remove_orphaned_upload_states(client):
         for filename in os.listdir(RECORD_DIRECTORY_LOCATION):
-            if filename.endswith(MONITORING_FILE_EXTENSION) and filename != self.excluded_sync_filename:
+            if not filename.endswith((UPLOAD_STATE_EXTENSION, UPLOAD_STATE_EXTENSION + '.tmp')):
+                continue
+            state_path = os.path.join(RECORD_DIRECTORY_LOCATION, filename)
+            if os.path.exists(state_path.rsplit(UPLOAD_STATE_EXTENSION, 1)[0]):
+                continue
+            try:
+                with open(state_path) as file:
+                    state = json.load(file)
+                client._abort_multipart_upload(S3_SERVER_BUCKET, state['object_name'], state['upload_id'])
+            except (OSError, ValueError, KeyError, minio.error.S3Error):
+                pass
+            try:
+                os.remove(state_path)
+                logging.info(f'ORPHANED UPLOAD STATE {filename} REMOVED')
+            except OSError:
+                pass
+
+    @staticmethod
+    def get_registration_location(filename):
+        if filename.endswith(TRIP_SUMMARY_EXTENSION):
+            return POST_TRIP_SUMMARY_LOCATION
+        if filename.endswith(TRIP_MANIFEST_EXTENSION):
+            return POST_TRIP_MANIFEST_LOCATION
+        return POST_TRIP_LOCATION
+
+    @staticmethod
+    def get_upload_pass(filename):
+        if filename.endswith((TRIP_SUMMARY_EXTENSION, TRIP_MANIFEST_EXTENSION)):
+            return 1
+        return 0
+
+    def upload_file(self, client, filename):
+        if not self.main_manager.lock_record_file(filename):
+            logging.info(f'FILE {filename} REDUCED OR IN USE: SYNC POSTPONED')
+            return None
+        try:
+            path = os.path.join(RECORD_DIRECTORY_LOCATION, filename)
+            object_name = f'{S3_ROOT_DIRECTORY}/{CAR_IDENTIFIER}/{filename}'
+            size = os.path.getsize(path)
+            start_time = time.monotonic()
+            if size >= S3_MULTIPART_THRESHOLD:
+                self.upload_file_multipart(client, path, object_name, size)
+            else:
+                client.fput_object(bucket_name=S3_SERVER_BUCKET, object_name=object_name, file_path=path,
+                                   num_parallel_uploads=1)
+            duration = time.monotonic() - start_time
+            UPLOAD_SECONDS.observe(duration)
+            UPLOADED_BYTES_TOTAL.inc(size)
+            self.main_manager.register_uploaded_file(object_name, size, self.get_registration_location(filename))
+            os.remove(path)
+        finally:
+            self.main_manager.unlock_record_file(filename)
+        logging.info(f'FILE {filename} SYNCED TO S3 ({size} BYTES IN {duration:.1f} SECONDS, '
+                     f'{size / max(duration, 0.001) / 1024:.1f} KIB/S)')
+        return object_name, size
+
+    @staticmethod
+    def upload_file_multipart(client, path, object_name, size):
+        state_path = path + UPLOAD_STATE_EXTENSION
+        state = None
+        if os.path.exists(state_path):
+            try:
+                with open(state_path) as file:
+                    state = json.load(file)
+            except ValueError:
+                state = None
+        if state is not None and (state.get('object_name') != object_name or state.get('size') != size or
+                                  state.get('part_size') != S3_MULTIPART_PART_SIZE):
+            try:
+                client._abort_multipart_upload(S3_SERVER_BUCKET, state.get('object_name'), state.get('upload_id'))
+            except minio.error.S3Error:
+                pass
+            state = None
+        uploaded_part_dict = {}
+        if state is not None:
+            try:
+                uploaded_part_dict = FileSyncManager.list_uploaded_parts(client, object_name, state['upload_id'])
+                logging.info(f'FILE {os.path.basename(path)} UPLOAD RESUMED '
+                             f'({len(uploaded_part_dict)} PARTS ALREADY UPLOADED)')
+            except minio.error.S3Error:
+                state = None
+        if state is None:
+            state = {'object_name': object_name, 'size': size, 'part_size': S3_MULTIPART_PART_SIZE,
+                     'upload_id': client._create_multipart_upload(S3_SERVER_BUCKET, object_name,
+                                                                  {'Content-Type': 'application/octet-stream'})}
+            with open(state_path + '.tmp', 'w') as file:
+                json.dump(state, file)
+            os.replace(state_path + '.tmp', state_path)
+
+        part_list = []
+        with open(path, 'rb') as file:
+            for part_number in range(1, (size + S3_MULTIPART_PART_SIZE - 1) // S3_MULTIPART_PART_SIZE + 1):
+                part_size = min(S3_MULTIPART_PART_SIZE, size - (part_number - 1) * S3_MULTIPART_PART_SIZE)
+                part = uploaded_part_dict.get(part_number)
+                if part is None or part.size != part_size:
+                    file.seek((part_number - 1) * S3_MULTIPART_PART_SIZE)
+                    etag = client._upload_part(S3_SERVER_BUCKET, object_name, file.read(part_size), None,
+                                               state['upload_id'], part_number)
+                    part = minio.datatypes.Part(part_number, etag)
+                part_list.append(minio.datatypes.Part(part_number, part.etag))
+        client._complete_multipart_upload(S3_SERVER_BUCKET, object_name, state['upload_id'], part_list)
+        os.remove(state_path)
+
+    @staticmethod
+    def list_uploaded_parts(client, object_name, upload_id):
+        ret = {}
+        part_number_marker = None
+        while True:
+            result = client._list_parts(S3_SERVER_BUCKET, object_name, upload_id,
+                                        part_number_marker=part_number_marker)
+            for part in result.parts:
+                ret[part.part_number] = part
+            if not result.is_truncated:
+                return ret
+            part_number_marker = result.next_part_number_marker
+
+    def is_sync_excluded(self, filename):
+        if self.excluded_sync_filename is not None and filename == os.path.basename(self.excluded_sync_filename):
+            return True
+        data_manager = self.main_manager.data_manager
+        return data_manager is not None and data_manager.is_record_file_active(filename)
+
+
+class ConnectivityMonitor(Thread):
+    running = False
+    reachable = False
+    main_manager = None
+    probe_event = None
+    host = None
+    port = None
+    sync_pending = False
+    sync_retry_time = None
+    failed_sync_count = 0
+
+    def __init__(self, main_manager_):
+        self.main_manager = main_manager_
+        self.probe_event = threading.Event()
+        host, _, port = S3_SERVER_ENDPOINT.partition(':')
+        self.host = host
+        self.port = int(port) if port else 443 if S3_SERVER_SECURE else 80
+        super().__init__()
+
+    def run(self):
+        self.running = True
+        failed_probe_count = 0
+        while self.running:
+            reachable = self.probe()
+            if reachable != self.reachable:
+                self.reachable = reachable
+                if reachable:
+                    logging.info('S3 SERVER REACHABLE')
+                else:
+                    logging.warning('S3 SERVER UNREACHABLE')
+                self.main_manager.set_s3_server_reachable_info(reachable)
+                if reachable:
+                    self.sync_pending = False
+                    self.main_manager.start_file_sync()
+            if reachable and self.sync_pending and time.monotonic() >= self.sync_retry_time:
+                logging.info(f'FILE SYNC RETRY {self.failed_sync_count}')
+                self.sync_pending = False
+                self.main_manager.start_file_sync()
+            if reachable:
+                failed_probe_count = 0
+                delay = CONNECTIVITY_PROBE_INTERVAL
+                if self.sync_pending:
+                    delay = min(delay, max(0, self.sync_retry_time - time.monotonic()))
+            else:
+                delay = min(CONNECTIVITY_PROBE_MAX_INTERVAL,
+                            CONNECTIVITY_PROBE_MIN_INTERVAL * 2 ** min(failed_probe_count, 32))
+                failed_probe_count = failed_probe_count + 1
+                if failed_probe_count % MESSAGE_RETRY_INTERVAL == 0:
+                    logging.warning(f'S3 SERVER CONNECTIVITY RETRY COUNT {failed_probe_count}')
+            self.probe_event.wait(delay)
+            self.probe_event.clear()
+
+    def probe(self):
+        try:
+            with socket.create_connection((self.host, self.port), timeout=CONNECTIVITY_PROBE_TIMEOUT):
+                return True
+        except OSError:
+            return False
+
+    def request_probe(self):
+        self.probe_event.set()
+
+    def set_sync_result(self, succeeded):
+        if succeeded:
+            self.failed_sync_count = 0
+            self.sync_pending = False
+            return
+        self.failed_sync_count = self.failed_sync_count + 1
+        self.sync_retry_time = time.monotonic() + min(
+            SYNC_RETRY_MAX_INTERVAL, SYNC_RETRY_MIN_INTERVAL * 2 ** min(self.failed_sync_count - 1, 32))
+        self.sync_pending = True
+        self.request_probe()
+
+    def terminate(self):
+        self.running = False
+        self.probe_event.set()
+
+
+class StorageManager(Thread):
+    running = False
+    main_manager = None
+    stop_event = None
+    used_size = 0
+    reduced_file_count = 0
+    budget_exceeded = False
+
+    def __init__(self, main_manager_):
+        self.main_manager = main_manager_
+        self.stop_event = threading.Event()
+        super().__init__()
+
+    def run(self):
+        self.running = True
+        logging.info('STORAGE MANAGER STARTED')
+        while self.running:
+            self.check_storage()
+            self.stop_event.wait(STORAGE_CHECK_INTERVAL)
+        logging.info('STORAGE MANAGER ENDED')
+
+    def check_storage(self):
+        reduced_file_count = self.reduced_file_count
+        used_size = self.get_used_size()
+        if used_size > STORAGE_BUDGET * STORAGE_HIGH_WATERMARK:
+            used_size = self.reduce_storage(used_size)
+        budget_exceeded = used_size > STORAGE_BUDGET * STORAGE_HIGH_WATERMARK
+        if budget_exceeded and not self.budget_exceeded:
+            logging.warning(f'STORAGE BUDGET EXCEEDED ({used_size} OF {STORAGE_BUDGET} BYTES USED)')
+        self.budget_exceeded = budget_exceeded
+        if used_size != self.used_size or self.reduced_file_count != reduced_file_count:
+            self.used_size = used_size
+            self.main_manager.set_storage_info(used_size, self.reduced_file_count)
+
+    @staticmethod
+    def get_used_size():
+        with os.scandir(RECORD_DIRECTORY_LOCATION) as iterator:
+            return sum(entry.stat().st_size for entry in iterator if entry.is_file())
+
+    def reduce_storage(self, used_size):
+        for level in range(1, len(STORAGE_DOWNSAMPLE_PERIOD_LIST) + 2):
+            for filename in self.get_reducible_filename_list():
+                if not self.running or used_size <= STORAGE_BUDGET * STORAGE_HIGH_WATERMARK:
+                    return used_size
+                base, period, compression_extension = self.parse_filename(filename)
+                if self.get_level(period, compression_extension) >= level or (
+                        level > 1 and base.endswith(SIMPLIFIED_TRACK_FILENAME_SUFFIX)):
+                    continue
+                if not self.main_manager.lock_record_file(filename):
+                    continue
                 try:
-                    result = client.fput_object(bucket_name=S3_SERVER_BUCKET,
-                                                object_name=f'{S3_ROOT_DIRECTORY}/{CAR_IDENTIFIER}/{filename}',
-                                                file_path=os.path.join(RECORD_DIRECTORY_LOCATION, filename)
-                                                )
-                    os.remove(os.path.join(RECORD_DIRECTORY_LOCATION, filename))
-                    logging.info(f'FILE {filename} SYNCED TO S3')
-                    s3_file_location_list.append(result.object_name)
-                except Exception as exc:
-                    logging.error(f'FILE {filename} SYNC FAILED')
+                    used_size = used_size + self.reduce_file(filename, level)
+                    self.reduced_file_count = self.reduced_file_count + 1
+                except (OSError, ValueError, IndexError, struct.error) as exc:
+                    logging.error(f'FILE {filename} REDUCTION FAILED')
                     logging.error(f'Error: {exc}')
-                    export_failed_count = export_failed_count + 1
+                finally:
+                    self.main_manager.unlock_record_file(filename)
+        return used_size
 
-        thread_list = []
-        if ECCM_SERVER_LOCATION is not None and ECCM_SECRET_VALUE is not None and ECCM_SECRET_HEADER is not None:
-            for location in s3_file_location_list:
-                data = {"objectLocation": location, "uploadDate": "2022-05-05T07:17:00"}
-                thread = Thread(target=post_to_eccm_server, args=(POST_TRIP_LOCATION, data, location,))
-                thread.start()
-                thread_list.append(thread)
+    def get_reducible_filename_list(self):
+        data_manager = self.main_manager.data_manager
+        return sorted(filename for filename in os.listdir(RECORD_DIRECTORY_LOCATION)
+                      if filename.endswith(MONITORING_FILE_EXTENSION_TUPLE) and
+                      (data_manager is None or not data_manager.is_trip_active(filename)))
 
-            for thread in thread_list:
-                thread.join()
+    @staticmethod
+    def parse_filename(filename):
+        compression_extension = next((extension for extension in trip_format.COMPRESSION_EXTENSION_DICT.values()
+                                      if filename.endswith(extension)), '')
+        base = filename[:len(filename) - len(compression_extension) - len(MONITORING_FILE_EXTENSION)]
+        prefix, _, suffix = base.rpartition('_')
+        if prefix and suffix.endswith('s'):
+            try:
+                return prefix, float(suffix[:-1]), compression_extension
+            except ValueError:
+                pass
+        return base, 0, compression_extension
 
-        logging.info('FILE SYNC MANAGER ENDED')
-        self.main_manager.set_last_sync_failed_error(export_failed_count > 0)
-        self.main_manager.set_sync_in_progress_info(False)
+    @staticmethod
+    def get_level(period, compression_extension):
+        if not compression_extension:
+            return 0
+        return 1 + sum(1 for downsample_period in STORAGE_DOWNSAMPLE_PERIOD_LIST if downsample_period <= period)
+
+    def reduce_file(self, filename, level):
+        base, period, compression_extension = self.parse_filename(filename)
+        compression = next((compression for compression, extension in
+                            trip_format.COMPRESSION_EXTENSION_DICT.items() if extension == compression_extension),
+                           STORAGE_COMPRESSION)
+        if level > 1:
+            period = STORAGE_DOWNSAMPLE_PERIOD_LIST[level - 2]
+        target_filename = f'{base}_{period:g}s' if period > 0 else base
+        target_filename = target_filename + MONITORING_FILE_EXTENSION + \
+            trip_format.COMPRESSION_EXTENSION_DICT[compression]
+        path = os.path.join(RECORD_DIRECTORY_LOCATION, filename)
+        target_path = os.path.join(RECORD_DIRECTORY_LOCATION, target_filename)
+        with open(path, 'rb') as file, open(target_path + '.tmp', 'wb') as target_file:
+            source = trip_format.open_frame_stream(file)
+            stream = trip_format.CompressedFrameWriter(target_file, compression, MONITORING_FILE_COMPRESSION_LEVEL,
+                                                       MONITORING_FILE_COMPRESSION_BLOCK_SIZE)
+            if level > 1:
+                self.write_downsampled_data(source, stream, period)
+            else:
+                while True:
+                    data = source.read(MONITORING_FILE_COMPRESSION_BLOCK_SIZE)
+                    if not data:
+                        break
+                    stream.write(data)
+            stream.flush()
+            os.fsync(target_file.fileno())
+        size = os.path.getsize(path)
+        target_size = os.path.getsize(target_path + '.tmp')
+        os.replace(target_path + '.tmp', target_path)
+        os.remove(path)
+        logging.info(f'FILE {filename} REDUCED TO {target_filename} ({size} TO {target_size} BYTES)')
+        self.rename_trip_references(filename, target_filename, target_size)
+        return target_size - size
+
+    @staticmethod
+    def rename_trip_references(filename, target_filename, target_size):
+        trip_id = get_trip_id(filename)
+        for reference_filename in os.listdir(RECORD_DIRECTORY_LOCATION):
+            if not reference_filename.startswith(trip_id) or \
+                    not reference_filename.endswith((TRIP_SUMMARY_EXTENSION, TRIP_MANIFEST_EXTENSION)):
+                continue
+            reference_path = os.path.join(RECORD_DIRECTORY_LOCATION, reference_filename)
+            try:
+                with open(reference_path) as file:
+                    reference = json.load(file)
+                file_list = reference.get('files', [])
+                changed = filename in file_list
+                if changed:
+                    reference['files'] = [target_filename if file == filename else file for file in file_list]
+                for segment in reference.get('segments', []):
+                    if segment.get('file') == filename:
+                        segment['file'] = target_filename
+                        segment['size'] = target_size
+                        changed = True
+                if not changed:
+                    continue
+                with open(reference_path + '.tmp', 'w') as file:
+                    json.dump(reference, file, indent=1)
+                os.replace(reference_path + '.tmp', reference_path)
+            except (OSError, ValueError) as exc:
+                logging.error(f'TRIP FILE {reference_filename} NOT UPDATED AFTER REDUCTION')
+                logging.error(f'Error: {exc}')
+
+    @staticmethod
+    def write_downsampled_data(source, stream, period):
+        if trip_format.peek_stream(source, len(trip_format.COLUMNAR_MAGIC)) in (trip_format.COLUMNAR_MAGIC,
+                                                                                 trip_format.DELTA_MAGIC):
+            reader = trip_format.open_trip_reader(source)
+            if isinstance(reader, trip_format.DeltaTripReader):
+                writer = trip_format.DeltaTripWriter(stream, reader.column_list, reader.type_list, None,
+                                                     reader.resolution_list, reader.linked_column_list,
+                                                     max(1, int(RECORD_KEYFRAME_INTERVAL / period)))
+            else:
+                writer = trip_format.ColumnarTripWriter(stream, reader.column_list, reader.type_list)
+            for row in trip_format.aggregate_rows(reader, reader.type_list, period):
+                writer.write_row(row)
+            writer.close()
+            return
+        stream.write(source.readline())
+        separator = MONITORING_FILE_SEPARATION_CHARACTER.encode('utf-8')
+        bucket = None
+        last_line = None
+        for line in source:
+            try:
+                line_bucket = datetime.datetime.strptime(line.split(separator, 1)[0].decode('utf-8'),
+                                                         DATETIME_FORMAT).timestamp() // period
+            except (ValueError, UnicodeDecodeError):
+                line_bucket = bucket
+            if last_line is not None and line_bucket != bucket:
+                stream.write(last_line)
+            bucket = line_bucket
+            last_line = line
+        if last_line is not None:
+            stream.write(last_line)
+
+    def terminate(self):
         self.running = False
+        self.stop_event.set()
 
 
-def post_to_eccm_server(url, data, location):
-    response = requests.Response()
-    while response.status_code != 200:
-        response = requests.post(f'{ECCM_SERVER_LOCATION}/{url}',
-                                 headers={ECCM_SECRET_HEADER: ECCM_SECRET_VALUE,
-                                          "Content-Type": "application/json; charset=utf-8"},
-                                 json=data)
-        if response.status_code != 200:
-            logging.warning(f'FILE {location} IMPORTATION FAILED RETRY IN 2.5 SECONDS')
-            time.sleep(2.5)
+class MetricLogger(Thread):
+    running = False
+    stop_event = None
 
-    logging.info(f'FILE {location} IMPORTED INTO ECCM SERVER')
+    def __init__(self):
+        self.stop_event = threading.Event()
+        super().__init__()
+
+    def run(self):
+        self.running = True
+        while not self.stop_event.wait(METRICS_LOG_INTERVAL):
+            logging.info('METRICS ' + json.dumps(metrics.generate_snapshot()))
+        self.running = False
+
+    def terminate(self):
+        self.stop_event.set()
+
+
+class RegistrationOutbox:
+    connection = None
+    in_progress_id_set = None
+
+    def __init__(self, location):
+        self.connection = sqlite3.connect(location, check_same_thread=False, isolation_level=None)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS registration ('
+                                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                'url TEXT NOT NULL, '
+                                'data TEXT NOT NULL, '
+                                'location TEXT NOT NULL, '
+                                'attempt_count INTEGER NOT NULL DEFAULT 0, '
+                                'next_attempt_time REAL NOT NULL DEFAULT 0, '
+                                'size INTEGER)')
+        if 'size' not in [row[1] for row in self.connection.execute('PRAGMA table_info(registration)')]:
+            self.connection.execute('ALTER TABLE registration ADD COLUMN size INTEGER')
+        self.in_progress_id_set = set()
+
+    def add(self, url, data, location, size=None):
+        self.connection.execute('INSERT INTO registration (url, data, location, size) VALUES (?, ?, ?, ?)',
+                                (url, json.dumps(data), location, size))
+
+    def claim(self, limit=1):
+        ret = []
+        for row in self.connection.execute('SELECT id, url, data, location, attempt_count, size FROM registration '
+                                           'WHERE next_attempt_time <= ? ORDER BY next_attempt_time, id LIMIT ?',
+                                           (time.time(), len(self.in_progress_id_set) + limit)):
+            if row[0] not in self.in_progress_id_set and (not ret or row[1] == ret[0][1]):
+                self.in_progress_id_set.add(row[0])
+                ret.append(row)
+                if len(ret) >= limit:
+                    break
+        return ret
+
+    def release(self, registration_id):
+        self.in_progress_id_set.discard(registration_id)
+
+    def get_next_attempt_delay(self):
+        row = self.connection.execute('SELECT MIN(next_attempt_time) FROM registration').fetchone()
+        return max(0, row[0] - time.time()) if row[0] is not None else None
+
+    def remove(self, registration_id):
+        self.connection.execute('DELETE FROM registration WHERE id = ?', (registration_id,))
+        self.in_progress_id_set.discard(registration_id)
+
+    def reschedule(self, registration_id, attempt_count, next_attempt_time):
+        self.connection.execute('UPDATE registration SET attempt_count = ?, next_attempt_time = ? WHERE id = ?',
+                                (attempt_count, next_attempt_time, registration_id))
+        self.in_progress_id_set.discard(registration_id)
+
+    def get_pending_count(self):
+        return self.connection.execute('SELECT COUNT(*) FROM registration').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+class RegistrationManager:
+    running = False
+    outbox = None
+    session = None
+    condition = None
+    thread_list = None
+    batch_supported = False
+
+    def __init__(self):
+        self.outbox = RegistrationOutbox(ECCM_OUTBOX_LOCATION)
+        self.session = requests.Session()
+        self.session.headers.update({ECCM_SECRET_HEADER: ECCM_SECRET_VALUE,
+                                     "Content-Type": "application/json; charset=utf-8"})
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=ECCM_REGISTRATION_WORKERS)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.condition = threading.Condition()
+        self.thread_list = []
+        self.batch_supported = ECCM_BATCH_REGISTRATION
+
+    def start(self):
+        self.running = True
+        pending_count = self.outbox.get_pending_count()
+        if pending_count > 0:
+            logging.info(f'{pending_count} PENDING ECCM SERVER REGISTRATIONS')
+        for _ in range(ECCM_REGISTRATION_WORKERS):
+            thread = Thread(target=self.run_worker)
+            thread.start()
+            self.thread_list.append(thread)
+
+    def add(self, url, data, location, size=None):
+        with self.condition:
+            self.outbox.add(url, data, location, size)
+            self.condition.notify()
+
+    def run_worker(self):
+        while self.running:
+            with self.condition:
+                if not self.running:
+                    break
+                registration_list = self.outbox.claim(ECCM_BATCH_SIZE if self.batch_supported else 1)
+                if not registration_list:
+                    delay = self.outbox.get_next_attempt_delay()
+                    self.condition.wait(timeout=min(delay, REGISTRATION_IDLE_WAIT) if delay is not None
+                                        else REGISTRATION_IDLE_WAIT)
+                    continue
+            if len(registration_list) > 1 and registration_list[0][1] in BATCH_LOCATION_DICT:
+                self.post_batch(registration_list)
+            else:
+                for registration in registration_list:
+                    self.post(*registration)
+
+    def send(self, url, data):
+        try:
+            response = self.session.post(f'{ECCM_SERVER_LOCATION}/{url}', data=data.encode('utf-8'),
+                                         timeout=ECCM_REQUEST_TIMEOUT)
+            return response.status_code, None if response.status_code == 200 \
+                else f'HTTP STATUS {response.status_code}'
+        except requests.RequestException as exc:
+            return None, str(exc)
+
+    def post(self, registration_id, url, data, location, attempt_count, size):
+        _, error = self.send(url, data)
+        with self.condition:
+            if error is None:
+                self.outbox.remove(registration_id)
+                logging.info(f'FILE {location} IMPORTED INTO ECCM SERVER')
+                return
+            delay = self.reschedule(registration_id, attempt_count)
+        logging.warning(f'FILE {location} IMPORTATION FAILED ({error}) RETRY IN {delay:.1f} SECONDS')
+
+    def post_batch(self, registration_list):
+        data = json.dumps([dict(json.loads(data), size=size) for _, _, data, _, _, size in registration_list])
+        status_code, error = self.send(BATCH_LOCATION_DICT[registration_list[0][1]], data)
+        with self.condition:
+            if error is None:
+                for registration in registration_list:
+                    self.outbox.remove(registration[0])
+                logging.info(f'{len(registration_list)} FILES IMPORTED INTO ECCM SERVER')
+                return
+            if status_code in BATCH_UNSUPPORTED_STATUS_CODE_LIST:
+                self.batch_supported = False
+                for registration in registration_list:
+                    self.outbox.release(registration[0])
+                self.condition.notify_all()
+                logging.warning(f'BATCH REGISTRATION NOT SUPPORTED BY ECCM SERVER ({error}): FILES IMPORTED ONE BY ONE')
+                return
+            delay = max(self.reschedule(registration[0], registration[4]) for registration in registration_list)
+        logging.warning(f'{len(registration_list)} FILES IMPORTATION FAILED ({error}) RETRY IN {delay:.1f} SECONDS')
+
+    def reschedule(self, registration_id, attempt_count):
+        delay = min(ECCM_RETRY_MAX_DELAY, ECCM_RETRY_INITIAL_DELAY * 2 ** min(attempt_count, 32)) * \
+            random.uniform(0.5, 1)
+        self.outbox.reschedule(registration_id, attempt_count + 1, time.time() + delay)
+        self.condition.notify()
+        return delay
+
+    def terminate(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.thread_list:
+            thread.join()
+        self.outbox.close()
+        self.session.close()
+
+
+class RecordBuffer:
+    capacity = 0
+    policy = None
+    record_list = None
+    start_index = 0
+    count = 0
+    dropped_count = 0
+    spill_file = None
+    spill_count = 0
+    spill_read_position = 0
+    spill_writing = False
+    lock = None
+    spill_lock = None
+    not_empty = None
+    not_full = None
+
+    def __init__(self, capacity, policy):
+        self.capacity = capacity
+        self.policy = policy
+        self.record_list = [None] * (capacity + 1)
+        self.lock = threading.Lock()
+        self.spill_lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+
+    def put(self, record):
+        with self.lock:
+            if self.spill_count == 0 and not self.spill_writing and \
+                    (self.policy != OVERLOAD_POLICY_SPILL or self.count < self.capacity):
+                if record is not None and self.count >= self.capacity:
+                    if self.policy == OVERLOAD_POLICY_BLOCK:
+                        self.not_full.wait_for(lambda: self.count < self.capacity, RECORD_BLOCK_TIMEOUT)
+                    elif self.policy == OVERLOAD_POLICY_DOWNSAMPLE:
+                        self.downsample()
+                    if self.count >= self.capacity:
+                        self.pop()
+                        self.dropped_count = self.dropped_count + 1
+                self.append(record)
+                self.not_empty.notify()
+                return
+            self.spill_writing = True
+        spilled = self.spill(record)
+        with self.lock:
+            self.spill_writing = False
+            if spilled:
+                self.spill_count = self.spill_count + 1
+            elif record is None:
+                self.append(record)
+            else:
+                self.dropped_count = self.dropped_count + 1
+            self.not_empty.notify()
+
+    def get(self, timeout=None):
+        with self.lock:
+            if not self.not_empty.wait_for(lambda: self.count > 0 or self.spill_count > 0, timeout):
+                raise queue.Empty
+            if self.count > 0:
+                return self.take()
+            read_count = min(self.spill_count, self.capacity)
+        unspilled_list = self.unspill(read_count)
+        with self.lock:
+            for record in unspilled_list:
+                self.append(record)
+            self.spill_count = self.spill_count - read_count
+            self.dropped_count = self.dropped_count + read_count - len(unspilled_list)
+            if self.spill_count == 0 and not self.spill_writing:
+                self.close_spill()
+            if self.count == 0:
+                raise queue.Empty
+            return self.take()
+
+    def get_nowait(self):
+        return self.get(0)
+
+    def qsize(self):
+        return self.count + self.spill_count
+
+    def add_dropped_count(self, count):
+        with self.lock:
+            self.dropped_count = self.dropped_count + count
+
+    def append(self, record):
+        self.record_list[(self.start_index + self.count) % len(self.record_list)] = record
+        self.count = self.count + 1
+
+    def pop(self):
+        record = self.record_list[self.start_index]
+        self.record_list[self.start_index] = None
+        self.start_index = (self.start_index + 1) % len(self.record_list)
+        self.count = self.count - 1
+        return record
+
+    def take(self):
+        record = self.pop()
+        self.not_full.notify()
+        return record
+
+    def downsample(self):
+        kept_count = self.count // 2
+        for index in range(self.count):
+            position = (self.start_index + index) % len(self.record_list)
+            if index < kept_count:
+                self.record_list[position] = \
+                    self.record_list[(self.start_index + 2 * index + 1) % len(self.record_list)]
+            else:
+                self.record_list[position] = None
+        self.dropped_count = self.dropped_count + self.count - kept_count
+        self.count = kept_count
+
+    def spill(self, record):
+        data = pickle.dumps(record)
+        with self.spill_lock:
+            try:
+                if self.spill_file is None:
+                    self.spill_file = tempfile.TemporaryFile(dir=RECORD_SPILL_DIRECTORY_LOCATION)
+                    logging.warning('RECORD BUFFER FULL, SPILLING TO DISK')
+                self.spill_file.seek(0, os.SEEK_END)
+                self.spill_file.write(data)
+                return True
+            except OSError as exc:
+                logging.error('RECORD SPILL FAILED')
+                logging.error(f'Error: {exc}')
+                return False
+
+    def unspill(self, read_count):
+        unspilled_list = []
+        with self.spill_lock:
+            try:
+                self.spill_file.seek(self.spill_read_position)
+                while len(unspilled_list) < read_count:
+                    unspilled_list.append(pickle.load(self.spill_file))
+            except (OSError, EOFError, pickle.UnpicklingError) as exc:
+                logging.error('RECORD UNSPILL FAILED')
+                logging.error(f'Error: {exc}')
+            self.spill_read_position = self.spill_file.tell()
+        return unspilled_list
+
+    def close_spill(self):
+        with self.spill_lock:
+            self.spill_file.close()
+            self.spill_file = None
+            self.spill_read_position = 0
+        logging.info('RECORD BUFFER SPILL DRAINED')
 
 
 class FileUpdateManager(Thread):
+    base_filename = None
     filename = None
     running = False
-    first_line_written = False
-    header_overwritten = False
     q = None
     header = None
-
-    def __init__(self, filename, q, header):
-        self.filename = filename
+    file = None
+    segment_index = 0
+    segment_start_time = None
+    segment_start_epoch_time = None
+    closed_segment_list = None
+    last_fsync_time = None
+    write_failed = False
+
+    def __init__(self, base_filename, q, header):
+        self.base_filename = base_filename
+        self.filename = self.get_segment_filename(0)
         self.q = q
         self.header = header
+        self.closed_segment_list = []
         super().__init__()
 
     def run(self):
         self.running = True
-        while self.running:
-            time.sleep(2)
-            if self.first_line_written and not self.header_overwritten:
-                self.override_header()
-                self.header_overwritten = True
-            if not self.q.qsize() == 0:
-                file = open(self.filename, 'a')
-                while not self.q.qsize() == 0:
-                    try:
-                        file.write(self.q.get_nowait())
-                        self.q.task_done()
-                        if not self.first_line_written:
-                            self.first_line_written = True
+        stop_requested = False
+        while not stop_requested:
+            try:
+                record_list = [self.q.get(timeout=1)]
+            except queue.Empty:
+                self.sync_segment()
+                continue
+            while len(record_list) < MONITORING_FILE_WRITE_BATCH_SIZE:
+                try:
+                    record_list.append(self.q.get_nowait())
+                except queue.Empty:
+                    break
+            if None in record_list:
+                stop_requested = True
+                record_list = [record for record in record_list if record is not None]
+            if not record_list:
+                continue
+            try:
+                if self.file is None:
+                    self.open_segment()
+                start_time = time.perf_counter()
+                self.write_records(record_list)
+                RECORD_WRITE_SECONDS.observe(time.perf_counter() - start_time)
+                RECORDS_WRITTEN_TOTAL.inc(len(record_list))
+                if MONITORING_FILE_COMPRESSION_EXTENSION and \
+                        self.file.frame_size >= MONITORING_FILE_COMPRESSION_BLOCK_SIZE:
+                    self.file.end_frame()
+                self.sync_segment()
+                if self.is_segment_full():
+                    self.close_segment()
+                    self.segment_index = self.segment_index + 1
+                    self.filename = self.get_segment_filename(self.segment_index)
+                if self.write_failed:
+                    self.write_failed = False
+                    logging.warning(f'RECORD SEGMENT {self.filename} WRITES RESUMED')
+            except OSError as exc:
+                self.q.add_dropped_count(len(record_list))
+                if not self.write_failed:
+                    self.write_failed = True
+                    logging.error(f'RECORD SEGMENT {self.filename} WRITE FAILED, ROWS DROPPED')
+                    logging.error(f'Error: {exc}')
+        if self.file is not None:
+            try:
+                self.close_segment()
+            except OSError as exc:
+                logging.error(f'RECORD SEGMENT {self.filename} CLOSE FAILED')
+                logging.error(f'Error: {exc}')
+        self.running = False
 
-                    except queue.Empty:
-                        logging.info('file queue already empty')
+    def get_filename_list(self):
+        filename_list = [segment['file'] for segment in list(self.closed_segment_list)]
+        filename = os.path.basename(self.filename)
+        if self.file is not None and filename not in filename_list:
+            filename_list.append(filename)
+        return filename_list
+
+    def get_segment_filename(self, segment_index):
+        if MONITORING_SEGMENT_MAX_SIZE > 0 or MONITORING_SEGMENT_MAX_DURATION > 0:
+            return f'{self.base_filename}_{segment_index:04d}{MONITORING_FILE_EXTENSION}' \
+                   f'{MONITORING_FILE_COMPRESSION_EXTENSION}'
+        return self.base_filename + MONITORING_FILE_EXTENSION + MONITORING_FILE_COMPRESSION_EXTENSION
+
+    def open_file(self):
+        file = open(self.filename, 'wb', buffering=MONITORING_FILE_WRITE_BUFFER_SIZE)
+        if MONITORING_FILE_COMPRESSION_EXTENSION:
+            return trip_format.CompressedFrameWriter(file, MONITORING_FILE_COMPRESSION,
+                                                     MONITORING_FILE_COMPRESSION_LEVEL)
+        return file
+
+    def open_segment(self):
+        self.mark_segment_open()
+        self.file = self.open_file()
+        self.file.write(self.header.encode('utf-8'))
+        self.segment_start_time = time.monotonic()
+        self.segment_start_epoch_time = time.time()
+        self.last_fsync_time = self.segment_start_time
+        logging.info(f'RECORD SEGMENT {self.filename} OPENED')
+
+    def mark_segment_open(self):
+        with open(self.filename + OPEN_SEGMENT_EXTENSION, 'w'):
+            pass
+
+    def write_records(self, record_list):
+        self.file.write(''.join(record_list).encode('utf-8'))
+
+    def close_segment(self):
+        self.file.flush()
+        if MONITORING_FILE_FSYNC_POLICY != FSYNC_POLICY_NEVER:
+            os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+        os.remove(self.filename + OPEN_SEGMENT_EXTENSION)
+        self.closed_segment_list.append({
+            'sequence': self.segment_index,
+            'file': os.path.basename(self.filename),
+            'start_time': self.segment_start_epoch_time,
+            'end_time': time.time(),
+            'size': os.path.getsize(self.filename),
+        })
+        logging.info(f'RECORD SEGMENT {self.filename} CLOSED')
+
+    def sync_segment(self):
+        if self.file is None:
+            return
+        if MONITORING_FILE_FSYNC_POLICY == FSYNC_POLICY_ALWAYS or (
+                MONITORING_FILE_FSYNC_POLICY == FSYNC_POLICY_INTERVAL and
+                time.monotonic() - self.last_fsync_time >= MONITORING_FILE_FSYNC_INTERVAL):
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.last_fsync_time = time.monotonic()
+
+    def is_segment_full(self):
+        if 0 < MONITORING_SEGMENT_MAX_SIZE <= self.file.tell():
+            return True
+        return 0 < MONITORING_SEGMENT_MAX_DURATION <= time.monotonic() - self.segment_start_time
 
-                file.close()
+    def terminate(self):
+        self.q.put(None)
 
-    def override_header(self):
-        with open(self.filename, 'r+') as f:
-            if not f.readline().rstrip('\r\n') == self.header.rstrip('\r\n'):
-                f.seek(0, 0)
-                content = f.read()
-                f.seek(0, 0)
-                f.write(self.header.rstrip('\r\n') + '\n' + content)
 
-    def terminate(self):
-        self.running = False
+class ColumnarFileUpdateManager(FileUpdateManager):
+    writer = None
+
+    def open_segment(self):
+        self.mark_segment_open()
+        self.file = self.open_file()
+        self.writer = self.create_writer()
+        self.segment_start_time = time.monotonic()
+        self.segment_start_epoch_time = time.time()
+        self.last_fsync_time = self.segment_start_time
+        logging.info(f'RECORD SEGMENT {self.filename} OPENED')
+
+    def create_writer(self):
+        column_list, type_list = self.header
+        return trip_format.ColumnarTripWriter(self.file, column_list, type_list, MONITORING_FILE_CHUNK_ROWS)
+
+    def write_records(self, record_list):
+        for record in record_list:
+            self.writer.write_row(record)
+
+    def close_segment(self):
+        self.writer.close()
+        super().close_segment()
+
+
+class DeltaFileUpdateManager(ColumnarFileUpdateManager):
+
+    def create_writer(self):
+        column_list, type_list, deadband_list, resolution_list, linked_column_list = self.header
+        return trip_format.DeltaTripWriter(self.file, column_list, type_list, deadband_list, resolution_list,
+                                           linked_column_list,
+                                           max(1, round(RECORD_KEYFRAME_INTERVAL * RECORDING_SAMPLE_RATE)))
+
+
+def get_trip_id(filename):
+    return filename.split('_', 1)[0].split('.', 1)[0]
+
+
+def recover_record_file(path):
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as file:
+        if trip_format.is_compressed(trip_format.peek_stream(file, len(trip_format.ZSTD_MAGIC))):
+            valid_length = max((frame_end for _, frame_end in trip_format.iter_frames(file)), default=0)
+        elif trip_format.peek_stream(file, len(trip_format.COLUMNAR_MAGIC)) in (trip_format.COLUMNAR_MAGIC,
+                                                                                 trip_format.DELTA_MAGIC):
+            try:
+                valid_length = trip_format.find_valid_length(file)
+            except (ValueError, struct.error) as exc:
+                logging.error(f'RECORD FILE {path} NOT RECOVERED, LEFT IN PLACE')
+                logging.error(f'Error: {exc}')
+                return
+        else:
+            valid_length = 0
+            position = size
+            while position > 0:
+                position = max(0, position - RECOVERY_READ_SIZE)
+                file.seek(position)
+                content = file.read(min(RECOVERY_READ_SIZE, size - position))
+                index = content.rfind(b'\n')
+                if index >= 0:
+                    valid_length = position + index + 1
+                    break
+        if valid_length < size:
+            file.truncate(valid_length)
+            logging.warning(f'TORN RECORD REMOVED FROM {path} ({size - valid_length} BYTES)')
+    if valid_length == 0:
+        os.remove(path)
+        logging.warning(f'EMPTY RECORD FILE {path} REMOVED')
+
+
+def recover_record_files():
+    for filename in os.listdir(RECORD_DIRECTORY_LOCATION):
+        if filename.endswith(OPEN_SEGMENT_EXTENSION):
+            path = os.path.join(RECORD_DIRECTORY_LOCATION, filename[:-len(OPEN_SEGMENT_EXTENSION)])
+            try:
+                if os.path.exists(path):
+                    recover_record_file(path)
+                os.remove(path + OPEN_SEGMENT_EXTENSION)
+            except (OSError, ValueError) as exc:
+                logging.error(f'FILE {filename} RECOVERY FAILED')
+                logging.error(f'Error: {exc}')
+
+
+def normalize_command_string(command_string):
+    if isinstance(command_string, bytes):
+        command_string = command_string.decode(errors='ignore')
+    command_string = command_string.replace(' ', '').upper()
+    return command_string[:-1] if len(command_string) % 2 else command_string
+
+
+class CaptureWriter:
+    file = None
+    lock = None
+    start_time = None
+
+    def __init__(self, location):
+        self.file = open(location, 'a', buffering=1)
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+
+    def write(self, entry):
+        entry['time'] = time.monotonic() - self.start_time
+        with self.lock:
+            self.file.write(json.dumps(entry) + '\n')
+
+    def capture_obd_connection(self, obd_connection):
+        self.write({
+            'type': CAPTURE_HEADER_TYPE,
+            'protocol_id': obd_connection.protocol_id(),
+            'supported_command_list': sorted(command.name for command in obd_connection.supported_commands),
+        })
+        obd_connection.interface = CapturingInterface(obd_connection.interface, self)
+
+    def capture_gnss_data(self, data):
+        self.write({'type': CAPTURE_GNSS_TYPE, 'data': data})
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class CapturingInterface:
+    interface = None
+    capture_writer = None
+
+    def __init__(self, interface, capture_writer):
+        self.interface = interface
+        self.capture_writer = capture_writer
+
+    def send_and_parse(self, command_string):
+        start_time = time.monotonic()
+        message_list = self.interface.send_and_parse(command_string)
+        command_string = normalize_command_string(command_string)
+        if not command_string.startswith('AT'):
+            self.capture_writer.write({
+                'type': CAPTURE_OBD_TYPE,
+                'command': command_string,
+                'duration': time.monotonic() - start_time,
+                'message_list': [[message.ecu, bytes(message.data).hex()] for message in message_list or []],
+            })
+        return message_list
+
+    def __getattr__(self, name):
+        return getattr(self.interface, name)
+
+
+class ReplayCapture:
+    protocol_id = None
+    supported_command_list = None
+    pid_timeline_dict = None
+    command_timeline_dict = None
+    gnss_entry_list = None
+    duration = 0
+    start_time = None
+    lock = None
+
+    def __init__(self, location):
+        self.supported_command_list = []
+        self.pid_timeline_dict = {}
+        self.command_timeline_dict = {}
+        self.gnss_entry_list = []
+        self.lock = threading.Lock()
+        with open(location) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.add_entry(entry)
+        logging.info(f'REPLAY CAPTURE {location} LOADED ({self.duration:.1f} SECONDS)')
+
+    def add_entry(self, entry):
+        self.duration = max(self.duration, entry['time'])
+        if entry['type'] == CAPTURE_HEADER_TYPE:
+            self.protocol_id = entry['protocol_id']
+            self.supported_command_list = [obd.commands[name] for name in entry['supported_command_list']
+                                           if obd.commands.has_name(name)]
+        elif entry['type'] == CAPTURE_GNSS_TYPE:
+            self.gnss_entry_list.append((entry['time'], entry['data']))
+        elif entry['type'] == CAPTURE_OBD_TYPE:
+            message_list = [(ecu, bytes.fromhex(data)) for ecu, data in entry['message_list']]
+            value = (entry['duration'], message_list)
+            self.add_timeline_value(self.command_timeline_dict, entry['command'], entry['time'], value)
+            if entry['command'].startswith('01') and message_list:
+                for pid, chunk_list in self.split_pid_chunks(message_list).items():
+                    self.add_timeline_value(self.pid_timeline_dict, pid, entry['time'],
+                                            (entry['duration'], chunk_list))
+
+    @staticmethod
+    def add_timeline_value(timeline_dict, key, entry_time, value):
+        time_list, value_list = timeline_dict.setdefault(key, ([], []))
+        time_list.append(entry_time)
+        value_list.append(value)
+
+    @staticmethod
+    def split_pid_chunks(message_list):
+        ret = {}
+        for ecu, data in message_list:
+            index = 1
+            while len(data) > 0 and data[0] == 0x41 and index < len(data):
+                command = obd.commands[1][data[index]] if data[index] < len(obd.commands[1]) else None
+                if command is None or index + command.bytes - 1 > len(data):
+                    break
+                ret.setdefault(data[index], []).append((ecu, data[index:index + command.bytes - 1]))
+                index = index + command.bytes - 1
+        return ret
+
+    def get_time(self):
+        with self.lock:
+            if self.start_time is None:
+                self.start_time = time.monotonic()
+        return (time.monotonic() - self.start_time) * REPLAY_SPEED
+
+    def get_loop_time(self):
+        return self.get_time() % self.duration if self.duration > 0 else 0
+
+    @staticmethod
+    def get_timeline_value(timeline_dict, key, replay_time):
+        timeline = timeline_dict.get(key)
+        if timeline is None:
+            return None
+        return timeline[1][max(0, bisect.bisect_right(timeline[0], replay_time) - 1)]
+
+
+class ReplayOBDConnection:
+    replay_capture = None
+    supported_commands = None
+    random = None
+
+    def __init__(self, replay_capture):
+        self.replay_capture = replay_capture
+        self.interface = self
+        self.supported_commands = set(replay_capture.supported_command_list)
+        self.random = random.Random(REPLAY_SEED)
+
+    def protocol_id(self):
+        return self.replay_capture.protocol_id
+
+    @staticmethod
+    def status():
+        return utils.OBDStatus.CAR_CONNECTED
+
+    @staticmethod
+    def is_connected():
+        return True
+
+    def close(self):
+        pass
+
+    def supports(self, command):
+        return command in self.supported_commands
+
+    def query(self, command, force=False):
+        if not force and not self.supports(command):
+            return obd.OBDResponse()
+        message_list = self.send_and_parse(command.command)
+        return command(message_list) if message_list else obd.OBDResponse()
+
+    def send_and_parse(self, command_string):
+        command_string = normalize_command_string(command_string)
+        if command_string.startswith('AT'):
+            return []
+        replay_time = self.replay_capture.get_loop_time()
+        value = ReplayCapture.get_timeline_value(self.replay_capture.command_timeline_dict, command_string,
+                                                 replay_time)
+        if value is None and command_string.startswith('01'):
+            value = self.get_pid_value(command_string, replay_time)
+        duration, message_list = value if value is not None else (0, [])
+        time.sleep((duration / REPLAY_SPEED) if REPLAY_LATENCY is None else REPLAY_LATENCY)
+        if self.random.random() < REPLAY_DROPOUT_RATE:
+            return []
+        ret = []
+        for ecu, data in message_list:
+            message = obd.protocols.protocol.Message([])
+            message.ecu = ecu
+            message.data = bytearray(data)
+            ret.append(message)
+        return ret
+
+    def get_pid_value(self, command_string, replay_time):
+        data_dict = {}
+        duration = 0
+        for index in range(2, len(command_string), 2):
+            value = ReplayCapture.get_timeline_value(self.replay_capture.pid_timeline_dict,
+                                                     int(command_string[index:index + 2], 16), replay_time)
+            if value is None:
+                continue
+            duration = max(duration, value[0])
+            for ecu, chunk in value[1]:
+                data_dict.setdefault(ecu, bytearray([0x41])).extend(chunk)
+        return (duration, list(data_dict.items())) if data_dict else None
+
+
+class ReplayGNSSSocket:
+    replay_capture = None
+    closed = False
+    random = None
+
+    def __init__(self, replay_capture):
+        self.replay_capture = replay_capture
+        self.random = random.Random(REPLAY_SEED)
+
+    def __iter__(self):
+        entry_list = self.replay_capture.gnss_entry_list
+        loop_index = 0
+        while entry_list and not self.closed:
+            for entry_time, data in entry_list:
+                delivery_time = loop_index * self.replay_capture.duration + entry_time + (REPLAY_LATENCY or 0)
+                while not self.closed and self.replay_capture.get_time() < delivery_time:
+                    time.sleep(min(REPLAY_WAIT_STEP, (delivery_time - self.replay_capture.get_time()) / REPLAY_SPEED))
+                    yield None
+                if self.closed:
+                    return
+                if self.random.random() >= REPLAY_DROPOUT_RATE:
+                    yield data
+            loop_index = loop_index + 1
+
+    def close(self):
+        self.closed = True
 
 
 class GNSSManager(Thread):
     gpsd_socket = None
     data_stream = None
-    latitude = None
-    longitude = None
-    altitude = None
-    track = None
-    speed = None
+    capture_writer = None
+    fix_history = None
+    last_fix_time_string = None
     stop_flag = False
+    tpv_key_list = ['lat', 'lon', 'alt', 'speed', 'track']
+    track_index = 4
+    time_key = 'time'
 
-    def __init__(self):
+    def __init__(self, gpsd_socket=None, capture_writer=None):
         super().__init__()
         if GPS_POSITION_MONITORING:
-            self.gpsd_socket = gps3.GPSDSocket()
+            self.gpsd_socket = gpsd_socket
             self.data_stream = gps3.DataStream()
-            self.gpsd_socket.connect()
-            self.gpsd_socket.watch()
+            self.capture_writer = capture_writer
+        self.fix_history = SampleHistory(self.tpv_key_list + [self.time_key], GNSS_FIX_BUFFER_SIZE)
 
     def run(self):
         if GPS_POSITION_MONITORING:
             for new_data in self.gpsd_socket:
                 if new_data:
+                    if self.capture_writer is not None:
+                        self.capture_writer.capture_gnss_data(new_data)
                     self.data_stream.unpack(new_data)
-                    self.altitude = self.data_stream.TPV['alt']
-                    self.longitude = self.data_stream.TPV['lon']
-                    self.latitude = self.data_stream.TPV['lat']
-                    self.track = self.data_stream.TPV['track']
-                    self.speed = self.data_stream.TPV['speed']
+                    self.add_fix(self.data_stream.TPV)
                 if self.stop_flag:
                     break
 
-    def get_data_for_header_name(self, header):
-        switch = {
-            'GPS LATITUDE (degree)': self.latitude,
-            'GPS LONGITUDE (degree)': self.longitude,
-            'GPS ALTITUDE (meter)': self.altitude,
-            'GPS SPEED (meter per second)': self.speed,
-            'GPS TRACK (degree)': self.track
-        }
-        return switch.get(header, None)
+    def add_fix(self, tpv):
+        if tpv['time'] == self.last_fix_time_string or tpv['time'] == 'n/a':
+            return
+        self.last_fix_time_string = tpv['time']
+        self.fix_history.append(time.monotonic_ns() - int(GNSS_RECEIVER_LATENCY * 1000000000),
+                                [trip_format.encode_float(tpv[key]) for key in self.tpv_key_list] +
+                                [trip_format.encode_float(self.parse_fix_time(tpv['time']))])
+
+    @staticmethod
+    def parse_fix_time(time_string):
+        for time_format in GNSS_TIME_FORMAT_LIST:
+            try:
+                fix_time = datetime.datetime.strptime(time_string, time_format).replace(tzinfo=datetime.timezone.utc)
+            except (TypeError, ValueError):
+                continue
+            return (fix_time - datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)) // \
+                datetime.timedelta(microseconds=1)
+        return None
+
+    def get_fix(self, sample_time):
+        max_age = int(GNSS_FIX_MAX_AGE * 1000000000)
+        time_array, value_array = self.fix_history.get_window(self.tpv_key_list, sample_time - max_age,
+                                                              sample_time + max_age)
+        if len(time_array) == 0:
+            return [None for _ in self.tpv_key_list]
+        index = numpy.searchsorted(time_array, sample_time)
+        if len(time_array) == 1 or index == 0:
+            return SampleHistory.to_list(value_array[0 if index == 0 else -1])
+        index = min(index, len(time_array) - 1)
+        previous_time = time_array[index - 1]
+        duration = time_array[index] - previous_time
+        extrapolation = min(duration, int(GNSS_MAX_EXTRAPOLATION * 1000000000))
+        factor = min(sample_time - previous_time, duration + extrapolation) / duration if duration > 0 else 1
+        difference_array = value_array[index] - value_array[index - 1]
+        difference_array[self.track_index] = (difference_array[self.track_index] + 180) % 360 - 180
+        ret = value_array[index - 1] + difference_array * factor
+        ret[self.track_index] = ret[self.track_index] % 360
+        return SampleHistory.to_list(ret)
+
+    def get_fix_list(self, start_time, end_time):
+        time_array, value_array = self.fix_history.get_window(self.tpv_key_list + [self.time_key], start_time,
+                                                              end_time)
+        return [[fix_time] + SampleHistory.to_list(fix_value_array)
+                for fix_time, fix_value_array in zip(time_array.tolist(), value_array)]
 
     def terminate(self):
         self.stop_flag = True
         self.gpsd_socket.close()
 
 
-class DataManager(Thread):
+def split_batch_response(command_list, message_list):
+    command_dict = {command.pid: command for command in command_list}
+    command_message_dict = {command: [] for command in command_list}
+    for message in message_list:
+        data = message.data
+        if len(data) < 2 or data[0] != 0x41:
+            continue
+        index = 1
+        while index < len(data):
+            command = command_dict.get(data[index])
+            if command is None:
+                break
+            end = index + command.bytes - 1
+            if end > len(data):
+                break
+            command_message = copy.copy(message)
+            command_message.data = bytearray([0x41]) + data[index:end]
+            command_message_dict[command].append(command_message)
+            index = end
+    return {command: command(command_message_list) if command_message_list else obd.OBDResponse()
+            for command, command_message_list in command_message_dict.items()}
+
+
+class PollingEntry:
+    command = None
+    rate_class = NORMAL_RATE_CLASS
+    base_period = None
+    period = None
+    next_due = 0
+    unchanged_count = 0
+    removed = False
+
+    def __init__(self, command, rate_class, base_period):
+        self.command = command
+        self.rate_class = rate_class
+        self.base_period = base_period
+        self.period = base_period
+
+
+class PollingScheduler(Thread):
     obd_connection = None
+    entry_dict = None
+    latest_dict = None
+    heap = None
+    bus_lock = None
+    stop_event = None
+    sequence = 0
+    batch_enabled = False
+    batch_failure_count = 0
+    response_count = 0
+    added_command_queue = None
+
+    def __init__(self, obd_connection, command_list):
+        super().__init__()
+        self.obd_connection = obd_connection
+        self.batch_enabled = OBD_BATCH_REQUESTS and obd_connection.protocol_id() in CAN_PROTOCOL_ID_LIST
+        self.entry_dict = {}
+        self.latest_dict = {}
+        self.heap = []
+        self.bus_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.added_command_queue = queue.SimpleQueue()
+        for command in command_list:
+            self.create_entry(command)
+
+    def create_entry(self, command):
+        rate_class = self.get_rate_class(command)
+        entry = PollingEntry(command, rate_class, self.get_rate_class_period(rate_class))
+        entry.next_due = time.monotonic()
+        self.entry_dict[command] = entry
+        self.push_entry(entry)
+
+    def add_command(self, command):
+        self.added_command_queue.put(command)
+
+    def remove_command(self, command):
+        entry = self.entry_dict.get(command)
+        if entry is not None:
+            entry.removed = True
+
+    @staticmethod
+    def get_rate_class(command):
+        if command.name in OBD_HIGH_RATE_COMMANDS:
+            return HIGH_RATE_CLASS
+        if command.name in OBD_ONCE_COMMANDS:
+            return ONCE_RATE_CLASS
+        if command.name in OBD_SLOW_RATE_COMMANDS:
+            return SLOW_RATE_CLASS
+        return NORMAL_RATE_CLASS
+
+    @staticmethod
+    def get_rate_class_period(rate_class):
+        switch = {
+            HIGH_RATE_CLASS: OBD_HIGH_RATE_PERIOD,
+            NORMAL_RATE_CLASS: OBD_NORMAL_RATE_PERIOD,
+            SLOW_RATE_CLASS: OBD_SLOW_RATE_PERIOD,
+            ONCE_RATE_CLASS: OBD_SLOW_RATE_PERIOD
+        }
+        return switch.get(rate_class, OBD_NORMAL_RATE_PERIOD)
+
+    def push_entry(self, entry):
+        self.sequence = self.sequence + 1
+        heapq.heappush(self.heap, (entry.next_due, entry.rate_class, self.sequence, entry))
+
+    def run(self):
+        logging.info(f'POLLING SCHEDULER STARTED WITH {len(self.entry_dict)} COMMANDS')
+        while not self.stop_event.is_set():
+            while not self.added_command_queue.empty():
+                command = self.added_command_queue.get()
+                if command not in self.entry_dict or self.entry_dict[command].removed:
+                    self.create_entry(command)
+            if not self.heap:
+                self.stop_event.wait(1)
+                continue
+            next_due, _, _, entry = self.heap[0]
+            delay = next_due - time.monotonic()
+            if delay > 0:
+                self.stop_event.wait(min(delay, 1))
+                continue
+            heapq.heappop(self.heap)
+            if entry.removed:
+                continue
+            try:
+                if self.batch_enabled and self.is_batchable(entry.command):
+                    self.poll_entry_batch(entry)
+                else:
+                    self.poll_entry(entry, *self.query_timed(entry.command))
+            except Exception as exc:
+                logging.error(f'OBD POLLING FAILED FOR {entry.command.name}')
+                logging.error(f'Error: {exc}')
+                entry.next_due = time.monotonic() + entry.period
+                self.push_entry(entry)
+        logging.info('POLLING SCHEDULER STOPPED')
+
+    @staticmethod
+    def is_batchable(command):
+        return command.mode == 1 and command.pid is not None and command.bytes > 2 and \
+            command.header == obd.protocols.ECU_HEADER.ENGINE
+
+    def poll_entry_batch(self, entry):
+        entry_list = [entry]
+        deferred_entry_list = []
+        limit = time.monotonic() + OBD_BATCH_LOOKAHEAD
+        while self.heap and len(entry_list) < OBD_BATCH_MAX_COMMANDS and self.heap[0][0] <= limit:
+            _, _, _, other_entry = heapq.heappop(self.heap)
+            if other_entry.removed:
+                continue
+            if self.is_batchable(other_entry.command):
+                entry_list.append(other_entry)
+            else:
+                deferred_entry_list.append(other_entry)
+        for other_entry in deferred_entry_list:
+            self.push_entry(other_entry)
+
+        if len(entry_list) == 1:
+            self.poll_entry(entry, *self.query_timed(entry.command))
+            return
+
+        start_time = time.monotonic_ns()
+        response_dict = self.query_batch([batch_entry.command for batch_entry in entry_list])
+        timestamp = (start_time + time.monotonic_ns()) // 2
+        if all(response.is_null() for response in response_dict.values()):
+            self.batch_failure_count = self.batch_failure_count + 1
+            if self.batch_failure_count >= OBD_BATCH_FAILURE_LIMIT:
+                self.batch_enabled = False
+                logging.warning('MULTI COMMAND REQUESTS REJECTED BY ECU: FALLBACK TO SINGLE COMMAND REQUESTS')
+        else:
+            self.batch_failure_count = 0
+
+        for batch_entry in entry_list:
+            response = response_dict[batch_entry.command]
+            if response.is_null():
+                self.poll_entry(batch_entry, *self.query_timed(batch_entry.command))
+            else:
+                self.poll_entry(batch_entry, response, timestamp)
+
+    def query_batch(self, command_list):
+        command_string = b'01' + b''.join(command.command[2:] for command in command_list)
+        with self.bus_lock:
+            start_time = time.perf_counter()
+            message_list = self.obd_connection.interface.send_and_parse(command_string)
+            OBD_BATCH_QUERY_SECONDS.get(len(command_list)).observe(time.perf_counter() - start_time)
+        return split_batch_response(command_list, message_list or [])
+
+    def query_timed(self, command):
+        start_time = time.monotonic_ns()
+        response = self.query_now(command)
+        return response, (start_time + time.monotonic_ns()) // 2
+
+    def poll_entry(self, entry, response, timestamp):
+        if not response.is_null():
+            self.response_count = self.response_count + 1
+            previous_response = self.get_latest(entry.command)[0]
+            self.latest_dict[entry.command] = (response, timestamp)
+            if entry.rate_class == ONCE_RATE_CLASS:
+                return
+            self.adapt_period(entry, previous_response, response)
+        entry.next_due = time.monotonic() + entry.period
+        self.push_entry(entry)
+
+    @staticmethod
+    def adapt_period(entry, previous_response, response):
+        if previous_response is not None and previous_response.value == response.value:
+            entry.unchanged_count = entry.unchanged_count + 1
+            if entry.unchanged_count >= OBD_ADAPTIVE_UNCHANGED_COUNT:
+                entry.unchanged_count = 0
+                entry.period = min(entry.period * 2, entry.base_period * OBD_ADAPTIVE_MAX_FACTOR)
+        else:
+            entry.unchanged_count = 0
+            entry.period = entry.base_period
+
+    def query_now(self, command, force=False):
+        with self.bus_lock:
+            start_time = time.perf_counter()
+            response = self.obd_connection.query(command, force=force)
+            OBD_QUERY_SECONDS.get(command.name).observe(time.perf_counter() - start_time)
+        if response.is_null():
+            OBD_NULL_RESPONSES_TOTAL.get(command.name).inc()
+        return response
+
+    def get_latest(self, command):
+        return self.latest_dict.get(command, (None, None))
+
+    def get_response(self, command):
+        response = self.get_latest(command)[0]
+        return response if response is not None else obd.OBDResponse()
+
+    def get_timestamp(self, command):
+        return self.get_latest(command)[1]
+
+    def terminate(self):
+        self.stop_event.set()
+
+
+def load_capability_cache():
+    if not os.path.exists(OBD_CAPABILITY_CACHE_LOCATION):
+        return {}
+    try:
+        with open(OBD_CAPABILITY_CACHE_LOCATION, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError) as exc:
+        logging.warning('UNABLE TO READ OBD CAPABILITY CACHE')
+        logging.warning(f'Error: {exc}')
+        return {}
+
+
+def save_capability_cache(capability_cache):
+    temporary_location = OBD_CAPABILITY_CACHE_LOCATION + '.tmp'
+    try:
+        with open(temporary_location, 'w') as file:
+            json.dump(capability_cache, file, indent=2)
+        os.replace(temporary_location, OBD_CAPABILITY_CACHE_LOCATION)
+    except OSError as exc:
+        logging.warning('UNABLE TO WRITE OBD CAPABILITY CACHE')
+        logging.warning(f'Error: {exc}')
+
+
+class CapabilityValidator(Thread):
+    main_manager = None
+    vehicle_key = None
+    probe_unsupported = False
+    stop_event = None
+
+    def __init__(self, main_manager_, vehicle_key, probe_unsupported):
+        super().__init__()
+        self.main_manager = main_manager_
+        self.vehicle_key = vehicle_key
+        self.probe_unsupported = probe_unsupported
+        self.stop_event = threading.Event()
+
+    def run(self):
+        supported_status_list = self.get_supported_list(self.main_manager.status_list,
+                                                        self.main_manager.supported_status_list)
+        supported_command_list = self.get_supported_list(self.main_manager.command_list,
+                                                         self.main_manager.supported_command_list)
+        if self.stop_event.is_set():
+            return
+        self.main_manager.apply_capabilities(supported_status_list, supported_command_list)
+        capability_cache = load_capability_cache()
+        update_time = time.time() if self.probe_unsupported else \
+            capability_cache.get(self.vehicle_key, {}).get('update_time', 0)
+        capability_cache[self.vehicle_key] = {
+            'update_time': update_time,
+            'supported_status_list': [command.name for command in supported_status_list],
+            'unsupported_status_list': [command.name for command in self.main_manager.status_list
+                                        if command not in supported_status_list],
+            'supported_command_list': [command.name for command in supported_command_list],
+            'unsupported_command_list': [command.name for command in self.main_manager.command_list
+                                         if command not in supported_command_list],
+        }
+        save_capability_cache(capability_cache)
+        logging.info(f'OBD CAPABILITIES OF {self.vehicle_key} VALIDATED')
+
+    def get_supported_list(self, command_list, current_supported_list):
+        ret = []
+        for command in command_list:
+            if self.stop_event.is_set():
+                return ret
+            if self.main_manager.obd_connection.supports(command):
+                ret.append(command)
+            elif not self.probe_unsupported:
+                if command in current_supported_list:
+                    ret.append(command)
+            else:
+                self.stop_event.wait(OBD_CAPABILITY_PROBE_INTERVAL)
+                polling_scheduler = self.main_manager.polling_scheduler
+                if polling_scheduler is None:
+                    return ret
+                response = polling_scheduler.query_now(command, force=True)
+                if response.is_null():
+                    logging.info('UNSUPPORTED OBD COMMAND: ' + str(command))
+                else:
+                    logging.info('OBD COMMAND ANSWERED ALTHOUGH NOT ADVERTISED: ' + str(command))
+                    ret.append(command)
+        return ret
+
+    def terminate(self):
+        self.stop_event.set()
+
+
+class SampleHistory:
+    label_list = None
+    label_index_dict = None
+    time_array = None
+    value_array = None
+    next_index = 0
+    count = 0
+    lock = None
+
+    def __init__(self, label_list, capacity):
+        self.label_list = list(label_list)
+        self.label_index_dict = {label: index for index, label in enumerate(self.label_list)}
+        self.time_array = numpy.zeros(capacity, dtype=numpy.int64)
+        self.value_array = numpy.full((capacity, len(self.label_list)), numpy.nan)
+        self.lock = threading.Lock()
+
+    def append(self, sample_time, value_array):
+        with self.lock:
+            self.time_array[self.next_index] = sample_time
+            self.value_array[self.next_index] = value_array
+            self.next_index = (self.next_index + 1) % len(self.time_array)
+            self.count = min(self.count + 1, len(self.time_array))
+
+    def get_window(self, label_list, start_time, end_time):
+        column_list = [self.label_index_dict[label] for label in label_list]
+        with self.lock:
+            index_array = (numpy.arange(self.count) + self.next_index - self.count) % len(self.time_array)
+            time_array = self.time_array[index_array]
+            value_array = self.value_array[numpy.ix_(index_array, column_list)]
+        mask = (time_array >= start_time) & (time_array <= end_time)
+        return time_array[mask], value_array[mask]
+
+    def get_aggregates(self, label_list, start_time, end_time, bucket_count):
+        time_array, value_array = self.get_window(label_list, start_time, end_time)
+        bucket_duration = max(1, (end_time - start_time) // bucket_count)
+        bucket_array = numpy.minimum((time_array - start_time) // bucket_duration, bucket_count - 1)
+        boundary_array = numpy.searchsorted(bucket_array, numpy.arange(bucket_count + 1))
+        min_array = numpy.full((bucket_count, len(label_list)), numpy.nan)
+        max_array = numpy.full((bucket_count, len(label_list)), numpy.nan)
+        mean_array = numpy.full((bucket_count, len(label_list)), numpy.nan)
+        for bucket in range(bucket_count):
+            bucket_value_array = value_array[boundary_array[bucket]:boundary_array[bucket + 1]]
+            if len(bucket_value_array) == 0:
+                continue
+            valid_count_array = numpy.count_nonzero(~numpy.isnan(bucket_value_array), axis=0)
+            min_array[bucket] = numpy.fmin.reduce(bucket_value_array, axis=0)
+            max_array[bucket] = numpy.fmax.reduce(bucket_value_array, axis=0)
+            numpy.divide(numpy.nansum(bucket_value_array, axis=0), valid_count_array, out=mean_array[bucket],
+                         where=valid_count_array > 0)
+        return start_time + numpy.arange(bucket_count) * bucket_duration, min_array, max_array, mean_array
+
+    @staticmethod
+    def to_list(array):
+        return [None if math.isnan(value) else value for value in array.tolist()]
+
+
+class TripStatistics:
+    label_list = None
+    label_index_dict = None
+    latitude_label = None
+    longitude_label = None
+    count_array = None
+    min_array = None
+    max_array = None
+    sum_array = None
+    sample_array = None
+    start_time = None
+    previous_time = None
+    previous_value_array = None
+    sample_count = 0
+    duration = 0
+    fuel_used = 0
+    idle_duration = 0
+    speed_distance = 0
+    gnss_distance = 0
+
+    def __init__(self, label_list, latitude_label, longitude_label):
+        self.label_list = list(label_list)
+        self.label_index_dict = {label: index for index, label in enumerate(self.label_list)}
+        self.latitude_label = latitude_label
+        self.longitude_label = longitude_label
+        self.count_array = numpy.zeros(len(self.label_list), dtype=numpy.int64)
+        self.min_array = numpy.full(len(self.label_list), numpy.nan)
+        self.max_array = numpy.full(len(self.label_list), numpy.nan)
+        self.sum_array = numpy.zeros(len(self.label_list))
+        self.sample_array = numpy.full((TRIP_STATISTICS_SAMPLE_SIZE, len(self.label_list)), numpy.nan)
+
+    def update(self, sample_time, value_array):
+        valid_array = ~numpy.isnan(value_array)
+        self.count_array += valid_array
+        numpy.fmin(self.min_array, value_array, out=self.min_array)
+        numpy.fmax(self.max_array, value_array, out=self.max_array)
+        self.sum_array += numpy.where(valid_array, value_array, 0)
+        sample_index_array = numpy.where(self.count_array <= TRIP_STATISTICS_SAMPLE_SIZE, self.count_array - 1,
+                                         (numpy.random.random(len(self.label_list)) * self.count_array)
+                                         .astype(numpy.int64))
+        kept_array = valid_array & (sample_index_array < TRIP_STATISTICS_SAMPLE_SIZE)
+        self.sample_array[sample_index_array[kept_array], numpy.flatnonzero(kept_array)] = value_array[kept_array]
+        self.sample_count = self.sample_count + 1
+        if self.previous_time is None:
+            self.start_time = sample_time
+        else:
+            self.update_integrals((sample_time - self.previous_time) / 1000000000, value_array)
+        self.duration = (sample_time - self.start_time) / 1000000000
+        self.previous_time = sample_time
+        self.previous_value_array = value_array
+
+    def update_integrals(self, duration, value_array):
+        fuel_rate = self.get_average(self.get_fuel_rate(self.previous_value_array), self.get_fuel_rate(value_array))
+        if not math.isnan(fuel_rate):
+            self.fuel_used = self.fuel_used + fuel_rate * duration / 3600
+        speed = self.get_average(self.get_value(self.previous_value_array, 'SPEED'),
+                                 self.get_value(value_array, 'SPEED'))
+        if not math.isnan(speed):
+            self.speed_distance = self.speed_distance + speed * duration / 3600
+        if self.get_value(self.previous_value_array, 'RPM') > 0 and \
+                self.get_value(self.previous_value_array, 'SPEED') < IDLE_SPEED_THRESHOLD:
+            self.idle_duration = self.idle_duration + duration
+        self.gnss_distance = self.gnss_distance + self.get_gnss_distance(self.previous_value_array, value_array)
+
+    def get_value(self, value_array, label):
+        index = self.label_index_dict.get(label)
+        return value_array[index] if index is not None else math.nan
+
+    def get_fuel_rate(self, value_array):
+        fuel_rate = self.get_value(value_array, 'FUEL_RATE')
+        if math.isnan(fuel_rate):
+            fuel_rate = self.get_value(value_array, 'MAF') * 3600 / (FUEL_AIR_RATIO * FUEL_DENSITY)
+        return fuel_rate
+
+    @staticmethod
+    def get_average(previous_value, value):
+        if math.isnan(previous_value):
+            return value
+        if math.isnan(value):
+            return previous_value
+        return (previous_value + value) / 2
+
+    def get_gnss_distance(self, previous_value_array, value_array):
+        previous_latitude = math.radians(self.get_value(previous_value_array, self.latitude_label))
+        previous_longitude = math.radians(self.get_value(previous_value_array, self.longitude_label))
+        latitude = math.radians(self.get_value(value_array, self.latitude_label))
+        longitude = math.radians(self.get_value(value_array, self.longitude_label))
+        if math.isnan(previous_latitude + previous_longitude + latitude + longitude):
+            return 0
+        haversine = math.sin((latitude - previous_latitude) / 2) ** 2 + \
+            math.cos(previous_latitude) * math.cos(latitude) * math.sin((longitude - previous_longitude) / 2) ** 2
+        return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(haversine)))
+
+    def generate_command_dict(self):
+        ret = {}
+        for index, label in enumerate(self.label_list):
+            count = int(self.count_array[index])
+            if count == 0:
+                continue
+            sample_array = self.sample_array[:min(count, TRIP_STATISTICS_SAMPLE_SIZE), index]
+            ret[label] = {
+                'count': count,
+                'min': float(self.min_array[index]),
+                'max': float(self.max_array[index]),
+                'mean': float(self.sum_array[index] / count),
+                'percentiles': {
+                    f'{percentile:g}': float(value) for percentile, value in
+                    zip(TRIP_STATISTICS_PERCENTILE_LIST,
+                        numpy.percentile(sample_array, TRIP_STATISTICS_PERCENTILE_LIST))
+                },
+            }
+        return ret
+
+    def generate_dict(self):
+        return {
+            'sample_count': self.sample_count,
+            'duration': self.duration,
+            'fuel_used': self.fuel_used,
+            'idle_duration': self.idle_duration,
+            'speed_distance': self.speed_distance,
+            'gnss_distance': self.gnss_distance / 1000,
+            'commands': self.generate_command_dict(),
+        }
+
+
+class TrackSimplifier:
+    tolerance = None
+    max_window = None
+    anchor = None
+    candidate_list = None
+    x_array = None
+    y_array = None
+
+    def __init__(self, tolerance, max_window):
+        self.tolerance = tolerance
+        self.max_window = max(1, max_window)
+        self.candidate_list = []
+        self.x_array = numpy.zeros(self.max_window + 1)
+        self.y_array = numpy.zeros(self.max_window + 1)
+
+    def add(self, fix):
+        if fix[1] is None or fix[2] is None:
+            return []
+        if self.anchor is None:
+            self.anchor = fix
+            return [fix]
+        ret = []
+        x, y = self.project(fix)
+        if self.candidate_list and (len(self.candidate_list) >= self.max_window or not self.is_within_tolerance(x, y)):
+            self.anchor = self.candidate_list[-1]
+            self.candidate_list = []
+            ret.append(self.anchor)
+            x, y = self.project(fix)
+        self.x_array[len(self.candidate_list)] = x
+        self.y_array[len(self.candidate_list)] = y
+        self.candidate_list.append(fix)
+        return ret
+
+    def flush(self):
+        if not self.candidate_list:
+            return []
+        self.anchor = self.candidate_list[-1]
+        self.candidate_list = []
+        return [self.anchor]
+
+    def project(self, fix):
+        return (math.radians(fix[2] - self.anchor[2]) * EARTH_RADIUS * math.cos(math.radians(self.anchor[1])),
+                math.radians(fix[1] - self.anchor[1]) * EARTH_RADIUS)
+
+    def is_within_tolerance(self, x, y):
+        x_array = self.x_array[:len(self.candidate_list)]
+        y_array = self.y_array[:len(self.candidate_list)]
+        length = x * x + y * y
+        factor_array = numpy.clip((x_array * x + y_array * y) / length, 0, 1) if length > 0 else 0
+        return numpy.max(numpy.hypot(x_array - factor_array * x, y_array - factor_array * y)) <= self.tolerance
+
+
+class DataManager(Thread):
+    polling_scheduler = None
     gnss_manager = None
     deviceTime = None
     running = False
@@ -348,13 +2628,30 @@ class DataManager(Thread):
     command_to_string_header_dict = None
     gps_data_label_list = None
     main_manager = None
+    device_time_origin = None
+    sample_time_origin = None
+    device_time_second = None
+    device_time_prefix = None
+    missed_tick_count = 0
+    sample_history = None
+    trip_statistics = None
+    gnss_track_q = None
+    gnss_track_file_update_manager = None
+    simplified_track_q = None
+    simplified_track_file_update_manager = None
+    track_simplifier = None
+    last_gnss_track_time = 0
+    manifest_sequence = 0
+    manifest_segment_count = 0
+    live_upload_pending = False
+    trip_summary_complete = False
 
     def __init__(self, main_manager_):
         super().__init__()
         self.main_manager = main_manager_
         self.car_id = CAR_IDENTIFIER
         self.gnss_manager = main_manager_.gnss_manager
-        self.obd_connection = main_manager_.obd_connection
+        self.polling_scheduler = main_manager_.polling_scheduler
         self.supported_command_list = main_manager_.supported_command_list
         self.string_to_command_dict = main_manager_.string_to_command_dict
         self.string_to_status_dict = main_manager_.string_to_status_dict
@@ -363,88 +2660,377 @@ class DataManager(Thread):
         self.gps_data_label_list = main_manager_.gps_data_label_list
 
     def run(self):
-        file_sync_manager = None
         self.running = False
         self.trip_id = self.get_device_time_string()
-        filename = os.path.join(RECORD_DIRECTORY_LOCATION, self.trip_id + MONITORING_FILE_EXTENSION)
-        if S3_SERVER_ENDPOINT is not None and S3_SERVER_AK is not None and S3_SERVER_SK is not None \
-                and S3_SERVER_BUCKET is not None and S3_SERVER_REGION is not None:
-            file_sync_manager = FileSyncManager(main_manager, excluded_sync_filename=filename)
-            file_sync_manager.start()
+        self.device_time_origin = time.time_ns() // 1000
+        self.sample_time_origin = time.monotonic_ns()
+        base_filename = os.path.join(RECORD_DIRECTORY_LOCATION, self.trip_id)
+        if FILE_RECORDING:
+            if not os.path.exists(RECORD_DIRECTORY_LOCATION):
+                os.makedirs(RECORD_DIRECTORY_LOCATION)
 
+        self.sample_history = SampleHistory(self.get_history_label_list(),
+                                            max(1, int(HISTORY_DURATION * 60 * RECORDING_SAMPLE_RATE)))
+        self.trip_statistics = TripStatistics(self.get_history_label_list(), self.gps_data_label_list[0],
+                                              self.gps_data_label_list[1])
         self.running = True
 
         if FILE_RECORDING:
-            if not os.path.exists(RECORD_DIRECTORY_LOCATION):
-                os.makedirs(RECORD_DIRECTORY_LOCATION)
-            self.q = queue.Queue()
-            self.fileUpdateManager = FileUpdateManager(filename, self.q, self.get_command_record(True))
+            self.q = RecordBuffer(RECORD_BUFFER_SIZE, RECORD_OVERLOAD_POLICY)
+            self.fileUpdateManager = self.create_file_update_manager(base_filename, self.q, self.get_column_list(),
+                                                                     self.get_column_type_list(),
+                                                                     self.get_column_deadband_list(),
+                                                                     self.get_column_resolution_list(),
+                                                                     self.get_linked_column_list())
             self.fileUpdateManager.start()
-            self.write_record_line_to_file(True)
+            if GPS_POSITION_MONITORING and GNSS_TRACK_RECORDING and self.gnss_manager is not None:
+                self.gnss_track_q = RecordBuffer(RECORD_BUFFER_SIZE, RECORD_OVERLOAD_POLICY)
+                self.gnss_track_file_update_manager = self.create_gnss_file_update_manager(
+                    base_filename + GNSS_TRACK_FILENAME_SUFFIX, self.gnss_track_q)
+            if GPS_POSITION_MONITORING and TRACK_SIMPLIFICATION and self.gnss_manager is not None:
+                self.simplified_track_q = RecordBuffer(RECORD_BUFFER_SIZE, RECORD_OVERLOAD_POLICY)
+                self.simplified_track_file_update_manager = self.create_gnss_file_update_manager(
+                    base_filename + SIMPLIFIED_TRACK_FILENAME_SUFFIX, self.simplified_track_q)
+                self.track_simplifier = TrackSimplifier(TRACK_SIMPLIFICATION_TOLERANCE,
+                                                        TRACK_SIMPLIFICATION_MAX_WINDOW)
             self.main_manager.set_recording_running_info(True)
 
-            while self.running:
-                self.write_record_line_to_file(False)
-                time.sleep(0.5)
+        if S3_SYNC_ENABLED:
+            self.main_manager.start_file_sync()
+
+        self.run_sampler()
 
+        if FILE_RECORDING:
             self.fileUpdateManager.terminate()
             self.fileUpdateManager.join()
-
-            if self.sync_before_terminate and S3_SERVER_ENDPOINT is not None and S3_SERVER_AK is not None and \
-                    S3_SERVER_SK is not None and S3_SERVER_BUCKET is not None and S3_SERVER_REGION is not None:
+            self.write_gnss_records(True)
+            for file_update_manager in (self.gnss_track_file_update_manager,
+                                        self.simplified_track_file_update_manager):
+                if file_update_manager is not None:
+                    file_update_manager.terminate()
+                    file_update_manager.join()
+            self.write_trip_summary(True)
+            if LIVE_UPLOAD:
+                self.write_trip_manifest(True)
+                if S3_SYNC_ENABLED and not self.sync_before_terminate:
+                    self.main_manager.start_file_sync()
+
+            if self.sync_before_terminate and S3_SYNC_ENABLED:
+                file_sync_manager = self.main_manager.file_sync_manager
                 if file_sync_manager is not None:
                     file_sync_manager.join()
 
                 logging.info('START SYNC BEFORE DATA MANAGER SHUTDOWN')
-                file_sync_manager = FileSyncManager(self.main_manager)
-                file_sync_manager.start()
-                file_sync_manager.join()
+                self.main_manager.start_file_sync().join()
             logging.info('CARLOG FILE CLOSED')
             self.main_manager.set_recording_running_info(False)
 
+    def run_sampler(self):
+        period = int(1000000000 / RECORDING_SAMPLE_RATE)
+        next_tick = time.monotonic_ns()
+        reported_missed_tick_count = 0
+        reported_dropped_record_count = 0
+        last_report_time = next_tick
+        last_live_upload_check_time = next_tick
+        last_summary_time = next_tick
+        while self.running:
+            SAMPLER_TICK_LATENESS_SECONDS.observe(max(0, time.monotonic_ns() - next_tick) / 1000000000)
+            self.record_sample(next_tick)
+            next_tick = next_tick + period
+            now = time.monotonic_ns()
+            if now >= next_tick:
+                missed_tick_count = (now - next_tick) // period + 1
+                self.missed_tick_count = self.missed_tick_count + missed_tick_count
+                SAMPLER_MISSED_TICKS_TOTAL.inc(missed_tick_count)
+                next_tick = next_tick + missed_tick_count * period
+            if now - last_report_time >= SAMPLER_REPORT_INTERVAL * 1000000000:
+                if self.missed_tick_count > reported_missed_tick_count:
+                    logging.warning(f'{self.missed_tick_count - reported_missed_tick_count} SAMPLING TICKS MISSED')
+                    reported_missed_tick_count = self.missed_tick_count
+                dropped_record_count = self.get_dropped_record_count()
+                if dropped_record_count > reported_dropped_record_count:
+                    logging.warning(f'{dropped_record_count - reported_dropped_record_count} RECORDS DROPPED')
+                    RECORDS_DROPPED_TOTAL.inc(dropped_record_count - reported_dropped_record_count)
+                    self.main_manager.set_dropped_record_count(self.main_manager.status.dropped_record_count +
+                                                               dropped_record_count - reported_dropped_record_count)
+                    reported_dropped_record_count = dropped_record_count
+                last_report_time = now
+            if FILE_RECORDING and LIVE_UPLOAD and \
+                    now - last_live_upload_check_time >= LIVE_UPLOAD_CHECK_INTERVAL * 1000000000:
+                self.update_live_upload()
+                last_live_upload_check_time = now
+            if FILE_RECORDING and TRIP_SUMMARY_INTERVAL > 0 and \
+                    now - last_summary_time >= TRIP_SUMMARY_INTERVAL * 1000000000:
+                self.write_trip_summary(False)
+                last_summary_time = now
+            time.sleep((next_tick - now) / 1000000000)
+
+    def record_sample(self, sample_time):
+        values = self.get_command_values(sample_time)
+        value_index = 1 + len(self.global_label_list)
+        value_array = numpy.array([trip_format.encode_float(value) for value in
+                                   values[value_index:value_index + len(self.sample_history.label_list)]])
+        self.sample_history.append(sample_time, value_array)
+        self.trip_statistics.update(sample_time, value_array)
+        if FILE_RECORDING:
+            self.write_record_line_to_file(sample_time, values)
+            self.write_gnss_records()
+
+    def write_gnss_records(self, flush=False):
+        if self.gnss_track_file_update_manager is None and self.track_simplifier is None:
+            return
+        fix_list = self.gnss_manager.get_fix_list(self.last_gnss_track_time + 1, numpy.iinfo(numpy.int64).max)
+        if fix_list:
+            self.last_gnss_track_time = fix_list[-1][0]
+        fix_list = [[self.get_device_time(fix[0])] + fix[1:-1] + [int(fix[-1]) if fix[-1] is not None else None]
+                    for fix in fix_list]
+        if self.gnss_track_file_update_manager is not None:
+            self.put_gnss_records(self.gnss_track_q, fix_list)
+        if self.track_simplifier is not None:
+            kept_fix_list = [kept_fix for fix in fix_list for kept_fix in self.track_simplifier.add(fix)]
+            if flush:
+                kept_fix_list += self.track_simplifier.flush()
+            self.put_gnss_records(self.simplified_track_q, kept_fix_list)
+
+    def put_gnss_records(self, q, fix_list):
+        for fix in fix_list:
+            if MONITORING_FILE_FORMAT not in BINARY_FILE_FORMAT_LIST:
+                fix = MONITORING_FILE_SEPARATION_CHARACTER.join(
+                    [self.format_device_time(fix[0])] + [str(value) for value in fix[1:-1]] +
+                    [self.format_device_time(fix[-1]) if fix[-1] is not None else str(None)]) + '\n'
+            q.put(fix)
+
+    def create_gnss_file_update_manager(self, base_filename, q):
+        file_update_manager = self.create_file_update_manager(
+            base_filename, q, [DEVICE_TIME_LABEL] + self.gps_data_label_list + [GNSS_TIME_LABEL],
+            [trip_format.TIME_COLUMN] + [trip_format.FLOAT_COLUMN for _ in self.gps_data_label_list] +
+            [trip_format.TIME_COLUMN],
+            [(0, 0)] + [RECORD_DEADBAND_DICT.get(gps_label, (0, 0)) for gps_label in self.gps_data_label_list] +
+            [(0, 0)],
+            [1] + [self.main_manager.gps_data_resolution_dict.get(gps_label, RECORD_DELTA_RESOLUTION)
+                   for gps_label in self.gps_data_label_list] + [1],
+            [trip_format.NO_LINKED_COLUMN for _ in range(2 + len(self.gps_data_label_list))])
+        file_update_manager.start()
+        return file_update_manager
+
+    def is_trip_active(self, filename):
+        return self.is_alive() and self.trip_id is not None and filename.startswith(self.trip_id)
+
+    def get_dropped_record_count(self):
+        return sum(q.dropped_count for q in (self.q, self.gnss_track_q, self.simplified_track_q) if q is not None)
+
+    def get_file_update_manager_list(self):
+        return [file_update_manager for file_update_manager in
+                (self.fileUpdateManager, self.gnss_track_file_update_manager,
+                 self.simplified_track_file_update_manager) if file_update_manager is not None]
+
+    def create_file_update_manager(self, base_filename, q, column_list, type_list, deadband_list, resolution_list,
+                                   linked_column_list):
+        if MONITORING_FILE_FORMAT == DELTA_FILE_FORMAT:
+            return DeltaFileUpdateManager(base_filename, q, (column_list, type_list, deadband_list, resolution_list,
+                                                             linked_column_list))
+        elif MONITORING_FILE_FORMAT == COLUMNAR_FILE_FORMAT:
+            return ColumnarFileUpdateManager(base_filename, q, (column_list, type_list))
+        return FileUpdateManager(base_filename, q, MONITORING_FILE_SEPARATION_CHARACTER.join(column_list) + '\n')
+
+    def write_record_line_to_file(self, sample_time, values=None):
+        if MONITORING_FILE_FORMAT in BINARY_FILE_FORMAT_LIST:
+            record = values if values is not None else self.get_command_values(sample_time)
         else:
-            while self.running:
-                time.sleep(0.5)
-
-    def write_record_line_to_file(self, write_header):
-        try:
-            self.q.put_nowait(self.get_command_record(write_header))
-        except queue.Full:
-            logging.warning('file queue full')
+            record = self.get_command_record(False, sample_time, values)
+        if record is None:
+            return
+        self.q.put(record)
+        RECORD_QUEUE_DEPTH.set(self.q.qsize())
 
     def terminate(self, sync):
         self.sync_before_terminate = sync
         self.running = False
 
-    def get_command_record(self, write_header):
+    def get_command_record(self, write_header, sample_time=None, values=None):
         if not self.running or write_header is None:
             return None
 
         if write_header:
-            ret = DEVICE_TIME_LABEL
-            for header in self.global_label_list:
-                ret += f'{MONITORING_FILE_SEPARATION_CHARACTER}{header}'
-
-            for command in self.supported_command_list:
-                ret += f'{MONITORING_FILE_SEPARATION_CHARACTER}{self.command_to_string_header_dict.get(command)}'
-
-            if GPS_POSITION_MONITORING:
-                for gps_label in self.gps_data_label_list:
-                    ret += f'{MONITORING_FILE_SEPARATION_CHARACTER}{gps_label}'
-            return ret + '\n'
+            return MONITORING_FILE_SEPARATION_CHARACTER.join(self.get_column_list()) + '\n'
         else:
-            ret = self.get_device_time_string()
-            for header in self.global_label_list:
-                ret += f'{MONITORING_FILE_SEPARATION_CHARACTER}{self.get_global_value_for_header(header)}'
-
-            for command in self.supported_command_list:
-                ret += f'{MONITORING_FILE_SEPARATION_CHARACTER}{self.obd_connection.query(command).value}'
+            if values is None:
+                values = self.get_command_values(sample_time)
+            values[0] = self.format_device_time(values[0])
+            return MONITORING_FILE_SEPARATION_CHARACTER.join([str(value) for value in values]) + '\n'
+
+    def get_column_list(self):
+        ret = [DEVICE_TIME_LABEL] + self.global_label_list
+        ret += [self.command_to_string_header_dict.get(command) for command in self.supported_command_list]
+        if GPS_POSITION_MONITORING:
+            ret += self.gps_data_label_list
+        ret.append(SAMPLE_TIME_LABEL)
+        if RECORD_ACQUISITION_TIMESTAMPS:
+            ret += [self.command_to_string_header_dict.get(command) + ACQUISITION_TIME_LABEL_SUFFIX
+                    for command in self.supported_command_list]
+        return ret
+
+    def get_column_type_list(self):
+        ret = [trip_format.TIME_COLUMN] + [trip_format.TEXT_COLUMN for _ in self.global_label_list]
+        ret += [trip_format.TEXT_COLUMN if command in self.main_manager.text_command_list else trip_format.FLOAT_COLUMN
+                for command in self.supported_command_list]
+        if GPS_POSITION_MONITORING:
+            ret += [trip_format.FLOAT_COLUMN for _ in self.gps_data_label_list]
+        ret.append(trip_format.INTEGER_COLUMN)
+        if RECORD_ACQUISITION_TIMESTAMPS:
+            ret += [trip_format.INTEGER_COLUMN for _ in self.supported_command_list]
+        return ret
+
+    def get_history_label_list(self):
+        ret = [command.name for command in self.supported_command_list]
+        if GPS_POSITION_MONITORING:
+            ret += self.gps_data_label_list
+        return ret
+
+    def get_history(self, label_list, duration, bucket_count=None):
+        end_time = time.monotonic_ns()
+        start_time = end_time - int(duration * 1000000000)
+        label_list = [label for label in label_list if label in self.sample_history.label_index_dict]
+        if bucket_count is None:
+            time_array, value_array = self.sample_history.get_window(label_list, start_time, end_time)
+            return {
+                'time': [self.get_epoch_time(sample_time) for sample_time in time_array.tolist()],
+                'values': {label: SampleHistory.to_list(value_array[:, index])
+                           for index, label in enumerate(label_list)},
+            }
+        time_array, min_array, max_array, mean_array = self.sample_history.get_aggregates(label_list, start_time,
+                                                                                          end_time, bucket_count)
+        return {
+            'time': [self.get_epoch_time(sample_time) for sample_time in time_array.tolist()],
+            'min': {label: SampleHistory.to_list(min_array[:, index]) for index, label in enumerate(label_list)},
+            'max': {label: SampleHistory.to_list(max_array[:, index]) for index, label in enumerate(label_list)},
+            'mean': {label: SampleHistory.to_list(mean_array[:, index]) for index, label in enumerate(label_list)},
+        }
 
-            if GPS_POSITION_MONITORING:
-                for gps_label in self.gps_data_label_list:
-                    ret += f'{MONITORING_FILE_SEPARATION_CHARACTER}' + \
-                           f'{self.gnss_manager.get_data_for_header_name(gps_label)} '
-            return ret + '\n'
+    def write_trip_summary(self, complete):
+        filename = os.path.join(RECORD_DIRECTORY_LOCATION, self.trip_id + TRIP_SUMMARY_EXTENSION)
+        summary = {
+            'car_id': self.car_id,
+            'trip_id': self.trip_id,
+            'complete': complete,
+            'start_time': self.device_time_origin / 1000000,
+            'end_time': self.get_epoch_time(self.trip_statistics.previous_time)
+            if self.trip_statistics.previous_time is not None else None,
+            'files': [filename for file_update_manager in self.get_file_update_manager_list()
+                      for filename in file_update_manager.get_filename_list()],
+        }
+        summary.update(self.trip_statistics.generate_dict())
+        try:
+            with open(filename + '.tmp', 'w') as file:
+                json.dump(summary, file, indent=1)
+            os.replace(filename + '.tmp', filename)
+            if complete:
+                self.trip_summary_complete = True
+                logging.info(f'TRIP SUMMARY {filename} WRITTEN')
+        except OSError as exc:
+            logging.error(f'TRIP SUMMARY {filename} NOT WRITTEN')
+            logging.error(f'Error: {exc}')
+
+    def update_live_upload(self):
+        segment_list = self.get_closed_segment_list()
+        if len(segment_list) > self.manifest_segment_count:
+            self.write_trip_manifest(False, segment_list)
+            self.live_upload_pending = True
+        if self.live_upload_pending and S3_SYNC_ENABLED:
+            file_sync_manager = self.main_manager.file_sync_manager
+            if file_sync_manager is None or not file_sync_manager.is_alive():
+                self.main_manager.start_file_sync()
+                self.live_upload_pending = False
+
+    def get_closed_segment_list(self):
+        return [dict(segment, stream=stream) for stream, file_update_manager in
+                (('data', self.fileUpdateManager), ('gnss', self.gnss_track_file_update_manager),
+                 ('track', self.simplified_track_file_update_manager)) if file_update_manager is not None
+                for segment in list(file_update_manager.closed_segment_list)]
+
+    def write_trip_manifest(self, complete, segment_list=None):
+        segment_list = segment_list if segment_list is not None else self.get_closed_segment_list()
+        manifest = {
+            'car_id': self.car_id,
+            'trip_id': self.trip_id,
+            'sequence': self.manifest_sequence,
+            'complete': complete,
+            'segments': segment_list,
+        }
+        filename = os.path.join(RECORD_DIRECTORY_LOCATION,
+                                f'{self.trip_id}_{self.manifest_sequence:04d}{TRIP_MANIFEST_EXTENSION}')
+        try:
+            with open(filename + '.tmp', 'w') as file:
+                json.dump(manifest, file, indent=1)
+            os.replace(filename + '.tmp', filename)
+            self.manifest_sequence = self.manifest_sequence + 1
+            self.manifest_segment_count = len(segment_list)
+            logging.info(f'TRIP MANIFEST {filename} WRITTEN ({len(segment_list)} SEGMENTS)')
+        except OSError as exc:
+            logging.error(f'TRIP MANIFEST {filename} NOT WRITTEN')
+            logging.error(f'Error: {exc}')
+
+    def get_epoch_time(self, sample_time):
+        return (self.device_time_origin * 1000 + sample_time - self.sample_time_origin) / 1000000000
+
+    def get_column_deadband_list(self):
+        ret = [(0, 0) for _ in range(1 + len(self.global_label_list))]
+        ret += [RECORD_DEADBAND_DICT.get(command.name, (0, 0)) for command in self.supported_command_list]
+        if GPS_POSITION_MONITORING:
+            ret += [RECORD_DEADBAND_DICT.get(gps_label, (0, 0)) for gps_label in self.gps_data_label_list]
+        ret.append((0, 0))
+        if RECORD_ACQUISITION_TIMESTAMPS:
+            ret += [(0, 0) for _ in self.supported_command_list]
+        return ret
+
+    def get_column_resolution_list(self):
+        ret = [1 for _ in range(1 + len(self.global_label_list))]
+        ret += [RECORD_DELTA_RESOLUTION for _ in self.supported_command_list]
+        if GPS_POSITION_MONITORING:
+            ret += [self.main_manager.gps_data_resolution_dict.get(gps_label, RECORD_DELTA_RESOLUTION)
+                    for gps_label in self.gps_data_label_list]
+        ret.append(1)
+        if RECORD_ACQUISITION_TIMESTAMPS:
+            ret += [1 for _ in self.supported_command_list]
+        return ret
+
+    def get_linked_column_list(self):
+        command_index = 1 + len(self.global_label_list)
+        ret = [trip_format.NO_LINKED_COLUMN for _ in self.get_column_list()]
+        if RECORD_ACQUISITION_TIMESTAMPS:
+            ret = ret[:len(ret) - len(self.supported_command_list)]
+            ret += [command_index + index for index in range(len(self.supported_command_list))]
+        return ret
+
+    def get_command_values(self, sample_time=None):
+        if sample_time is None:
+            sample_time = time.monotonic_ns()
+        ret = [self.get_device_time(sample_time)]
+        ret += [self.get_global_value_for_header(header) for header in self.global_label_list]
+        ret += [self.polling_scheduler.get_response(command).value for command in self.supported_command_list]
+        if GPS_POSITION_MONITORING:
+            ret += self.gnss_manager.get_fix(sample_time)
+        ret.append(sample_time)
+        if RECORD_ACQUISITION_TIMESTAMPS:
+            ret += [self.polling_scheduler.get_timestamp(command) for command in self.supported_command_list]
+        return ret
+
+    def get_device_time(self, sample_time):
+        return self.device_time_origin + (sample_time - self.sample_time_origin) // 1000
+
+    def format_device_time(self, device_time):
+        second, microsecond = divmod(device_time, 1000000)
+        if second != self.device_time_second:
+            self.device_time_second = second
+            self.device_time_prefix = datetime.datetime.fromtimestamp(second).strftime(DATETIME_SECOND_FORMAT)
+        return f'{self.device_time_prefix}{microsecond:06d}'
+
+    def is_record_file_active(self, filename):
+        if self.is_alive() and not self.trip_summary_complete and self.trip_id is not None and \
+                filename == self.trip_id + TRIP_SUMMARY_EXTENSION:
+            return True
+        return any(file_update_manager.is_alive() and filename == os.path.basename(file_update_manager.filename)
+                   for file_update_manager in self.get_file_update_manager_list())
 
     def get_command_list(self):
         if self.supported_command_list is not None:
@@ -470,6 +3056,10 @@ class Status:
     sync_in_progress_info = False
     recording_running_info = False
     last_sync_failed_error = False
+    s3_server_reachable_info = False
+    dropped_record_count = 0
+    storage_used_size = 0
+    storage_reduced_file_count = 0
 
     def __init__(self):
         super().__init__()
@@ -493,11 +3083,30 @@ class Status:
                 warnings.append('SYNC IN PROGRESS')
             if self.last_sync_failed_error:
                 errors.append('LAST SYNC FAILED')
+            if not self.s3_server_reachable_info:
+                info.append('S3 SERVER OFFLINE')
+
+        if self.dropped_record_count > 0:
+            warnings.append('RECORDS DROPPED')
+
+        if FILE_RECORDING and STORAGE_BUDGET > 0:
+            if self.storage_used_size > STORAGE_BUDGET:
+                errors.append('STORAGE FULL')
+            elif self.storage_used_size > STORAGE_BUDGET * STORAGE_HIGH_WATERMARK:
+                warnings.append('STORAGE LOW')
+            elif self.storage_reduced_file_count > 0:
+                info.append('TRIPS DOWNSAMPLED')
 
         return {
             'errors': errors,
             'warnings': warnings,
             'info': info,
+            'dropped_records': self.dropped_record_count,
+            'storage': {
+                'used': self.storage_used_size,
+                'budget': STORAGE_BUDGET,
+                'reduced_files': self.storage_reduced_file_count,
+            },
         }
 
 
@@ -506,9 +3115,21 @@ class MainManager(Thread):
     data_manager_restart_in_progress = False
     data_manager_stop_in_progress = False
     obd_connection = None
+    polling_scheduler = None
+    capability_validator = None
     gnss_manager = None
     data_manager = None
+    registration_manager = None
+    connectivity_monitor = None
+    file_sync_manager = None
+    file_sync_lock = None
     socket_server = None
+    capture_writer = None
+    replay_capture = None
+    metric_logger = None
+    storage_manager = None
+    storage_lock = None
+    locked_record_filename_set = None
     status = None
 
     string_to_command_dict = {
@@ -789,6 +3410,12 @@ class MainManager(Thread):
         'GPS TRACK (degree)'
     ]
 
+    gps_data_resolution_dict = {
+        'GPS LATITUDE (degree)': 0.0000001,
+        'GPS LONGITUDE (degree)': 0.0000001,
+        'GPS ALTITUDE (meter)': 0.01,
+    }
+
     global_label_list = [
         'CAR ID',
         'TRIP ID'
@@ -808,12 +3435,33 @@ class MainManager(Thread):
 
     supported_status_list = []
 
+    text_command_list = [
+        obd.commands.FUEL_STATUS,
+        obd.commands.AIR_STATUS,
+        obd.commands.O2_SENSORS,
+        obd.commands.OBD_COMPLIANCE,
+        obd.commands.O2_SENSORS_ALT,
+        obd.commands.AUX_INPUT_STATUS,
+        obd.commands.FUEL_TYPE,
+    ]
+
     def __init__(self):
         self.status = Status()
+        self.file_sync_lock = threading.Lock()
+        self.storage_lock = threading.Lock()
+        self.locked_record_filename_set = set()
+        if CAPTURE_FILE_LOCATION is not None:
+            self.capture_writer = CaptureWriter(CAPTURE_FILE_LOCATION)
         super().__init__()
 
     def run(self):
         self.running = True
+        if FILE_RECORDING and os.path.exists(RECORD_DIRECTORY_LOCATION):
+            recover_record_files()
+        self.start_metric_logger()
+        self.start_registration_manager()
+        self.start_connectivity_monitor()
+        self.start_storage_manager()
         self.start_gnss_manager()
         self.start_obd_connection()
         if self.obd_connection is not None:
@@ -823,8 +3471,52 @@ class MainManager(Thread):
             logging.error('UNABLE TO HAVE OBD CONNECTION: NOT STARTING DATA MANAGER')
             self.set_obd_connection_established_info(False)
 
+    def start_registration_manager(self):
+        if ECCM_SERVER_LOCATION is not None and ECCM_SECRET_VALUE is not None and ECCM_SECRET_HEADER is not None:
+            self.registration_manager = RegistrationManager()
+            self.registration_manager.start()
+
+    def start_metric_logger(self):
+        if self.socket_server is None and METRICS_LOG_INTERVAL > 0:
+            self.metric_logger = MetricLogger()
+            self.metric_logger.start()
+
+    def start_connectivity_monitor(self):
+        if S3_SYNC_ENABLED:
+            self.connectivity_monitor = ConnectivityMonitor(self)
+            self.connectivity_monitor.start()
+
+    def start_storage_manager(self):
+        if FILE_RECORDING and STORAGE_BUDGET > 0:
+            if not os.path.exists(RECORD_DIRECTORY_LOCATION):
+                os.makedirs(RECORD_DIRECTORY_LOCATION)
+            self.storage_manager = StorageManager(self)
+            self.storage_manager.start()
+
+    def is_s3_server_reachable(self):
+        return self.connectivity_monitor is None or self.connectivity_monitor.reachable
+
+    def set_file_sync_result(self, succeeded):
+        if self.connectivity_monitor is not None:
+            self.connectivity_monitor.set_sync_result(succeeded)
+
+    def start_file_sync(self):
+        with self.file_sync_lock:
+            if self.file_sync_manager is None or not self.file_sync_manager.is_alive():
+                self.file_sync_manager = FileSyncManager(self)
+                self.file_sync_manager.start()
+            return self.file_sync_manager
+
+    def register_uploaded_file(self, location, size=None, url=POST_TRIP_LOCATION):
+        if self.registration_manager is not None:
+            self.registration_manager.add(url, {
+                "objectLocation": location,
+                "uploadDate": datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+            }, location, size)
+
     def start_gnss_manager(self):
-        self.gnss_manager = GNSSManager()
+        self.gnss_manager = GNSSManager(self.create_gnss_socket() if GPS_POSITION_MONITORING else None,
+                                        self.capture_writer)
         self.gnss_manager.start()
         self.set_gnss_available_info(True)
 
@@ -844,6 +3536,23 @@ class MainManager(Thread):
             self.gnss_manager.join()
         self.set_gnss_available_info(False)
         self.stop_obd_connection()
+        if self.capture_writer is not None:
+            self.capture_writer.close()
+        if self.connectivity_monitor is not None:
+            self.connectivity_monitor.terminate()
+            self.connectivity_monitor.join()
+            self.connectivity_monitor = None
+        if self.storage_manager is not None:
+            self.storage_manager.terminate()
+            self.storage_manager.join()
+            self.storage_manager = None
+        if self.registration_manager is not None:
+            self.registration_manager.terminate()
+            self.registration_manager = None
+        if self.metric_logger is not None:
+            self.metric_logger.terminate()
+            self.metric_logger.join()
+            self.metric_logger = None
 
     def restart_data_manager(self, sync=False):
         if not self.data_manager_restart_in_progress:
@@ -855,9 +3564,15 @@ class MainManager(Thread):
             self.data_manager_restart_in_progress = False
 
     def stop_obd_connection(self):
+        if self.capability_validator is not None:
+            self.capability_validator.terminate()
+            self.capability_validator.join()
+            self.capability_validator = None
+        if self.polling_scheduler is not None:
+            self.polling_scheduler.terminate()
+            self.polling_scheduler.join()
+            self.polling_scheduler = None
         if self.obd_connection is not None:
-            self.obd_connection.stop()
-            self.obd_connection.unwatch_all()
             logging.info('CLOSE USED OBD CONNECTION')
             self.obd_connection.close()
 
@@ -871,32 +3586,68 @@ class MainManager(Thread):
 
     def query_command(self, string_command):
         command = self.string_to_command_dict.get(string_command)
-        if self.obd_connection is None or command is None or not self.supported_command_list.__contains__(command):
+        if self.polling_scheduler is None or command is None or not self.supported_command_list.__contains__(command):
+            return None
+        return self.polling_scheduler.get_response(command)
+
+    def is_command_cached(self, string_command):
+        command = self.string_to_command_dict.get(string_command, self.string_to_status_dict.get(string_command))
+        return command is not None and (command in self.supported_command_list or
+                                        command in self.supported_status_list)
+
+    def get_cached_value(self, string_command):
+        if self.polling_scheduler is None or not self.is_command_cached(string_command):
+            return None, None
+        return self.polling_scheduler.get_latest(
+            self.string_to_command_dict.get(string_command, self.string_to_status_dict.get(string_command)))
+
+    def get_history(self, label_list, duration, bucket_count=None):
+        data_manager = self.data_manager
+        if data_manager is None or data_manager.sample_history is None:
             return None
-        return self.obd_connection.query(command)
+        return data_manager.get_history(label_list, duration, bucket_count)
 
     def query_status(self, string_status):
         status = self.string_to_status_dict.get(string_status)
-        if self.obd_connection is None or status is None:
+        if self.polling_scheduler is None or status is None:
             return None
-        return self.obd_connection.query(status)
+        if status in self.supported_status_list:
+            return self.polling_scheduler.get_response(status)
+        return self.polling_scheduler.query_now(status)
 
     def query_dtc(self):
-        if self.obd_connection is None:
+        if self.polling_scheduler is None:
             return None
-        return self.obd_connection.query(obd.commands.GET_DTC)
+        return self.polling_scheduler.query_now(obd.commands.GET_DTC)
 
     def clear_dtc(self):
-        if self.obd_connection is None:
+        if self.polling_scheduler is None:
             return None
-        return self.obd_connection.query(obd.commands.CLEAR_DTC)
+        return self.polling_scheduler.query_now(obd.commands.CLEAR_DTC)
+
+    def get_replay_capture(self):
+        if self.replay_capture is None:
+            self.replay_capture = ReplayCapture(REPLAY_FILE_LOCATION)
+        return self.replay_capture
+
+    def create_obd_connection(self):
+        if OBD_BACKEND == REPLAY_BACKEND:
+            return ReplayOBDConnection(self.get_replay_capture())
+        return obd.OBD(OBD_INTERFACE, fast=not OBD_BATCH_REQUESTS)
+
+    def create_gnss_socket(self):
+        if GNSS_BACKEND == REPLAY_BACKEND:
+            return ReplayGNSSSocket(self.get_replay_capture())
+        gpsd_socket = gps3.GPSDSocket()
+        gpsd_socket.connect()
+        gpsd_socket.watch()
+        return gpsd_socket
 
     def start_obd_connection(self):
         self.supported_command_list = []
         self.supported_status_list = []
         logging.info('START NEW OBD CONNECTION')
-        self.obd_connection = obd.Async(OBD_INTERFACE)
-        time.sleep(2)
+        self.obd_connection = self.create_obd_connection()
         wait_count = 1
 
         while self.obd_connection.status() == utils.OBDStatus.NOT_CONNECTED:
@@ -915,51 +3666,80 @@ class MainManager(Thread):
                 self.obd_connection.close()
                 time.sleep(7)
                 logging.warning('RETRY STARTING NEW OBD CONNECTION')
-                self.obd_connection = obd.Async(OBD_INTERFACE)
-                time.sleep(2)
+                self.obd_connection = self.create_obd_connection()
 
+        if self.capture_writer is not None and OBD_BACKEND != REPLAY_BACKEND:
+            self.capture_writer.capture_obd_connection(self.obd_connection)
         logging.info('TESTING OBD CONNECTION')
         logging.info(str(self.obd_connection.supported_commands))
-
-        for status in self.status_list:
-            logging.info('TESTING OBD STATUS: ' + str(status))
-            status_supported = self.obd_connection.supports(status)
-
-            if not status_supported:
-                logging.warning('UNSUPPORTED OBD STATUS: ' + str(status))
-                logging.warning(str(self.obd_connection.query(status, force=True).value))
-            else:
-                self.supported_status_list.append(status)
-
-        for command in self.command_list:
-            logging.info('TESTING OBD COMMAND: ' + str(command))
-            command_supported = self.obd_connection.supports(command)
-
-            if not command_supported:
-                logging.warning('UNSUPPORTED OBD COMMAND: ' + str(command))
-                logging.warning(str(self.obd_connection.query(command, force=True).value))
-            else:
-                self.supported_command_list.append(command)
+        vehicle_key = self.get_vehicle_key()
+        capabilities = load_capability_cache().get(vehicle_key)
+
+        if capabilities is not None:
+            logging.info(f'USING CACHED OBD CAPABILITIES OF {vehicle_key}')
+            self.supported_status_list = [status for status in self.status_list
+                                          if status.name in capabilities['supported_status_list']]
+            self.supported_command_list = [command for command in self.command_list
+                                           if command.name in capabilities['supported_command_list']]
+        else:
+            for status in self.status_list:
+                if self.obd_connection.supports(status):
+                    self.supported_status_list.append(status)
+                else:
+                    logging.warning('UNSUPPORTED OBD STATUS: ' + str(status))
+
+            for command in self.command_list:
+                if self.obd_connection.supports(command):
+                    self.supported_command_list.append(command)
+                else:
+                    logging.warning('UNSUPPORTED OBD COMMAND: ' + str(command))
 
         if self.supported_command_list.__len__() < 1:
             logging.error('NO OBD COMMAND SUPPORTED')
             logging.info('CLOSE PREVIOUS OBD CONNECTION')
             self.obd_connection.close()
+            self.obd_connection = None
         else:
-            for command in self.supported_command_list:
-                self.obd_connection.watch(command)  # , callback=self.value_callback)
-
-            for status in self.supported_status_list:
-                self.obd_connection.watch(status)
-
-            self.obd_connection.start()
+            self.polling_scheduler = PollingScheduler(self.obd_connection,
+                                                      self.supported_command_list + self.supported_status_list)
+            self.polling_scheduler.start()
             logging.info(f'CONNECTED TO ECU')
             logging.info(f'NUMBER OF COMMAND MONITORED:{self.supported_command_list.__len__()}')
             logging.info('START MONITORING ECU DATA')
+            probe_unsupported = capabilities is None or \
+                time.time() - capabilities.get('update_time', 0) > OBD_CAPABILITY_CACHE_MAX_AGE * 3600
+            self.capability_validator = CapabilityValidator(self, vehicle_key, probe_unsupported)
+            self.capability_validator.start()
+
+    def get_vehicle_key(self):
+        if obd.commands.has_name('VIN') and self.obd_connection.supports(obd.commands.VIN):
+            response = self.obd_connection.query(obd.commands.VIN)
+            if not response.is_null():
+                vin = response.value.decode('ascii', errors='ignore') \
+                    if isinstance(response.value, (bytes, bytearray)) else str(response.value)
+                vin = vin.strip('\x00 \t\r\n')
+                if vin:
+                    return f'VIN {vin}'
+        supported_pid_list = sorted(command.command.decode() for command in self.obd_connection.supported_commands)
+        return f'ECU {CAR_IDENTIFIER} {self.obd_connection.protocol_id()} {",".join(supported_pid_list)}'
+
+    def apply_capabilities(self, supported_status_list, supported_command_list):
+        if self.polling_scheduler is None or supported_status_list == self.supported_status_list and \
+                supported_command_list == self.supported_command_list:
+            return
+        logging.info('OBD CAPABILITIES CHANGED: NEW COMMAND LIST USED FROM NEXT RECORDING')
+        for command in self.supported_command_list + self.supported_status_list:
+            if command not in supported_command_list + supported_status_list:
+                self.polling_scheduler.remove_command(command)
+        for command in supported_command_list + supported_status_list:
+            if command not in self.supported_command_list + self.supported_status_list:
+                self.polling_scheduler.add_command(command)
+        self.supported_status_list = supported_status_list
+        self.supported_command_list = supported_command_list
 
     def broadcast_status(self):
         if self.socket_server is not None:
-            asyncio.run(self.socket_server.emit('status', self.status.generate_json()))
+            self.socket_server.status_bus.publish(self.status.generate_json())
 
     def set_gnss_available_info(self, value):
         self.status.gnss_available_info = value
@@ -973,10 +3753,35 @@ class MainManager(Thread):
         self.status.recording_running_info = value
         self.broadcast_status()
 
+    def set_s3_server_reachable_info(self, value):
+        self.status.s3_server_reachable_info = value
+        self.broadcast_status()
+
     def set_last_sync_failed_error(self, value):
         self.status.last_sync_failed_error = value
         self.broadcast_status()
 
+    def lock_record_file(self, filename):
+        with self.storage_lock:
+            if filename in self.locked_record_filename_set or \
+                    not os.path.exists(os.path.join(RECORD_DIRECTORY_LOCATION, filename)):
+                return False
+            self.locked_record_filename_set.add(filename)
+            return True
+
+    def unlock_record_file(self, filename):
+        with self.storage_lock:
+            self.locked_record_filename_set.discard(filename)
+
+    def set_storage_info(self, used_size, reduced_file_count):
+        self.status.storage_used_size = used_size
+        self.status.storage_reduced_file_count = reduced_file_count
+        self.broadcast_status()
+
+    def set_dropped_record_count(self, value):
+        self.status.dropped_record_count = value
+        self.broadcast_status()
+
     def set_obd_connection_established_info(self, value):
         self.status.last_sync_failed_error = value
         self.broadcast_status()
@@ -0,0 +1,704 @@
+import argparse
+import collections
+import importlib
+import io
+import json
+import math
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BENCHMARK_CONFIG = """[DEFAULT]
+CAR_IDENTIFIER=BENCHMARK
+FILE_RECORDING=yes
+RECORD_DIRECTORY_LOCATION={record_directory_location}
+"""
+ADAPTER_ROUND_TRIP_TIME = 0.05
+ADAPTER_BYTE_TIME = 0.0008
+SERVER_RESPONSE_TIME = 0.02
+REGISTRATION_FILE_COUNT = 500
+ROUTE_ORIGIN = (48.8566, 2.3522)
+ROUTE_FIX_RATE = 10
+ROUTE_NOISE = 1.0
+ROUTE_NAME_LIST = ['straight', 'city', 'winding', 'stopped']
+RESPONSE_POOL_SIZE = 64
+FILE_WRITE_ROW_COUNT = 5000
+FILE_WRITE_PACED_RATE = 50
+HEADER_FILE_SIZE_LIST = [1 << 20, 4 << 20, 16 << 20, 64 << 20]
+UPLOAD_FILE_COUNT = 20
+UPLOAD_FILE_SIZE = 1 << 20
+UPLOAD_LARGE_FILE_SIZE = 12 << 20
+S3_BUCKET = 'benchmark'
+
+
+def load_app(work_directory):
+    record_directory_location = os.path.join(work_directory, 'records')
+    os.makedirs(record_directory_location, exist_ok=True)
+    with open(os.path.join(work_directory, 'config.ini'), 'w') as file:
+        file.write(BENCHMARK_CONFIG.format(record_directory_location=record_directory_location))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(work_directory)
+    return importlib.import_module('app')
+
+
+class SimulatedAdapter:
+    app = None
+    round_trip_time = ADAPTER_ROUND_TRIP_TIME
+    batch_supported = True
+    request_count = 0
+
+    def __init__(self, app, round_trip_time=ADAPTER_ROUND_TRIP_TIME, batch_supported=True):
+        self.app = app
+        self.interface = self
+        self.round_trip_time = round_trip_time
+        self.batch_supported = batch_supported
+        self.command_dict = {command.pid: command for command in app.MainManager.command_list}
+
+    @staticmethod
+    def protocol_id():
+        return '6'
+
+    def query(self, command, force=False):
+        message_list = self.send_and_parse(command.command)
+        if not message_list:
+            return self.app.obd.OBDResponse()
+        return command(message_list)
+
+    def send_and_parse(self, command_string):
+        self.request_count = self.request_count + 1
+        pid_list = [int(command_string[index:index + 2], 16) for index in range(2, len(command_string), 2)]
+        if len(pid_list) > 1 and not self.batch_supported:
+            time.sleep(self.round_trip_time)
+            return []
+        message = self.create_message(pid_list)
+        time.sleep(self.round_trip_time + ADAPTER_BYTE_TIME * len(message.data))
+        return [message]
+
+    def create_message(self, pid_list):
+        data = bytearray([0x41])
+        for pid in pid_list:
+            command = self.command_dict.get(pid)
+            if command is None:
+                continue
+            data.append(pid)
+            data += bytes(random.randrange(256) for _ in range(command.bytes - 2))
+        message = self.app.obd.protocols.protocol.Message([])
+        message.ecu = self.app.obd.protocols.ECU.ENGINE
+        message.data = data
+        return message
+
+
+class SimulatedScheduler:
+    response_dict = None
+    index_dict = None
+
+    def __init__(self, app, command_list):
+        adapter = SimulatedAdapter(app)
+        self.response_dict = {command: [self.create_response(app, adapter, command)
+                                        for _ in range(RESPONSE_POOL_SIZE)] for command in command_list}
+        self.index_dict = {command: 0 for command in command_list}
+
+    @staticmethod
+    def create_response(app, adapter, command):
+        try:
+            return command([adapter.create_message([command.pid])])
+        except (IndexError, ValueError):
+            return app.obd.OBDResponse()
+
+    def get_latest(self, command):
+        response_list = self.response_dict.get(command)
+        if response_list is None:
+            return None, None
+        self.index_dict[command] = (self.index_dict[command] + 1) % len(response_list)
+        return response_list[self.index_dict[command]], time.monotonic_ns()
+
+    def get_response(self, command):
+        return self.get_latest(command)[0]
+
+    def get_timestamp(self, command):
+        return self.get_latest(command)[1]
+
+
+def benchmark_batched_requests(app, duration):
+    app.OBD_HIGH_RATE_COMMANDS = []
+    app.OBD_SLOW_RATE_COMMANDS = []
+    app.OBD_ONCE_COMMANDS = []
+    app.OBD_NORMAL_RATE_PERIOD = 0
+    results = {}
+    for name, batch_requests, batch_supported in [('single', False, True),
+                                                  ('batched', True, True),
+                                                  ('batched_rejected', True, False)]:
+        app.OBD_BATCH_REQUESTS = batch_requests
+        adapter = SimulatedAdapter(app, batch_supported=batch_supported)
+        scheduler = app.PollingScheduler(adapter, app.MainManager.command_list)
+        scheduler.start()
+        time.sleep(duration)
+        scheduler.terminate()
+        scheduler.join()
+        results[name] = {
+            'samples_per_second': scheduler.response_count / duration,
+            'requests_per_second': adapter.request_count / duration,
+        }
+    return results
+
+
+class StandInServer:
+    batch_supported = True
+    response_time = SERVER_RESPONSE_TIME
+    request_count = 0
+    connection_count = 0
+    registered_location_list = None
+    http_server = None
+
+    def __init__(self, batch_supported=True, response_time=SERVER_RESPONSE_TIME):
+        self.batch_supported = batch_supported
+        self.response_time = response_time
+        self.registered_location_list = []
+        self.lock = threading.Lock()
+        self.http_server = ThreadingHTTPServer(('127.0.0.1', 0), self.create_handler())
+        self.http_server.daemon_threads = True
+
+    @property
+    def location(self):
+        return f'http://127.0.0.1:{self.http_server.server_port}'
+
+    def create_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connection_count = server.connection_count + 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                time.sleep(server.response_time)
+                with server.lock:
+                    server.request_count = server.request_count + 1
+                    if self.path.rstrip('/').endswith('batch') and not server.batch_supported:
+                        status_code = 404
+                    else:
+                        status_code = 200
+                        server.registered_location_list += [data['objectLocation'] for data in
+                                                            (body if isinstance(body, list) else [body])]
+                self.send_response(status_code)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+
+def benchmark_registration(app, duration):
+    app.ECCM_SECRET_HEADER = 'X-Benchmark-Secret'
+    app.ECCM_SECRET_VALUE = 'benchmark'
+    results = {}
+    for name, batch_registration, batch_supported in [('per_file', False, True),
+                                                      ('batched', True, True),
+                                                      ('batch_unsupported', True, False)]:
+        server = StandInServer(batch_supported)
+        server.start()
+        app.ECCM_SERVER_LOCATION = server.location
+        app.ECCM_OUTBOX_LOCATION = os.path.join(os.getcwd(), f'registration_{name}.sqlite')
+        app.ECCM_BATCH_REGISTRATION = batch_registration
+        manager = app.RegistrationManager()
+        for index in range(REGISTRATION_FILE_COUNT):
+            location = f'{app.S3_ROOT_DIRECTORY}/{app.CAR_IDENTIFIER}/{index:08d}.tsv'
+            manager.add(app.POST_TRIP_LOCATION, {'objectLocation': location, 'uploadDate': '2022-05-05T07:17:00'},
+                        location, random.randrange(1 << 24))
+        start_time = time.monotonic()
+        manager.start()
+        pending_count = REGISTRATION_FILE_COUNT
+        while pending_count > 0 and time.monotonic() - start_time < max(duration, 60):
+            time.sleep(0.01)
+            with manager.condition:
+                pending_count = manager.outbox.get_pending_count()
+        elapsed_time = time.monotonic() - start_time
+        manager.terminate()
+        server.stop()
+        results[name] = {
+            'file_count': REGISTRATION_FILE_COUNT,
+            'registered_file_count': len(set(server.registered_location_list)),
+            'seconds': elapsed_time,
+            'request_count': server.request_count,
+            'connection_count': server.connection_count,
+        }
+    return results
+
+
+def create_data_manager(app):
+    main_manager = app.MainManager()
+    main_manager.supported_command_list = list(app.MainManager.command_list)
+    main_manager.polling_scheduler = SimulatedScheduler(app, main_manager.supported_command_list)
+    data_manager = app.DataManager(main_manager)
+    data_manager.trip_id = data_manager.get_device_time_string()
+    data_manager.device_time_origin = time.time_ns() // 1000
+    data_manager.sample_time_origin = time.monotonic_ns()
+    data_manager.running = True
+    return data_manager
+
+
+def create_trip_writer(app, data_manager, file_format, stream):
+    if file_format == app.DELTA_FILE_FORMAT:
+        return app.trip_format.DeltaTripWriter(stream, data_manager.get_column_list(),
+                                               data_manager.get_column_type_list(),
+                                               data_manager.get_column_deadband_list(),
+                                               data_manager.get_column_resolution_list(),
+                                               data_manager.get_linked_column_list(),
+                                               max(1, round(app.RECORD_KEYFRAME_INTERVAL *
+                                                            app.RECORDING_SAMPLE_RATE)))
+    return app.trip_format.ColumnarTripWriter(stream, data_manager.get_column_list(),
+                                              data_manager.get_column_type_list(), app.MONITORING_FILE_CHUNK_ROWS)
+
+
+def benchmark_serialization(app, duration):
+    data_manager = create_data_manager(app)
+    period = int(1000000000 / app.RECORDING_SAMPLE_RATE)
+    results = {}
+    for file_format in [app.TEXT_FILE_FORMAT, app.COLUMNAR_FILE_FORMAT, app.DELTA_FILE_FORMAT]:
+        stream = io.BytesIO()
+        writer = create_trip_writer(app, data_manager, file_format, stream) \
+            if file_format != app.TEXT_FILE_FORMAT else None
+        sample_time = data_manager.sample_time_origin
+        row_count = 0
+        start_time = time.monotonic()
+        while time.monotonic() - start_time < duration:
+            for _ in range(100):
+                sample_time = sample_time + period
+                if writer is None:
+                    stream.write(data_manager.get_command_record(False, sample_time).encode('utf-8'))
+                else:
+                    writer.write_row(data_manager.get_command_values(sample_time))
+            row_count = row_count + 100
+        if writer is not None:
+            writer.close()
+        elapsed_time = time.monotonic() - start_time
+        results[file_format] = {
+            'rows_per_second': row_count / elapsed_time,
+            'bytes_per_row': len(stream.getvalue()) / row_count,
+        }
+    return results
+
+
+def configure_file_format(app, file_format, compression):
+    app.MONITORING_FILE_FORMAT = file_format
+    app.MONITORING_FILE_EXTENSION = '.tsv' if file_format == app.TEXT_FILE_FORMAT else '.eccm'
+    app.MONITORING_FILE_SEPARATION_CHARACTER = '\t'
+    app.MONITORING_FILE_COMPRESSION = compression
+    app.MONITORING_FILE_COMPRESSION_EXTENSION = app.trip_format.COMPRESSION_EXTENSION_DICT.get(compression, '')
+
+
+def create_records(app, data_manager, row_count):
+    period = int(1000000000 / app.RECORDING_SAMPLE_RATE)
+    sample_time = data_manager.sample_time_origin
+    record_list = []
+    for _ in range(row_count):
+        sample_time = sample_time + period
+        if app.MONITORING_FILE_FORMAT == app.TEXT_FILE_FORMAT:
+            record_list.append(data_manager.get_command_record(False, sample_time))
+        else:
+            record_list.append(data_manager.get_command_values(sample_time))
+    return record_list
+
+
+def start_timed_file_update_manager(app, data_manager, base_filename, latency_list):
+    q = app.RecordBuffer(app.RECORD_BUFFER_SIZE, app.OVERLOAD_POLICY_BLOCK)
+    put_time_deque = collections.deque()
+    file_update_manager = data_manager.create_file_update_manager(
+        base_filename, q, data_manager.get_column_list(), data_manager.get_column_type_list(),
+        data_manager.get_column_deadband_list(), data_manager.get_column_resolution_list(),
+        data_manager.get_linked_column_list())
+    write_records = file_update_manager.write_records
+
+    def write_timed_records(record_list):
+        write_records(record_list)
+        now = time.monotonic()
+        for _ in record_list:
+            latency_list.append(now - put_time_deque.popleft())
+
+    def put(record):
+        put_time_deque.append(time.monotonic())
+        q.put(record)
+
+    file_update_manager.write_records = write_timed_records
+    file_update_manager.start()
+    return file_update_manager, put
+
+
+def get_percentile(value_list, percentile):
+    if not value_list:
+        return None
+    value_list = sorted(value_list)
+    return value_list[min(len(value_list) - 1, int(len(value_list) * percentile / 100))]
+
+
+def benchmark_file_write(app, duration):
+    data_manager = create_data_manager(app)
+    case_list = [('text', app.TEXT_FILE_FORMAT, app.trip_format.NO_COMPRESSION),
+                 ('columnar', app.COLUMNAR_FILE_FORMAT, app.trip_format.NO_COMPRESSION),
+                 ('delta', app.DELTA_FILE_FORMAT, app.trip_format.NO_COMPRESSION),
+                 ('text_gzip', app.TEXT_FILE_FORMAT, app.trip_format.GZIP_COMPRESSION)]
+    if app.trip_format.zstandard is not None:
+        case_list.append(('delta_zstd', app.DELTA_FILE_FORMAT, app.trip_format.ZSTD_COMPRESSION))
+    record_list_dict = {}
+    results = {}
+    for name, file_format, compression in case_list:
+        configure_file_format(app, file_format, compression)
+        if file_format not in record_list_dict:
+            record_list_dict[file_format] = create_records(app, data_manager, FILE_WRITE_ROW_COUNT)
+        record_list = record_list_dict[file_format]
+        base_filename = os.path.join(app.RECORD_DIRECTORY_LOCATION, f'write_{name}')
+        file_update_manager, put = start_timed_file_update_manager(app, data_manager, base_filename, [])
+        start_time = time.monotonic()
+        for record in record_list:
+            put(record)
+        file_update_manager.terminate()
+        file_update_manager.join()
+        elapsed_time = time.monotonic() - start_time
+        size = sum(os.path.getsize(os.path.join(app.RECORD_DIRECTORY_LOCATION, filename))
+                   for filename in file_update_manager.get_filename_list())
+        latency_list = []
+        file_update_manager, put = start_timed_file_update_manager(app, data_manager, base_filename + '_paced',
+                                                                   latency_list)
+        next_time = time.monotonic()
+        for record in record_list[:int(min(duration, 5) * FILE_WRITE_PACED_RATE)]:
+            time.sleep(max(0.0, next_time - time.monotonic()))
+            put(record)
+            next_time = next_time + 1 / FILE_WRITE_PACED_RATE
+        file_update_manager.terminate()
+        file_update_manager.join()
+        results[name] = {
+            'rows_per_second': len(record_list) / elapsed_time,
+            'bytes_per_second': size / elapsed_time,
+            'bytes_per_row': size / len(record_list),
+            'queue_latency_p50_ms': get_percentile(latency_list, 50) * 1000,
+            'queue_latency_p99_ms': get_percentile(latency_list, 99) * 1000,
+            'queue_latency_max_ms': max(latency_list) * 1000,
+        }
+    configure_file_format(app, app.TEXT_FILE_FORMAT, app.trip_format.NO_COMPRESSION)
+    return results
+
+
+def override_header(filename, header):
+    with open(filename, 'r+') as f:
+        if not f.readline().rstrip('\r\n') == header.rstrip('\r\n'):
+            f.seek(0, 0)
+            content = f.read()
+            f.seek(0, 0)
+            f.write(header.rstrip('\r\n') + '\n' + content)
+
+
+def benchmark_header(app, duration):
+    data_manager = create_data_manager(app)
+    configure_file_format(app, app.TEXT_FILE_FORMAT, app.trip_format.NO_COMPRESSION)
+    header = data_manager.get_command_record(True)
+    record = data_manager.get_command_record(False, data_manager.sample_time_origin)
+    filename = os.path.join(app.RECORD_DIRECTORY_LOCATION, 'header.tsv')
+    results = {}
+    for size in HEADER_FILE_SIZE_LIST:
+        with open(filename, 'w') as file:
+            file.write(header + record * (size // len(record)))
+        start_time = time.monotonic()
+        override_header(filename, header)
+        check_time = time.monotonic() - start_time
+        with open(filename, 'w') as file:
+            file.write(record * (size // len(record)))
+        start_time = time.monotonic()
+        override_header(filename, header)
+        rewrite_time = time.monotonic() - start_time
+        file_update_manager = app.FileUpdateManager(os.path.join(app.RECORD_DIRECTORY_LOCATION, 'segment'),
+                                                    queue.Queue(), header)
+        start_time = time.monotonic()
+        file_update_manager.open_segment()
+        open_segment_time = time.monotonic() - start_time
+        file_update_manager.close_segment()
+        results[f'{size >> 20}MiB'] = {
+            'legacy_override_header_check_seconds': check_time,
+            'legacy_override_header_rewrite_seconds': rewrite_time,
+            'open_segment_seconds': open_segment_time,
+        }
+    os.remove(filename)
+    return results
+
+
+class S3StandInServer:
+    response_time = SERVER_RESPONSE_TIME
+    request_count = 0
+    received_size = 0
+    object_size_dict = None
+    upload_dict = None
+    http_server = None
+
+    def __init__(self, response_time=SERVER_RESPONSE_TIME):
+        self.response_time = response_time
+        self.object_size_dict = {}
+        self.upload_dict = {}
+        self.lock = threading.Lock()
+        self.http_server = ThreadingHTTPServer(('127.0.0.1', 0), self.create_handler())
+        self.http_server.daemon_threads = True
+
+    @property
+    def endpoint(self):
+        return f'127.0.0.1:{self.http_server.server_port}'
+
+    def create_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def read_body(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                time.sleep(server.response_time)
+                with server.lock:
+                    server.request_count = server.request_count + 1
+                    server.received_size = server.received_size + len(body)
+                return body
+
+            def send(self, status_code, body=b'', header_dict=None):
+                self.send_response(status_code)
+                for name, value in (header_dict or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_PUT(self):
+                body = self.read_body()
+                path = urlsplit(self.path)
+                query = parse_qs(path.query)
+                etag = f'"{uuid.uuid4().hex}"'
+                with server.lock:
+                    if 'uploadId' in query:
+                        server.upload_dict[query['uploadId'][0]][int(query['partNumber'][0])] = len(body)
+                    else:
+                        server.object_size_dict[path.path] = len(body)
+                self.send(200, header_dict={'ETag': etag})
+
+            def do_POST(self):
+                self.read_body()
+                path = urlsplit(self.path)
+                query = parse_qs(path.query, keep_blank_values=True)
+                key = path.path.split('/', 2)[-1]
+                if 'uploads' in query:
+                    upload_id = uuid.uuid4().hex
+                    with server.lock:
+                        server.upload_dict[upload_id] = {}
+                    body = f'<InitiateMultipartUploadResult><Bucket>{S3_BUCKET}</Bucket><Key>{key}</Key>' \
+                           f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>'
+                else:
+                    with server.lock:
+                        server.object_size_dict[path.path] = sum(server.upload_dict.pop(query['uploadId'][0])
+                                                                 .values())
+                    body = f'<CompleteMultipartUploadResult><Bucket>{S3_BUCKET}</Bucket><Key>{key}</Key>' \
+                           f'<ETag>"{uuid.uuid4().hex}"</ETag></CompleteMultipartUploadResult>'
+                self.send(200, body.encode(), {'Content-Type': 'application/xml'})
+
+            def do_DELETE(self):
+                self.read_body()
+                self.send(204)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+
+class SyncMainManager:
+    data_manager = None
+
+    @staticmethod
+    def register_uploaded_file(location, size=None, url=None):
+        pass
+
+    @staticmethod
+    def is_s3_server_reachable():
+        return True
+
+    @staticmethod
+    def lock_record_file(filename):
+        return True
+
+    @staticmethod
+    def unlock_record_file(filename):
+        pass
+
+
+def benchmark_upload(app, duration):
+    app.S3_SERVER_SECURE = False
+    app.S3_SERVER_AK = 'benchmark'
+    app.S3_SERVER_SK = 'benchmark'
+    app.S3_SERVER_REGION = 'us-east-1'
+    app.S3_SERVER_BUCKET = S3_BUCKET
+    app.S3_MULTIPART_PART_SIZE = 5 << 20
+    app.S3_MULTIPART_THRESHOLD = 8 << 20
+    upload_worker_count = app.S3_UPLOAD_WORKERS
+    record_directory_location = app.RECORD_DIRECTORY_LOCATION
+    app.RECORD_DIRECTORY_LOCATION = os.path.join(record_directory_location, 'upload')
+    os.makedirs(app.RECORD_DIRECTORY_LOCATION, exist_ok=True)
+    results = {}
+    for name, worker_count in [('sequential', 1), ('parallel', upload_worker_count)]:
+        server = S3StandInServer()
+        server.start()
+        app.S3_SERVER_ENDPOINT = server.endpoint
+        app.S3_UPLOAD_WORKERS = worker_count
+        for index in range(UPLOAD_FILE_COUNT):
+            with open(os.path.join(app.RECORD_DIRECTORY_LOCATION, f'upload_{index:04d}.tsv'), 'wb') as file:
+                file.write(os.urandom(UPLOAD_LARGE_FILE_SIZE if index == 0 else UPLOAD_FILE_SIZE))
+        size = UPLOAD_LARGE_FILE_SIZE + (UPLOAD_FILE_COUNT - 1) * UPLOAD_FILE_SIZE
+        start_time = time.monotonic()
+        failed_count = app.FileSyncManager(SyncMainManager()).sync_files()
+        elapsed_time = time.monotonic() - start_time
+        server.stop()
+        results[name] = {
+            'worker_count': worker_count,
+            'file_count': UPLOAD_FILE_COUNT,
+            'failed_file_count': failed_count,
+            'uploaded_object_count': len(server.object_size_dict),
+            'files_per_second': UPLOAD_FILE_COUNT / elapsed_time,
+            'bytes_per_second': size / elapsed_time,
+            'request_count': server.request_count,
+        }
+    app.S3_UPLOAD_WORKERS = upload_worker_count
+    app.RECORD_DIRECTORY_LOCATION = record_directory_location
+    return results
+
+
+def generate_route(name, duration, rng):
+    position_list = []
+    x, y, heading = 0.0, 0.0, 0.0
+    for index in range(int(duration * ROUTE_FIX_RATE)):
+        elapsed_time = index / ROUTE_FIX_RATE
+        if name == 'straight':
+            speed = 30
+        elif name == 'city':
+            speed = 0 if elapsed_time % 60 >= 45 else 12
+            if index % (20 * ROUTE_FIX_RATE) == 0:
+                heading = heading + rng.choice([-90, 90])
+        elif name == 'winding':
+            speed = 20
+            heading = 60 * math.sin(elapsed_time / 15)
+        else:
+            speed = 0
+        x = x + speed / ROUTE_FIX_RATE * math.sin(math.radians(heading))
+        y = y + speed / ROUTE_FIX_RATE * math.cos(math.radians(heading))
+        position_list.append((x + rng.gauss(0, ROUTE_NOISE), y + rng.gauss(0, ROUTE_NOISE)))
+    return position_list
+
+
+def to_fix(app, index, position):
+    return [1651735020000000 + index * 1000000 // ROUTE_FIX_RATE,
+            ROUTE_ORIGIN[0] + math.degrees(position[1] / app.EARTH_RADIUS),
+            ROUTE_ORIGIN[1] + math.degrees(position[0] / app.EARTH_RADIUS / math.cos(math.radians(ROUTE_ORIGIN[0]))),
+            35.0, 0.0, 0.0]
+
+
+def get_segment_distance(position, start, end):
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length = dx * dx + dy * dy
+    factor = min(1.0, max(0.0, ((position[0] - start[0]) * dx + (position[1] - start[1]) * dy) / length)) \
+        if length > 0 else 0.0
+    return math.hypot(position[0] - start[0] - factor * dx, position[1] - start[1] - factor * dy)
+
+
+def simplify_track(app, fix_list, tolerance, max_window):
+    simplifier = app.TrackSimplifier(tolerance, max_window)
+    kept_fix_list = [kept_fix for fix in fix_list for kept_fix in simplifier.add(fix)] + simplifier.flush()
+    index_dict = {fix[0]: index for index, fix in enumerate(fix_list)}
+    return [index_dict[fix[0]] for fix in kept_fix_list]
+
+
+def get_max_deviation(position_list, kept_index_list):
+    max_deviation = 0.0
+    for start_index, end_index in zip(kept_index_list, kept_index_list[1:]):
+        for index in range(start_index + 1, end_index):
+            max_deviation = max(max_deviation, get_segment_distance(position_list[index], position_list[start_index],
+                                                                    position_list[end_index]))
+    return max_deviation
+
+
+def benchmark_track_simplification(app, duration):
+    rng = random.Random(0)
+    results = {}
+    for name in ROUTE_NAME_LIST:
+        position_list = generate_route(name, max(duration, 1) * 60, rng)
+        fix_list = [to_fix(app, index, position) for index, position in enumerate(position_list)]
+        start_time = time.monotonic()
+        kept_index_list = simplify_track(app, fix_list, app.TRACK_SIMPLIFICATION_TOLERANCE,
+                                         app.TRACK_SIMPLIFICATION_MAX_WINDOW)
+        elapsed_time = time.monotonic() - start_time
+        max_deviation = get_max_deviation(position_list, kept_index_list)
+        results[name] = {
+            'point_count': len(fix_list),
+            'kept_point_count': len(kept_index_list),
+            'kept_ratio': len(kept_index_list) / len(fix_list),
+            'points_per_second': len(fix_list) / max(elapsed_time, 0.000001),
+            'tolerance': app.TRACK_SIMPLIFICATION_TOLERANCE,
+            'max_deviation': max_deviation,
+            'within_tolerance': kept_index_list[0] == 0 and kept_index_list[-1] == len(fix_list) - 1 and
+            max_deviation <= app.TRACK_SIMPLIFICATION_TOLERANCE + 0.01,
+        }
+    return results
+
+
+BENCHMARK_DICT = {
+    'batched_requests': benchmark_batched_requests,
+    'serialization': benchmark_serialization,
+    'file_write': benchmark_file_write,
+    'header': benchmark_header,
+    'upload': benchmark_upload,
+    'registration': benchmark_registration,
+    'track_simplification': benchmark_track_simplification,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the ECCM benchmarks without car, adapter or servers')
+    parser.add_argument('--duration', type=float, default=5, help='duration in seconds of each timed benchmark')
+    parser.add_argument('--output', help='location of the JSON result file')
+    parser.add_argument('benchmark', nargs='*', help=f'benchmarks to run among: {", ".join(BENCHMARK_DICT)}')
+    args = parser.parse_args()
+    for name in args.benchmark:
+        if name not in BENCHMARK_DICT:
+            parser.error(f'unknown benchmark: {name}')
+    output = os.path.abspath(args.output) if args.output is not None else None
+    with tempfile.TemporaryDirectory() as work_directory:
+        app = load_app(work_directory)
+        results = {}
+        for name in args.benchmark or BENCHMARK_DICT:
+            results[name] = BENCHMARK_DICT[name](app, args.duration)
+    report = json.dumps({'time': time.time(), 'results': results}, indent=2)
+    if output is not None:
+        with open(output, 'w') as file:
+            file.write(report)
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+
+FILE_COUNT = 95
+BATCH_SIZE = 10
+WORKER_COUNT = 2
+REGISTRATION_TIMEOUT = 30
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    current_directory = os.getcwd()
+    try:
+        return benchmark.load_app(str(tmp_path_factory.mktemp('app')))
+    finally:
+        os.chdir(current_directory)
+
+
+@pytest.fixture
+def server():
+    server = benchmark.StandInServer(response_time=0)
+    server.start()
+    yield server
+    server.stop()
+
+
+def register(app, monkeypatch, tmp_path, server, batch_registration):
+    monkeypatch.setattr(app, 'ECCM_SERVER_LOCATION', server.location)
+    monkeypatch.setattr(app, 'ECCM_SECRET_HEADER', 'X-Test-Secret')
+    monkeypatch.setattr(app, 'ECCM_SECRET_VALUE', 'test')
+    monkeypatch.setattr(app, 'ECCM_OUTBOX_LOCATION', str(tmp_path / 'outbox.sqlite'))
+    monkeypatch.setattr(app, 'ECCM_BATCH_REGISTRATION', batch_registration)
+    monkeypatch.setattr(app, 'ECCM_BATCH_SIZE', BATCH_SIZE)
+    monkeypatch.setattr(app, 'ECCM_REGISTRATION_WORKERS', WORKER_COUNT)
+    location_list = [f'{app.S3_ROOT_DIRECTORY}/{app.CAR_IDENTIFIER}/{index:08d}.tsv' for index in range(FILE_COUNT)]
+    manager = app.RegistrationManager()
+    for index, location in enumerate(location_list):
+        manager.add(app.POST_TRIP_LOCATION, {'objectLocation': location}, location, index)
+    manager.start()
+    try:
+        start_time = time.monotonic()
+        pending_count = len(location_list)
+        while pending_count > 0 and time.monotonic() - start_time < REGISTRATION_TIMEOUT:
+            time.sleep(0.01)
+            with manager.condition:
+                pending_count = manager.outbox.get_pending_count()
+        assert pending_count == 0
+    finally:
+        manager.terminate()
+    return location_list
+
+
+@pytest.mark.parametrize('batch_registration', [False, True])
+def test_registered_once(app, monkeypatch, tmp_path, server, batch_registration):
+    location_list = register(app, monkeypatch, tmp_path, server, batch_registration)
+    assert sorted(server.registered_location_list) == location_list
+
+
+def test_per_file_request_count(app, monkeypatch, tmp_path, server):
+    register(app, monkeypatch, tmp_path, server, False)
+    assert server.request_count == FILE_COUNT
+
+
+def test_batched_request_count(app, monkeypatch, tmp_path, server):
+    register(app, monkeypatch, tmp_path, server, True)
+    assert server.request_count == -(-FILE_COUNT // BATCH_SIZE)
+
+
+def test_batch_unsupported_fallback(app, monkeypatch, tmp_path, server):
+    server.batch_supported = False
+    location_list = register(app, monkeypatch, tmp_path, server, True)
+    assert sorted(server.registered_location_list) == location_list
+    assert FILE_COUNT < server.request_count <= FILE_COUNT + WORKER_COUNT
@@ -0,0 +1,64 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+
+ROUTE_DURATION = 600
+PROJECTION_ERROR = 0.01
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    current_directory = os.getcwd()
+    try:
+        return benchmark.load_app(str(tmp_path_factory.mktemp('app')))
+    finally:
+        os.chdir(current_directory)
+
+
+def generate_fix_list(app, name, seed=0):
+    position_list = benchmark.generate_route(name, ROUTE_DURATION, random.Random(seed))
+    return position_list, [benchmark.to_fix(app, index, position) for index, position in enumerate(position_list)]
+
+
+@pytest.mark.parametrize('name', benchmark.ROUTE_NAME_LIST)
+@pytest.mark.parametrize('tolerance', [1, 5, 20])
+def test_deviation_within_tolerance(app, name, tolerance):
+    position_list, fix_list = generate_fix_list(app, name)
+    kept_index_list = benchmark.simplify_track(app, fix_list, tolerance, 1000)
+    assert benchmark.get_max_deviation(position_list, kept_index_list) <= tolerance + PROJECTION_ERROR
+
+
+@pytest.mark.parametrize('name', benchmark.ROUTE_NAME_LIST)
+def test_endpoints_kept(app, name):
+    _, fix_list = generate_fix_list(app, name)
+    kept_index_list = benchmark.simplify_track(app, fix_list, 5, 1000)
+    assert kept_index_list[0] == 0
+    assert kept_index_list[-1] == len(fix_list) - 1
+    assert kept_index_list == sorted(set(kept_index_list))
+
+
+def test_straight_route_reduced(app):
+    _, fix_list = generate_fix_list(app, 'straight')
+    kept_index_list = benchmark.simplify_track(app, fix_list, 5, len(fix_list))
+    assert len(kept_index_list) < len(fix_list) / 100
+
+
+def test_max_window_bounds_gap(app):
+    _, fix_list = generate_fix_list(app, 'straight')
+    kept_index_list = benchmark.simplify_track(app, fix_list, 5, 50)
+    assert max(end - start for start, end in zip(kept_index_list, kept_index_list[1:])) <= 50
+
+
+def test_fix_without_position_skipped(app):
+    _, fix_list = generate_fix_list(app, 'winding')
+    fix_list[0][1] = None
+    fix_list[-1][2] = None
+    kept_index_list = benchmark.simplify_track(app, fix_list, 5, 1000)
+    assert kept_index_list[0] == 1
+    assert kept_index_list[-1] == len(fix_list) - 2
@@ -0,0 +1,735 @@
+import argparse
+import array
+import datetime
+import io
+import math
+import struct
+import sys
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DATETIME_FORMAT = "%Y%m%d%H%M%S%f"
+COLUMNAR_MAGIC = b'ECCMCOL1'
+DELTA_MAGIC = b'ECCMDLT2'
+BLOCK_MAGIC = b'BLCK'
+FLOAT_COLUMN = 'f'
+INTEGER_COLUMN = 'i'
+TIME_COLUMN = 't'
+TEXT_COLUMN = 's'
+DEFAULT_CHUNK_ROWS = 120
+MAX_CHUNK_ROWS = 0xFFFE
+TEXT_NULL_INDEX = 0xFFFF
+INTEGER_NULL = -2 ** 63
+NULL_TEXT = 'None'
+BLOCK_HEADER_STRUCT = struct.Struct('<4sII')
+KEYFRAME_RECORD = 0x4B
+KEYFRAME_MAGIC = b'SYNC'
+KEYFRAME_HEADER_STRUCT = struct.Struct('<B4sII')
+DELTA_RECORD = 0x44
+DEFAULT_RESOLUTION = 0.001
+DEFAULT_KEYFRAME_INTERVAL = 120
+NO_LINKED_COLUMN = -1
+NO_COMPRESSION = 'none'
+GZIP_COMPRESSION = 'gzip'
+ZSTD_COMPRESSION = 'zstd'
+COMPRESSION_EXTENSION_DICT = {GZIP_COMPRESSION: '.gz', ZSTD_COMPRESSION: '.zst'}
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+DEFAULT_ZSTD_LEVEL = 3
+FRAME_READ_SIZE = 65536
+MAX_RECORD_READ_SIZE = 1048576
+DECOMPRESSION_ERROR_TUPLE = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+SWAP_BYTES = sys.byteorder != 'little'
+
+
+def encode_float(value):
+    if value is None:
+        return math.nan
+    try:
+        return float(getattr(value, 'magnitude', value))
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def encode_integer(value):
+    if value is None:
+        return INTEGER_NULL
+    try:
+        return int(getattr(value, 'magnitude', value))
+    except (TypeError, ValueError, OverflowError):
+        return INTEGER_NULL
+
+
+def pack_array(typecode, value_list):
+    values = array.array(typecode, value_list)
+    if SWAP_BYTES:
+        values.byteswap()
+    return values.tobytes()
+
+
+def unpack_array(typecode, payload, offset, count):
+    values = array.array(typecode)
+    size = values.itemsize * count
+    values.frombytes(payload[offset:offset + size])
+    if SWAP_BYTES:
+        values.byteswap()
+    return values, offset + size
+
+
+def write_varint(buffer, value):
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, offset):
+    ret = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset = offset + 1
+        ret |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return ret, offset
+        shift = shift + 7
+
+
+def zigzag(value):
+    return value << 1 if value >= 0 else ((-value) << 1) - 1
+
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def encode_schema(column_list, type_list, magic=COLUMNAR_MAGIC):
+    ret = bytearray(magic)
+    ret += struct.pack('<H', len(column_list))
+    for column, column_type in zip(column_list, type_list):
+        name = str(column).encode('utf-8')
+        ret += struct.pack('<cH', column_type.encode('ascii'), len(name))
+        ret += name
+    return bytes(ret)
+
+
+def encode_column(column_type, value_list):
+    if column_type == FLOAT_COLUMN:
+        return pack_array('d', [encode_float(value) for value in value_list])
+    if column_type in (INTEGER_COLUMN, TIME_COLUMN):
+        return pack_array('q', [encode_integer(value) for value in value_list])
+    table = {}
+    index_list = []
+    for value in value_list:
+        if value is None:
+            index_list.append(TEXT_NULL_INDEX)
+            continue
+        index = table.get(value)
+        if index is None:
+            index = table[value] = len(table)
+        index_list.append(index)
+    ret = bytearray(struct.pack('<H', len(table)))
+    for value in table:
+        text = str(value).encode('utf-8')
+        ret += struct.pack('<I', len(text))
+        ret += text
+    ret += pack_array('H', index_list)
+    return bytes(ret)
+
+
+def decode_column(column_type, payload, offset, row_count):
+    if column_type == FLOAT_COLUMN:
+        values, offset = unpack_array('d', payload, offset, row_count)
+        return [None if math.isnan(value) else value for value in values], offset
+    if column_type in (INTEGER_COLUMN, TIME_COLUMN):
+        values, offset = unpack_array('q', payload, offset, row_count)
+        return [None if value == INTEGER_NULL else value for value in values], offset
+    (table_size,) = struct.unpack_from('<H', payload, offset)
+    offset += 2
+    table = []
+    for _ in range(table_size):
+        (length,) = struct.unpack_from('<I', payload, offset)
+        offset += 4
+        table.append(bytes(payload[offset:offset + length]).decode('utf-8'))
+        offset += length
+    index_list, offset = unpack_array('H', payload, offset, row_count)
+    return [None if index == TEXT_NULL_INDEX else table[index] for index in index_list], offset
+
+
+class ColumnarTripWriter:
+    stream = None
+    column_list = None
+    type_list = None
+    chunk_rows = DEFAULT_CHUNK_ROWS
+    pending_row_list = None
+
+    def __init__(self, stream, column_list, type_list, chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.stream = stream
+        self.column_list = list(column_list)
+        self.type_list = list(type_list)
+        self.chunk_rows = max(1, min(chunk_rows, MAX_CHUNK_ROWS))
+        self.pending_row_list = []
+        self.stream.write(encode_schema(self.column_list, self.type_list))
+
+    def write_row(self, row):
+        self.pending_row_list.append(row)
+        if len(self.pending_row_list) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.pending_row_list:
+            return
+        payload = bytearray()
+        for column_type, value_list in zip(self.type_list, zip(*self.pending_row_list)):
+            payload += encode_column(column_type, value_list)
+        self.stream.write(BLOCK_HEADER_STRUCT.pack(BLOCK_MAGIC, len(payload), len(self.pending_row_list)) + payload)
+        self.pending_row_list = []
+
+    def close(self):
+        self.flush()
+
+
+def read_schema(stream, magic):
+    if stream.read(len(magic)) != magic:
+        raise ValueError('UNEXPECTED TRIP FILE FORMAT')
+    (column_count,) = struct.unpack('<H', stream.read(2))
+    column_list = []
+    type_list = []
+    for _ in range(column_count):
+        column_type, length = struct.unpack('<cH', stream.read(3))
+        type_list.append(column_type.decode('ascii'))
+        column_list.append(stream.read(length).decode('utf-8'))
+    return column_list, type_list
+
+
+class ColumnarTripReader:
+    stream = None
+    column_list = None
+    type_list = None
+    valid_length = 0
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.column_list, self.type_list = read_schema(stream, COLUMNAR_MAGIC)
+        self.valid_length = stream.tell()
+
+    def iter_blocks(self):
+        while True:
+            header = self.stream.read(BLOCK_HEADER_STRUCT.size)
+            if len(header) < BLOCK_HEADER_STRUCT.size:
+                return
+            magic, length, row_count = BLOCK_HEADER_STRUCT.unpack(header)
+            if magic != BLOCK_MAGIC:
+                return
+            payload = self.stream.read(length)
+            if len(payload) < length:
+                return
+            offset = 0
+            column_value_list = []
+            try:
+                for column_type in self.type_list:
+                    value_list, offset = decode_column(column_type, payload, offset, row_count)
+                    column_value_list.append(value_list)
+            except (struct.error, UnicodeDecodeError, IndexError):
+                return
+            self.valid_length = self.stream.tell()
+            yield column_value_list
+
+    def __iter__(self):
+        for column_value_list in self.iter_blocks():
+            yield from zip(*column_value_list)
+
+
+class DeltaTripWriter:
+    stream = None
+    column_list = None
+    type_list = None
+    deadband_list = None
+    resolution_list = None
+    linked_column_list = None
+    keyframe_interval = DEFAULT_KEYFRAME_INTERVAL
+    last_value_list = None
+    last_delta_list = None
+    row_count = 0
+
+    def __init__(self, stream, column_list, type_list, deadband_list=None, resolution_list=None,
+                 linked_column_list=None, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        column_count = len(column_list)
+        self.stream = stream
+        self.column_list = list(column_list)
+        self.type_list = list(type_list)
+        self.deadband_list = list(deadband_list) if deadband_list is not None else [(0, 0)] * column_count
+        self.resolution_list = list(resolution_list) if resolution_list is not None \
+            else [DEFAULT_RESOLUTION] * column_count
+        self.linked_column_list = list(linked_column_list) if linked_column_list is not None \
+            else [NO_LINKED_COLUMN] * column_count
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.last_value_list = [None] * column_count
+        self.last_delta_list = [0] * column_count
+        self.stream.write(encode_schema(self.column_list, self.type_list, DELTA_MAGIC) +
+                          pack_array('d', self.resolution_list) + pack_array('h', self.linked_column_list))
+
+    def normalize_value(self, index, value):
+        column_type = self.type_list[index]
+        if column_type == FLOAT_COLUMN:
+            value = encode_float(value)
+            return None if math.isnan(value) else round(value / self.resolution_list[index])
+        if column_type in (INTEGER_COLUMN, TIME_COLUMN):
+            value = encode_integer(value)
+            return None if value == INTEGER_NULL else value
+        return None if value is None else str(value)
+
+    def is_changed(self, index, value):
+        last_value = self.last_value_list[index]
+        if value is None or last_value is None:
+            return value is not last_value
+        if self.type_list[index] == TEXT_COLUMN:
+            return value != last_value
+        absolute, relative = self.deadband_list[index]
+        if absolute <= 0 and relative <= 0:
+            return value != last_value
+        resolution = self.resolution_list[index] if self.type_list[index] == FLOAT_COLUMN else 1
+        return abs(value - last_value) * resolution > max(absolute, relative * abs(last_value * resolution))
+
+    def write_row(self, row):
+        value_list = [self.normalize_value(index, value) for index, value in enumerate(row)]
+        keyframe = self.row_count % self.keyframe_interval == 0
+        self.row_count = self.row_count + 1
+        buffer = bytearray()
+        if keyframe:
+            for index, value in enumerate(value_list):
+                self.encode_value(buffer, index, value, True)
+                self.update_last_value(index, value)
+            self.stream.write(KEYFRAME_HEADER_STRUCT.pack(KEYFRAME_RECORD, KEYFRAME_MAGIC, len(buffer),
+                                                          zlib.crc32(buffer)) + buffer)
+            return
+
+        changed_index_list = [index for index, value in enumerate(value_list)
+                              if self.linked_column_list[index] == NO_LINKED_COLUMN and self.is_changed(index, value)]
+        changed_index_set = set(changed_index_list)
+        changed_index_list += [index for index, value in enumerate(value_list)
+                               if self.linked_column_list[index] in changed_index_set and
+                               value != self.last_value_list[index]]
+        changed_index_list.sort()
+        buffer.append(DELTA_RECORD)
+        write_varint(buffer, len(changed_index_list))
+        previous_index = 0
+        for index in changed_index_list:
+            value = value_list[index]
+            write_varint(buffer, (index - previous_index) << 1 | (value is None))
+            if value is not None:
+                self.encode_value(buffer, index, value, False)
+            self.update_last_value(index, value)
+            previous_index = index
+        self.stream.write(buffer)
+
+    def encode_value(self, buffer, index, value, keyframe):
+        column_type = self.type_list[index]
+        if column_type == TEXT_COLUMN:
+            if keyframe and value is None:
+                write_varint(buffer, 0)
+                return
+            text = value.encode('utf-8')
+            write_varint(buffer, len(text) + 1 if keyframe else len(text))
+            buffer += text
+            return
+        if keyframe:
+            write_varint(buffer, 1 if value is None else zigzag(value) << 1)
+            return
+        last_value = self.last_value_list[index]
+        if column_type == FLOAT_COLUMN:
+            write_varint(buffer, zigzag(value - last_value) if last_value is not None else zigzag(value))
+        else:
+            predicted_value = last_value + self.last_delta_list[index] if last_value is not None else 0
+            write_varint(buffer, zigzag(value - predicted_value))
+
+    def update_last_value(self, index, value):
+        last_value = self.last_value_list[index]
+        self.last_delta_list[index] = value - last_value if value is not None and last_value is not None and \
+            self.type_list[index] != TEXT_COLUMN else 0
+        self.last_value_list[index] = value
+
+    def close(self):
+        pass
+
+
+class DeltaTripReader:
+    stream = None
+    column_list = None
+    type_list = None
+    resolution_list = None
+    linked_column_list = None
+    data = b''
+    data_offset = 0
+    end_of_stream = False
+    valid_length = 0
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.column_list, self.type_list = read_schema(stream, DELTA_MAGIC)
+        column_count = len(self.column_list)
+        header = stream.read(10 * column_count)
+        if len(header) < 10 * column_count:
+            raise ValueError('TRUNCATED TRIP FILE SCHEMA')
+        self.resolution_list = unpack_array('d', header, 0, column_count)[0].tolist()
+        self.linked_column_list = unpack_array('h', header, 8 * column_count, column_count)[0].tolist()
+        self.data_offset = stream.tell()
+        self.valid_length = self.data_offset
+
+    def fill(self, offset, size):
+        available = len(self.data) - offset
+        if available >= size or self.end_of_stream:
+            return offset
+        chunk_list = [self.data[offset:]]
+        while available < 2 * size:
+            chunk = self.stream.read(max(2 * size - available, FRAME_READ_SIZE))
+            if not chunk:
+                self.end_of_stream = True
+                break
+            chunk_list.append(chunk)
+            available = available + len(chunk)
+        self.data = b''.join(chunk_list)
+        self.data_offset = self.data_offset + offset
+        return 0
+
+    def decode_value(self, index, value):
+        if value is None or self.type_list[index] != FLOAT_COLUMN:
+            return value
+        resolution = self.resolution_list[index]
+        return round(value * resolution, max(0, -math.floor(math.log10(resolution))))
+
+    def read_value(self, index, offset, keyframe, last_value, last_delta):
+        column_type = self.type_list[index]
+        if column_type == TEXT_COLUMN:
+            length, offset = read_varint(self.data, offset)
+            if keyframe:
+                if length == 0:
+                    return None, offset
+                length = length - 1
+            end = offset + length
+            if end > len(self.data):
+                raise IndexError('TRUNCATED TEXT VALUE')
+            return bytes(self.data[offset:end]).decode('utf-8'), end
+        encoded_value, offset = read_varint(self.data, offset)
+        if keyframe:
+            return (None if encoded_value & 1 else unzigzag(encoded_value >> 1)), offset
+        if column_type == FLOAT_COLUMN:
+            return unzigzag(encoded_value) + (last_value if last_value is not None else 0), offset
+        predicted_value = last_value + last_delta if last_value is not None else 0
+        return unzigzag(encoded_value) + predicted_value, offset
+
+    def read_keyframe(self, offset):
+        if offset + KEYFRAME_HEADER_STRUCT.size > len(self.data):
+            return None, offset
+        _, magic, length, checksum = KEYFRAME_HEADER_STRUCT.unpack_from(self.data, offset)
+        start = offset + KEYFRAME_HEADER_STRUCT.size
+        end = start + length
+        if magic != KEYFRAME_MAGIC or end > len(self.data) or zlib.crc32(self.data[start:end]) != checksum:
+            return None, offset
+        update_list = []
+        offset = start
+        for index in range(len(self.column_list)):
+            value, offset = self.read_value(index, offset, True, None, 0)
+            update_list.append((index, value))
+        if offset != end:
+            return None, offset
+        return update_list, offset
+
+    def read_delta(self, offset, value_list, delta_list):
+        column_count = len(self.column_list)
+        change_count, offset = read_varint(self.data, offset + 1)
+        update_list = []
+        index = 0
+        for _ in range(change_count):
+            encoded_index, offset = read_varint(self.data, offset)
+            index = index + (encoded_index >> 1)
+            if index >= column_count:
+                return None, offset
+            if encoded_index & 1:
+                update_list.append((index, None))
+            else:
+                value, offset = self.read_value(index, offset, False, value_list[index], delta_list[index])
+                update_list.append((index, value))
+        return update_list, offset
+
+    def find_keyframe(self, offset):
+        marker = bytes((KEYFRAME_RECORD,)) + KEYFRAME_MAGIC
+        while True:
+            position = self.data.find(marker, offset)
+            if position >= 0 or self.end_of_stream:
+                return position
+            offset = self.fill(max(offset, len(self.data) - len(marker) + 1), FRAME_READ_SIZE)
+
+    def __iter__(self):
+        column_count = len(self.column_list)
+        value_list = [None] * column_count
+        delta_list = [0] * column_count
+        offset = 0
+        read_size = FRAME_READ_SIZE
+        while True:
+            offset = self.fill(offset, read_size)
+            if offset >= len(self.data):
+                return
+            record_type = self.data[offset]
+            try:
+                if record_type == KEYFRAME_RECORD:
+                    update_list, next_offset = self.read_keyframe(offset)
+                elif record_type == DELTA_RECORD:
+                    update_list, next_offset = self.read_delta(offset, value_list, delta_list)
+                else:
+                    update_list = None
+            except (IndexError, UnicodeDecodeError):
+                update_list = None
+            if update_list is None:
+                if not self.end_of_stream and read_size < MAX_RECORD_READ_SIZE:
+                    read_size = read_size * 2
+                    continue
+                read_size = FRAME_READ_SIZE
+                offset = self.find_keyframe(offset + 1)
+                if offset < 0:
+                    return
+                continue
+            read_size = FRAME_READ_SIZE
+            offset = next_offset
+            for index, value in update_list:
+                last_value = value_list[index]
+                delta_list[index] = value - last_value if value is not None and last_value is not None and \
+                    self.type_list[index] != TEXT_COLUMN else 0
+                value_list[index] = value
+            self.valid_length = self.data_offset + offset
+            yield tuple(self.decode_value(index, value) for index, value in enumerate(value_list))
+
+
+def peek_stream(stream, size):
+    if hasattr(stream, 'peek'):
+        return stream.peek(size)[:size]
+    data = stream.read(size)
+    stream.seek(-len(data), 1)
+    return data
+
+
+def open_trip_reader(stream):
+    if peek_stream(stream, len(DELTA_MAGIC)) == DELTA_MAGIC:
+        return DeltaTripReader(stream)
+    return ColumnarTripReader(stream)
+
+
+def find_valid_length(stream):
+    reader = open_trip_reader(stream)
+    if isinstance(reader, DeltaTripReader):
+        for _ in reader:
+            pass
+        return reader.valid_length
+    valid_length = stream.tell()
+    size = stream.seek(0, 2)
+    while valid_length + BLOCK_HEADER_STRUCT.size <= size:
+        stream.seek(valid_length)
+        magic, length, _ = BLOCK_HEADER_STRUCT.unpack(stream.read(BLOCK_HEADER_STRUCT.size))
+        if magic != BLOCK_MAGIC or valid_length + BLOCK_HEADER_STRUCT.size + length > size:
+            break
+        valid_length = valid_length + BLOCK_HEADER_STRUCT.size + length
+    return valid_length
+
+
+def aggregate_rows(row_iterable, type_list, period):
+    bucket_size = max(1, int(period * 1000000))
+    bucket = None
+    row_list = []
+    for row in row_iterable:
+        row_bucket = row[0] // bucket_size if row[0] is not None else bucket
+        if row_list and row_bucket != bucket:
+            yield aggregate_row(row_list, type_list)
+            row_list = []
+        bucket = row_bucket
+        row_list.append(row)
+    if row_list:
+        yield aggregate_row(row_list, type_list)
+
+
+def aggregate_row(row_list, type_list):
+    ret = list(row_list[-1])
+    ret[0] = row_list[0][0]
+    for index, column_type in enumerate(type_list):
+        if column_type == FLOAT_COLUMN:
+            value_list = [row[index] for row in row_list if row[index] is not None]
+            ret[index] = sum(value_list) / len(value_list) if value_list else None
+    return ret
+
+
+def format_text_value(column_type, value):
+    if value is None:
+        return NULL_TEXT
+    if column_type == TIME_COLUMN:
+        seconds, microseconds = divmod(value, 1000000)
+        return datetime.datetime.fromtimestamp(seconds).replace(microsecond=microseconds).strftime(DATETIME_FORMAT)
+    return str(value)
+
+
+class CompressedFrameWriter:
+    stream = None
+    compression = None
+    level = None
+    compressor = None
+    frame_size = 0
+    block_size = 0
+
+    def __init__(self, stream, compression, level=None, block_size=0):
+        if compression == ZSTD_COMPRESSION and zstandard is None:
+            raise ValueError('ZSTANDARD PACKAGE NOT INSTALLED')
+        self.stream = stream
+        self.compression = compression
+        self.level = level
+        self.block_size = block_size
+
+    def create_compressor(self):
+        if self.compression == ZSTD_COMPRESSION:
+            return zstandard.ZstdCompressor(level=self.level if self.level is not None else DEFAULT_ZSTD_LEVEL) \
+                .compressobj()
+        return zlib.compressobj(self.level if self.level is not None else zlib.Z_DEFAULT_COMPRESSION,
+                                zlib.DEFLATED, 31)
+
+    def write(self, data):
+        if not data:
+            return
+        if self.compressor is None:
+            self.compressor = self.create_compressor()
+        self.stream.write(self.compressor.compress(data))
+        self.frame_size = self.frame_size + len(data)
+        if 0 < self.block_size <= self.frame_size:
+            self.end_frame()
+
+    def end_frame(self):
+        if self.compressor is None:
+            return
+        self.stream.write(self.compressor.flush())
+        self.compressor = None
+        self.frame_size = 0
+
+    def flush(self):
+        self.end_frame()
+        self.stream.flush()
+
+    def tell(self):
+        return self.stream.tell()
+
+    def fileno(self):
+        return self.stream.fileno()
+
+    def close(self):
+        self.end_frame()
+        self.stream.close()
+
+
+def is_compressed(data):
+    return data.startswith(GZIP_MAGIC) or data.startswith(ZSTD_MAGIC)
+
+
+def create_decompressor(data):
+    if data.startswith(GZIP_MAGIC):
+        return zlib.decompressobj(31)
+    if data.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError('ZSTANDARD PACKAGE NOT INSTALLED')
+        return zstandard.ZstdDecompressor().decompressobj()
+    return None
+
+
+def iter_frames(stream, read_size=FRAME_READ_SIZE):
+    position = 0
+    data = b''
+    while True:
+        while len(data) < len(ZSTD_MAGIC):
+            chunk = stream.read(read_size)
+            if not chunk:
+                break
+            data = data + chunk
+        decompressor = create_decompressor(data)
+        if decompressor is None:
+            return
+        content_list = []
+        try:
+            while True:
+                content_list.append(decompressor.decompress(data))
+                if decompressor.eof:
+                    break
+                position = position + len(data)
+                data = stream.read(read_size)
+                if not data:
+                    return
+        except DECOMPRESSION_ERROR_TUPLE:
+            return
+        unused_data = decompressor.unused_data
+        position = position + len(data) - len(unused_data)
+        data = unused_data
+        yield b''.join(content_list), position
+
+
+class FrameReader(io.RawIOBase):
+    frame_iterator = None
+    content = b''
+    content_offset = 0
+    position = 0
+
+    def __init__(self, stream):
+        super().__init__()
+        self.frame_iterator = iter_frames(stream)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.content_offset >= len(self.content):
+            frame = next(self.frame_iterator, None)
+            if frame is None:
+                return 0
+            self.content = frame[0]
+            self.content_offset = 0
+        size = min(len(buffer), len(self.content) - self.content_offset)
+        buffer[:size] = self.content[self.content_offset:self.content_offset + size]
+        self.content_offset = self.content_offset + size
+        self.position = self.position + size
+        return size
+
+    def tell(self):
+        return self.position
+
+
+def open_frame_stream(stream):
+    if is_compressed(peek_stream(stream, len(ZSTD_MAGIC))):
+        return io.BufferedReader(FrameReader(stream), FRAME_READ_SIZE)
+    return stream
+
+
+def convert_to_text(source_path, target_path, separator='\t'):
+    row_count = 0
+    with open(source_path, 'rb') as source, open(target_path, 'w') as target:
+        reader = open_trip_reader(open_frame_stream(source))
+        target.write(separator.join(reader.column_list) + '\n')
+        for row in reader:
+            target.write(separator.join(format_text_value(column_type, value)
+                                        for column_type, value in zip(reader.type_list, row)) + '\n')
+            row_count = row_count + 1
+    return row_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert an ECCM columnar or delta trip file to delimited text')
+    parser.add_argument('source')
+    parser.add_argument('target', nargs='?')
+    parser.add_argument('--separator', default='\t')
+    args = parser.parse_args()
+    source = args.source
+    for extension in COMPRESSION_EXTENSION_DICT.values():
+        if source.endswith(extension):
+            source = source[:-len(extension)]
+    target = args.target if args.target is not None else source.rsplit('.', 1)[0] + '.tsv'
+    row_count = convert_to_text(args.source, target, args.separator)
+    print(f'{row_count} ROWS WRITTEN TO {target}')
+
+
+if __name__ == '__main__':
+    main()